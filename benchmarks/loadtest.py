@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import yaml
+from tornado.httpclient import AsyncHTTPClient
+
+from core.ratelimit import DEFAULT_RATE_LIMITS
+
+# Load test for the public side of the site. For each requested number of stations, this creates a temporary database
+# filled with that many synthetic stations (using tools/generate_dataset.py), starts the Youth Map server against it,
+# then runs a number of simulated clients against it for a while, each repeatedly loading the main map, viewing a random
+# station, or submitting a new one. Throughput, latency, response size and the server's peak memory use are reported as
+# JSON, and can be compared against a previous run to spot regressions. Run from the repository root, e.g.:
+#     python -m benchmarks.loadtest --stations 1000,10000 --output results.json
+#     python -m benchmarks.loadtest --stations 1000,10000 --baseline results.json
+
+# The root directory of the repository
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_STATION_COUNTS = [1000, 10000, 100000]
+DEFAULT_CONCURRENCY = 20
+DEFAULT_DURATION_SECONDS = 20
+DEFAULT_WARMUP_SECONDS = 2
+# How much worse than the baseline a result can be (as a proportion) before it counts as a regression
+DEFAULT_TOLERANCE = 0.2
+# How long to wait for the server to start up, including building its database, in seconds
+STARTUP_TIMEOUT_SECONDS = 300
+# The mix of things each simulated client does, as relative weights. Most traffic is people following links to
+# individual stations, with a smaller number loading the whole map and a few submitting stations.
+SCENARIO_WEIGHTS = {"map": 2, "view_station": 7, "submit": 1}
+
+
+def get_free_port():
+    """Get a TCP port that nothing is currently listening on"""
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_config(work_dir, port):
+    """Write a config file for a server using a database and upload directory inside the working directory, and return
+    its path. Rate limits are turned off, as all the simulated visitors come from the same address."""
+
+    upload_dir = os.path.join(work_dir, "upload")
+    shutil.copytree(os.path.join(REPO_DIR, "data", "upload"), upload_dir)
+    config = {"mode": "production", "http-port": port, "database-dir": os.path.join(work_dir, "data"),
+              "upload-dir": upload_dir, "asset-dir": os.path.join(work_dir, "assets"), "workers": 1,
+              "server-timing": "off",
+              "rate-limits": {rule: {"per-minute": 0} for rule in DEFAULT_RATE_LIMITS}}
+    config_path = os.path.join(work_dir, "config.yml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+def get_peak_rss_bytes(pid):
+    """Get the peak resident memory size of a process so far, or None if it can't be found (e.g. not on Linux)"""
+
+    try:
+        with open("/proc/" + str(pid) + "/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values, p):
+    """Get the pth percentile of a sorted list, using the nearest-rank method"""
+
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))]
+
+
+class ScenarioResults:
+    """Latencies, status codes and response sizes recorded for one scenario"""
+
+    def __init__(self):
+        self.latencies = []
+        self.sizes = []
+        self.errors = 0
+        self.status_codes = {}
+
+    def record(self, latency, code, size):
+        self.latencies.append(latency)
+        self.sizes.append(size)
+        self.status_codes[str(code)] = self.status_codes.get(str(code), 0) + 1
+        if code >= 400 or code == 599:
+            self.errors += 1
+
+    def summary(self, duration):
+        latencies_ms = sorted(latency * 1000 for latency in self.latencies)
+        return {
+            "requests": len(latencies_ms),
+            "errors": self.errors,
+            "status_codes": self.status_codes,
+            "throughput_rps": round(len(latencies_ms) / duration, 2),
+            "latency_ms": {
+                "mean": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else None,
+                "p50": round(percentile(latencies_ms, 50), 2) if latencies_ms else None,
+                "p95": round(percentile(latencies_ms, 95), 2) if latencies_ms else None,
+                "p99": round(percentile(latencies_ms, 99), 2) if latencies_ms else None
+            },
+            "mean_response_bytes": round(sum(self.sizes) / len(self.sizes)) if self.sizes else None
+        }
+
+
+class LoadTest:
+    """Runs simulated clients against a server"""
+
+    def __init__(self, base_url, station_counts, concurrency, rng):
+        self.base_url = base_url
+        self.station_counts = station_counts
+        self.rng = rng
+        self.client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+        self.concurrency = concurrency
+
+    async def run(self, duration):
+        """Run the clients for the given number of seconds, and return a dict of scenario name to ScenarioResults"""
+
+        results = {name: ScenarioResults() for name in SCENARIO_WEIGHTS}
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*[self.run_client(results, deadline) for _ in range(self.concurrency)])
+        return results
+
+    async def run_client(self, results, deadline):
+        names = list(SCENARIO_WEIGHTS.keys())
+        weights = list(SCENARIO_WEIGHTS.values())
+        while time.monotonic() < deadline:
+            scenario = self.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            code, size = await getattr(self, scenario)()
+            results[scenario].record(time.perf_counter() - start, code, size)
+
+    async def fetch(self, path, **kwargs):
+        """Make a request to the server. Returns a tuple of the response's status code and body size."""
+
+        response = await self.client.fetch(self.base_url + path, raise_error=False, follow_redirects=False,
+                                           request_timeout=120, **kwargs)
+        return response.code, len(response.body) if response.body else 0
+
+    async def map(self):
+        return await self.fetch("/")
+
+    async def view_station(self):
+        total = self.station_counts["temporary"] + self.station_counts["permanent"]
+        n = self.rng.randint(1, total)
+        if n <= self.station_counts["temporary"]:
+            return await self.fetch("/view/station/temp/" + str(n))
+        return await self.fetch("/view/station/perm/" + str(n - self.station_counts["temporary"]))
+
+    async def submit(self):
+        """Load the form for a new temporary station, then submit it. The time and size reported are for both."""
+
+        lat = round(self.rng.uniform(50, 58), 5)
+        lon = round(self.rng.uniform(-5, 1.5), 5)
+        form_code, form_size = await self.fetch("/create/station/temp?" + urlencode({"lat": lat, "lon": lon}))
+        if form_code != 200:
+            return form_code, form_size
+        now = datetime.now()
+        body = urlencode({"action": "Create", "callsign": "M" + str(self.rng.randint(0, 9999)) + "NEW",
+                          "club_name": "Load test", "start_time": now.strftime("%Y-%m-%dT%H:%M"),
+                          "end_time": (now + timedelta(hours=4)).strftime("%Y-%m-%dT%H:%M"),
+                          "latitude_degrees": lat, "longitude_degrees": lon, "bands[]": "1"})
+        code, size = await self.fetch("/create/station/temp", method="POST", body=body)
+        return code, form_size + size
+
+
+def start_server(work_dir, config_path, port):
+    """Start the server, and wait until it is accepting connections"""
+
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    env = dict(os.environ, YOUTHMAP_CONFIG=config_path)
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "youthmap.py")], cwd=REPO_DIR, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited on startup, see " + log.name)
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Server did not start up in time, see " + log.name)
+
+
+def run_for_station_count(station_count, args):
+    """Run the whole load test for one number of stations, and return the results"""
+
+    work_dir = tempfile.mkdtemp(prefix="youthmap-loadtest-")
+    try:
+        port = get_free_port()
+        config_path = write_config(work_dir, port)
+
+        print("Creating database with " + str(station_count) + " stations...", file=sys.stderr)
+        env = dict(os.environ, YOUTHMAP_CONFIG=config_path)
+        generated = subprocess.run([sys.executable, "-m", "tools.generate_dataset", "--stations", str(station_count),
+                                    "--seed", str(args.seed), "--json"], cwd=REPO_DIR, env=env, check=True,
+                                   capture_output=True, text=True)
+        counts = json.loads(generated.stdout.strip().splitlines()[-1])
+        station_counts = {"temporary": counts["temporary_stations"], "permanent": counts["permanent_stations"]}
+
+        print("Starting server...", file=sys.stderr)
+        process = start_server(work_dir, config_path, port)
+        try:
+            load_test = LoadTest("http://127.0.0.1:" + str(port), station_counts, args.concurrency,
+                                 random.Random(args.seed))
+            print("Warming up...", file=sys.stderr)
+            asyncio.run(load_test.run(args.warmup))
+            print("Running for " + str(args.duration) + " seconds with " + str(args.concurrency) + " clients...",
+                  file=sys.stderr)
+            results = asyncio.run(load_test.run(args.duration))
+            peak_rss = get_peak_rss_bytes(process.pid)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+        return {"stations": station_count,
+                "concurrency": args.concurrency,
+                "duration_seconds": args.duration,
+                "peak_rss_bytes": peak_rss,
+                "scenarios": {name: r.summary(args.duration) for name, r in results.items()}}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """Compare results against a baseline from a previous run, and return a list of descriptions of the regressions"""
+
+    regressions = []
+    baseline_by_count = {run["stations"]: run for run in baseline["runs"]}
+    for run in results["runs"]:
+        old_run = baseline_by_count.get(run["stations"])
+        if not old_run:
+            continue
+        prefix = str(run["stations"]) + " stations: "
+        if run["peak_rss_bytes"] and old_run["peak_rss_bytes"] \
+                and run["peak_rss_bytes"] > old_run["peak_rss_bytes"] * (1 + tolerance):
+            regressions.append(prefix + "peak RSS " + str(old_run["peak_rss_bytes"]) + " -> "
+                               + str(run["peak_rss_bytes"]) + " bytes")
+        for name, scenario in run["scenarios"].items():
+            old = old_run["scenarios"].get(name)
+            if not old or not scenario["requests"] or not old["requests"]:
+                continue
+            if scenario["latency_ms"]["p95"] > old["latency_ms"]["p95"] * (1 + tolerance):
+                regressions.append(prefix + name + " p95 latency " + str(old["latency_ms"]["p95"]) + " -> "
+                                   + str(scenario["latency_ms"]["p95"]) + " ms")
+            if scenario["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+                regressions.append(prefix + name + " throughput " + str(old["throughput_rps"]) + " -> "
+                                   + str(scenario["throughput_rps"]) + " requests/s")
+            if scenario["errors"] / scenario["requests"] > old["errors"] / old["requests"]:
+                regressions.append(prefix + name + " error rate " + str(old["errors"]) + "/" + str(old["requests"])
+                                   + " -> " + str(scenario["errors"]) + "/" + str(scenario["requests"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Youth Map public pages")
+    parser.add_argument("--stations", default=",".join(str(n) for n in DEFAULT_STATION_COUNTS),
+                        help="comma-separated numbers of stations to test with")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="number of simulated clients")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS,
+                        help="how long to run each test for, in seconds")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP_SECONDS,
+                        help="how long to run clients for before starting to measure, in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", help="file to write the results to as JSON, as well as printing them")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="how much worse than the baseline a result can be before it is a regression, "
+                             "e.g. 0.2 for 20%%")
+    args = parser.parse_args()
+
+    results = {"timestamp": datetime.now().isoformat(timespec="seconds"),
+               "runs": [run_for_station_count(int(n), args) for n in args.stations.split(",")]}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against " + args.baseline, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
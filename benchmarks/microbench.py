@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.loadtest import REPO_DIR, write_config
+
+# Micro-benchmarks for the database operations and the utility functions used when rendering pages. For each requested
+# number of stations, this creates a temporary database filled with that much synthetic data (using
+# tools/generate_dataset.py), then times each function, and measures the memory it allocates, over repeated calls.
+# Results are reported as JSON, and can be compared against a previous run to spot regressions. Run from the repository
+# root, e.g.:
+#     python -m benchmarks.microbench --stations 1000,10000 --output results.json
+#     python -m benchmarks.microbench --stations 1000,10000 --baseline results.json
+
+DEFAULT_STATION_COUNTS = [1000, 10000]
+# Each benchmark is repeated until it has taken at least this long in total, with at least MIN_ITERATIONS and at most
+# MAX_ITERATIONS calls
+MIN_TIME_SECONDS = 0.5
+MIN_ITERATIONS = 3
+MAX_ITERATIONS = 2000
+# Number of calls that memory allocation is measured over. This is done separately from timing, as tracing allocations
+# slows everything down.
+ALLOCATION_ITERATIONS = 3
+# How much worse than the baseline a result can be (as a proportion) before it counts as a regression. This is more
+# lenient than the load test, as very short timings are noisy.
+DEFAULT_TOLERANCE = 0.25
+# Number of stations approved or rejected at once by the moderation queue benchmarks
+MODERATION_BATCH_SIZE = 10
+# Number of stations created at once by the station write queue benchmark
+STATION_WRITE_BATCH_SIZE = 10
+
+
+class Benchmark:
+    """A function to benchmark. If a setup function is given, it is called before every call of the function (but not
+    timed), and its result is passed to the function as arguments; this is used for things like deleting a row, which
+    needs a new row to delete each time. The function may be a coroutine function."""
+
+    def __init__(self, name, func, setup=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+
+    async def call(self):
+        """Call the function once, returning how long it took in seconds"""
+
+        args = self.setup() if self.setup else ()
+        start = time.perf_counter()
+        result = self.func(*args)
+        if inspect.isawaitable(result):
+            await result
+        return time.perf_counter() - start
+
+    async def run(self):
+        """Run the benchmark, and return a summary of timings in microseconds and allocations in bytes per call"""
+
+        timings = []
+        while len(timings) < MAX_ITERATIONS and (len(timings) < MIN_ITERATIONS or sum(timings) < MIN_TIME_SECONDS):
+            timings.append(await self.call())
+
+        # Peak is the most memory in use at any point during the call, beyond what was in use before it. Retained is
+        # what was still in use afterwards, e.g. a result that's been cached.
+        peaks = []
+        retained = []
+        tracemalloc.start()
+        try:
+            for _ in range(ALLOCATION_ITERATIONS):
+                args = self.setup() if self.setup else ()
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                result = self.func(*args)
+                if inspect.isawaitable(result):
+                    await result
+                del result
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(current - before)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "iterations": len(timings),
+            "mean_us": round(statistics.mean(timings) * 1000000, 2),
+            "median_us": round(statistics.median(timings) * 1000000, 2),
+            "min_us": round(min(timings) * 1000000, 2),
+            "peak_alloc_bytes": round(statistics.mean(peaks)),
+            "retained_bytes": round(statistics.mean(retained))
+        }
+
+
+def get_benchmarks(db, rng):
+    """Get the list of benchmarks to run against a database that has been filled with synthetic data. Benchmarks that
+    delete large amounts of data come last, so that the others see the whole dataset."""
+
+    from sqlalchemy import select
+
+    from core.utils import humanize_start_end, populate_derived_fields_perm_station, \
+        populate_derived_fields_temp_station, serialize_everything
+    from database.models import User, Event, TemporaryStation, PermanentStation, PermanentStationType
+    from database.utils import hash_password, generate_password
+
+    session = db.SessionLocal()
+    try:
+        user_ids = session.scalars(select(User.id)).all()
+        event_ids = session.scalars(select(Event.id)).all()
+        temporary_ids = session.scalars(select(TemporaryStation.id)).all()
+        permanent_ids = session.scalars(select(PermanentStation.id)).all()
+        type_ids = session.scalars(select(PermanentStationType.id)).all()
+    finally:
+        session.close()
+
+    now = datetime.now()
+    counter = iter(range(1, 1000000000))
+    session_token = db.create_user_session(user_ids[0])
+    temporary_station = db.get_temporary_station(temporary_ids[0])
+    permanent_station = db.get_permanent_station(permanent_ids[0])
+    populate_derived_fields_temp_station(temporary_station)
+
+    def add_user():
+        return db.add_user_with_password_hash("bench" + str(next(counter)), "hash", "salt", None, False)
+
+    def clear_session_cache():
+        db.session_cache.clear()
+        return ()
+
+    def add_event():
+        return db.add_event("Bench event " + str(next(counter)), now, now + timedelta(days=2), "YOTA.png", "#ff0000",
+                            "", [1, 2], [1])
+
+    def add_temporary_station():
+        return db.add_temporary_station("M0BEN", "Bench club", now, now + timedelta(hours=4), 52.5, -1.5,
+                                        "Notes", [1, 2], [1], event_id=rng.choice(event_ids))
+
+    def new_temporary_station_fields():
+        return {"callsign": "M0BEN", "club_name": "Bench club", "start_time": now, "end_time": now + timedelta(hours=4),
+                "latitude_degrees": 52.5, "longitude_degrees": -1.5, "notes": "Notes", "band_ids": [1, 2],
+                "mode_ids": [1], "event_id": rng.choice(event_ids)}
+
+    def add_permanent_station():
+        return db.add_permanent_station("G0BEN", "Bench club", 52.5, -1.5, "Tuesdays", "Club hut", "Notes",
+                                        type_id=rng.choice(type_ids))
+
+    def mark_unapproved(model, ids):
+        # Much quicker than adding new stations to approve each time
+        batch = rng.sample(ids, MODERATION_BATCH_SIZE)
+        session = db.SessionLocal()
+        try:
+            session.query(model).filter(model.id.in_(batch)).update({model.approved: False})
+            session.commit()
+        finally:
+            session.close()
+        return batch,
+
+    def add_pending_temporary_stations():
+        return [add_temporary_station() for _ in range(MODERATION_BATCH_SIZE)],
+
+    def add_pending_permanent_stations():
+        return [add_permanent_station() for _ in range(MODERATION_BATCH_SIZE)],
+
+    return [
+        # Users and sessions
+        Benchmark("add_user", lambda: db.add_user("bench" + str(next(counter)), "password", None, False)),
+        Benchmark("add_user_with_password_hash", add_user),
+        Benchmark("get_user", lambda: db.get_user(rng.choice(user_ids))),
+        Benchmark("get_all_users", db.get_all_users),
+        Benchmark("get_user_list", lambda: db.get_user_list(limit=50)),
+        Benchmark("update_user", lambda: db.update_user(rng.choice(user_ids), email="bench@example.com")),
+        Benchmark("update_user (password)", lambda: db.update_user(user_ids[-1], password="password")),
+        Benchmark("verify_user", lambda: db.verify_user("admin", "password")),
+        Benchmark("is_insecure_user_present", lambda: db.is_insecure_user_present()),
+        Benchmark("delete_user", db.delete_user, lambda: (add_user(),)),
+        Benchmark("create_user_session", lambda: db.create_user_session(rng.choice(user_ids))),
+        Benchmark("verify_user_session_token (cached)", lambda: db.verify_user_session_token(session_token)),
+        Benchmark("verify_user_session_token (uncached)", lambda: db.verify_user_session_token(session_token),
+                  clear_session_cache),
+        Benchmark("renew_user_session", lambda: db.renew_user_session(session_token, datetime.now() + timedelta(days=1))),
+        Benchmark("delete_user_session", db.delete_user_session,
+                  lambda: (db.create_user_session(rng.choice(user_ids)),)),
+
+        # Events
+        Benchmark("add_event", add_event),
+        Benchmark("get_event", lambda: db.get_event(rng.choice(event_ids))),
+        Benchmark("get_all_events", db.get_all_events),
+        Benchmark("get_event_list", db.get_event_list),
+        Benchmark("get_event_choices", db.get_event_choices),
+        Benchmark("update_event", lambda: db.update_event(rng.choice(event_ids), notes_template="Bench")),
+        Benchmark("delete_event", db.delete_event, lambda: (add_event(),)),
+
+        # Temporary stations
+        Benchmark("add_temporary_station", add_temporary_station),
+        Benchmark("get_temporary_station", lambda: db.get_temporary_station(rng.choice(temporary_ids))),
+        Benchmark("get_temporary_station_version",
+                  lambda: db.get_temporary_station_version(rng.choice(temporary_ids))),
+        Benchmark("get_all_temporary_stations", db.get_all_temporary_stations),
+        Benchmark("get_temporary_stations_by_event",
+                  lambda: db.get_temporary_stations_by_event(rng.choice(event_ids))),
+        Benchmark("count_temporary_stations_by_bucket", lambda: db.count_temporary_stations_by_bucket(now)),
+        Benchmark("get_temporary_station_list",
+                  lambda: db.get_temporary_station_list(rng.choice(["Past", "Current", "Future"]), now, limit=50)),
+        Benchmark("get_temporary_stations_for_map", db.get_temporary_stations_for_map),
+        Benchmark("update_temporary_station",
+                  lambda: db.update_temporary_station(rng.choice(temporary_ids), notes="Bench", band_ids=[1, 2])),
+        Benchmark("delete_temporary_station", db.delete_temporary_station, lambda: (add_temporary_station(),)),
+
+        # Permanent stations
+        Benchmark("add_permanent_station", add_permanent_station),
+        Benchmark("get_permanent_station", lambda: db.get_permanent_station(rng.choice(permanent_ids))),
+        Benchmark("get_permanent_station_version",
+                  lambda: db.get_permanent_station_version(rng.choice(permanent_ids))),
+        Benchmark("get_all_permanent_stations", db.get_all_permanent_stations),
+        Benchmark("get_permanent_stations_by_type", lambda: db.get_permanent_stations_by_type(rng.choice(type_ids))),
+        Benchmark("count_permanent_stations_by_type", db.count_permanent_stations_by_type),
+        Benchmark("get_permanent_station_list",
+                  lambda: db.get_permanent_station_list(rng.choice(type_ids), limit=50)),
+        Benchmark("get_permanent_stations_for_map", db.get_permanent_stations_for_map),
+        Benchmark("update_permanent_station",
+                  lambda: db.update_permanent_station(rng.choice(permanent_ids), notes="Bench")),
+        Benchmark("delete_permanent_station", db.delete_permanent_station, lambda: (add_permanent_station(),)),
+
+        # Stations submitted by visitors, created in batches by the station write queue
+        Benchmark("add_stations (batch of " + str(STATION_WRITE_BATCH_SIZE) + ")",
+                  lambda: db.add_stations([("temp", new_temporary_station_fields())] * STATION_WRITE_BATCH_SIZE)),
+
+        # Moderation queue
+        Benchmark("count_unapproved_stations", db.count_unapproved_stations),
+        Benchmark("get_unapproved_temporary_station_list", lambda: db.get_unapproved_temporary_station_list(limit=50)),
+        Benchmark("get_unapproved_permanent_station_list", lambda: db.get_unapproved_permanent_station_list(limit=50)),
+        Benchmark("approve_temporary_stations", db.approve_temporary_stations,
+                  lambda: mark_unapproved(TemporaryStation, temporary_ids)),
+        Benchmark("reject_temporary_stations", db.reject_temporary_stations, add_pending_temporary_stations),
+        Benchmark("approve_permanent_stations", db.approve_permanent_stations,
+                  lambda: mark_unapproved(PermanentStation, permanent_ids)),
+        Benchmark("reject_permanent_stations", db.reject_permanent_stations, add_pending_permanent_stations),
+
+        # Permanent station types, bands and modes
+        Benchmark("get_permanent_station_type", lambda: db.get_permanent_station_type(rng.choice(type_ids))),
+        Benchmark("get_all_permanent_station_types", db.get_all_permanent_station_types),
+        Benchmark("get_all_bands", db.get_all_bands),
+        Benchmark("get_all_modes", db.get_all_modes),
+
+        # Utilities
+        Benchmark("humanize_start_end", lambda: humanize_start_end(temporary_station.start_time,
+                                                                   temporary_station.end_time)),
+        Benchmark("populate_derived_fields_temp_station",
+                  lambda: populate_derived_fields_temp_station(temporary_station)),
+        Benchmark("populate_derived_fields_perm_station",
+                  lambda: populate_derived_fields_perm_station(permanent_station)),
+        Benchmark("serialize_everything", lambda: serialize_everything(temporary_station)),
+        Benchmark("hash_password", lambda: hash_password("password", "salt")),
+        Benchmark("generate_password", generate_password),
+
+        # Housekeeping, which deletes everything that has expired
+        Benchmark("cleanup_expired_sessions", db.cleanup_expired_sessions),
+        Benchmark("cleanup_expired_temporary_stations", db.cleanup_expired_temporary_stations),
+        Benchmark("cleanup_expired_events", db.cleanup_expired_events),
+    ]
+
+
+async def run_benchmarks(seed, only):
+    """Fill the database named in the current config with synthetic data, then run the benchmarks against it. This runs
+    in its own process, as the config is loaded when the database module is imported."""
+
+    from database import Database
+
+    db = Database()
+    rng = random.Random(seed)
+    results = {}
+    for benchmark in get_benchmarks(db, rng):
+        if only and not any(name in benchmark.name for name in only):
+            continue
+        print("  " + benchmark.name, file=sys.stderr)
+        results[benchmark.name] = await benchmark.run()
+    db.engine.dispose()
+    return results
+
+
+def run_for_station_count(station_count, args):
+    """Create a database for a number of stations, run the benchmarks against it, and return the results"""
+
+    work_dir = tempfile.mkdtemp(prefix="youthmap-microbench-")
+    try:
+        env = dict(os.environ, YOUTHMAP_CONFIG=write_config(work_dir, 0))
+        print("Creating database with " + str(station_count) + " stations...", file=sys.stderr)
+        subprocess.run([sys.executable, "-m", "tools.generate_dataset", "--stations", str(station_count),
+                        "--seed", str(args.seed), "--json"], cwd=REPO_DIR, env=env, check=True, capture_output=True)
+        print("Running benchmarks...", file=sys.stderr)
+        command = [sys.executable, "-m", "benchmarks.microbench", "--run-in-process", "--seed", str(args.seed)]
+        if args.only:
+            command += ["--only", args.only]
+        output = subprocess.run(command, cwd=REPO_DIR, env=env, check=True, stdout=subprocess.PIPE, text=True)
+        return {"stations": station_count, "benchmarks": json.loads(output.stdout.strip().splitlines()[-1])}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """Compare results against a baseline from a previous run, and return a list of descriptions of the regressions"""
+
+    regressions = []
+    baseline_by_count = {run["stations"]: run for run in baseline["runs"]}
+    for run in results["runs"]:
+        old_run = baseline_by_count.get(run["stations"])
+        if not old_run:
+            continue
+        for name, result in run["benchmarks"].items():
+            old = old_run["benchmarks"].get(name)
+            if not old:
+                continue
+            prefix = str(run["stations"]) + " stations: " + name + " "
+            if result["median_us"] > old["median_us"] * (1 + tolerance):
+                regressions.append(prefix + "median time " + str(old["median_us"]) + " -> "
+                                   + str(result["median_us"]) + " us")
+            # Ignore tiny differences in allocations, which vary from run to run for reasons that have nothing to do
+            # with the code being tested
+            if result["peak_alloc_bytes"] > max(old["peak_alloc_bytes"] * (1 + tolerance),
+                                                old["peak_alloc_bytes"] + 1024):
+                regressions.append(prefix + "peak allocation " + str(old["peak_alloc_bytes"]) + " -> "
+                                   + str(result["peak_alloc_bytes"]) + " bytes")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Youth Map database operations and utility functions")
+    parser.add_argument("--stations", default=",".join(str(n) for n in DEFAULT_STATION_COUNTS),
+                        help="comma-separated numbers of stations to test with")
+    parser.add_argument("--only", help="comma-separated parts of the names of the benchmarks to run, if not all of them")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", help="file to write the results to as JSON, as well as printing them")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="how much worse than the baseline a result can be before it is a regression, "
+                             "e.g. 0.25 for 25%%")
+    parser.add_argument("--run-in-process", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Used internally to run the benchmarks in a separate process, against the database in YOUTHMAP_CONFIG
+    if args.run_in_process:
+        only = args.only.split(",") if args.only else None
+        print(json.dumps(asyncio.run(run_benchmarks(args.seed, only))))
+        return
+
+    results = {"timestamp": datetime.now().isoformat(timespec="seconds"),
+               "python": sys.version.split()[0],
+               "runs": [run_for_station_count(int(n), args) for n in args.stations.split(",")]}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against " + args.baseline, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
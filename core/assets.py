@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+
+# Brotli is optional. If it is installed, brotli-compressed copies of the built assets are written alongside the gzipped
+# ones, otherwise only gzip is used.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static asset pipeline. On startup, the site's own JavaScript and CSS files are minified and written to the build
+# directory under a name containing a hash of their contents, e.g. "js/map.js" becomes "js/map.1a2b3c4d5e6f.js", along
+# with pre-compressed copies. Because the name changes whenever the content does, browsers can be told to cache them
+# forever, and templates find the current name of each file through the manifest.
+
+# Static files that are run through the pipeline, as patterns relative to the static directory
+ASSET_PATTERNS = [re.compile(r"js/[^/]+\.js"), re.compile(r"css/style\.css")]
+# Number of hex digits of the content hash to include in each file name
+FINGERPRINT_LENGTH = 12
+# Name of the manifest file written to the build directory, mapping each source file to its built file
+MANIFEST_FILE = "manifest.json"
+
+
+def minify_css(source):
+    """Minify a CSS file by removing comments and any whitespace that isn't needed."""
+
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.DOTALL)
+    source = re.sub(r"\s+", " ", source)
+    # Spaces before a colon are left alone, as in a selector like "div :hover" they are significant
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    source = re.sub(r":\s+", ":", source)
+    return source.replace(";}", "}").strip() + "\n"
+
+
+def minify_js(source):
+    """Minify a JavaScript file. This is deliberately conservative, as it doesn't parse the script: it only removes
+    indentation, blank lines and lines that are entirely comments, and keeps every line break so that the meaning of the
+    script can't change. A script containing template literals, which may span lines, is left as it is."""
+
+    if "`" in source:
+        return source
+    lines = (line.strip() for line in source.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//")) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+def fingerprinted_name(path, content):
+    """Get the built file name for a static file with the given path and (minified) content."""
+
+    root, ext = os.path.splitext(path)
+    return root + "." + hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH] + ext
+
+
+def write_file(path, content, overwrite=False):
+    """Write a file atomically, so that a web server process never sees a half-written one. Built files include the hash
+    of their content in their name, so if one already exists it must already have the same content, and unless told to
+    overwrite it, it is left alone."""
+
+    if os.path.isfile(path) and not overwrite:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + "." + str(os.getpid()) + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def build_assets(static_dir, build_dir):
+    """Build all the assets in the static directory into the build directory, and return the manifest, which maps the
+    path of each source file (e.g. "js/map.js") to the path of its built file. Any old built files that are no longer in
+    the manifest are removed."""
+
+    manifest = {}
+    built_files = {MANIFEST_FILE}
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        for filename in sorted(filenames):
+            path = os.path.relpath(os.path.join(dirpath, filename), static_dir).replace(os.sep, "/")
+            if not any(pattern.fullmatch(path) for pattern in ASSET_PATTERNS):
+                continue
+
+            with open(os.path.join(static_dir, path), encoding="utf-8") as f:
+                content = MINIFIERS[os.path.splitext(path)[1]](f.read()).encode("utf-8")
+            built_path = fingerprinted_name(path, content)
+            write_file(os.path.join(build_dir, built_path), content)
+            # Fixed mtime so that the compressed file is the same every time it's built
+            write_file(os.path.join(build_dir, built_path + ".gz"), gzip.compress(content, compresslevel=9, mtime=0))
+            built_files.update([built_path, built_path + ".gz"])
+            if brotli:
+                write_file(os.path.join(build_dir, built_path + ".br"), brotli.compress(content))
+                built_files.add(built_path + ".br")
+            manifest[path] = built_path
+
+    # Write the manifest, which is not used by the server itself but is useful to see what was built
+    manifest_content = json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+    write_file(os.path.join(build_dir, MANIFEST_FILE), manifest_content, overwrite=True)
+
+    # Clean up anything left over from previous builds. Only the directories we have built files into are cleaned, as
+    # other things (such as the icon sprite) are built into the same directory separately.
+    built_dirs = {os.path.dirname(path) for path in manifest.values()}
+    for dirpath, dirnames, filenames in os.walk(build_dir):
+        for filename in filenames:
+            path = os.path.relpath(os.path.join(dirpath, filename), build_dir).replace(os.sep, "/")
+            if os.path.dirname(path) in built_dirs and path not in built_files and not path.endswith(".tmp"):
+                # Another web server process may be doing the same clean-up at the same time
+                try:
+                    os.remove(os.path.join(build_dir, path))
+                except FileNotFoundError:
+                    pass
+
+    logging.info("Built " + str(len(manifest)) + " static assets.")
+    return manifest
+
+
+def asset_url(handler, path):
+    """Template function giving the URL of a static file, e.g. {{ asset_url("js/map.js") }}. If the file has been built,
+    this is the URL of the fingerprinted copy, otherwise (e.g. in development mode) it's the URL of the original file."""
+
+    manifest = handler.application.asset_manifest
+    if path in manifest:
+        return "/assets/" + manifest[path]
+    return "/" + path
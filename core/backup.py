@@ -0,0 +1,136 @@
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from tornado.ioloop import IOLoop
+
+# Database backups. Copying the database file while the server is running can give a corrupt copy, if the copy happens
+# part way through a write. Instead, backups are made with SQLite's online backup API, which copies the database a few
+# pages at a time, each step seeing a consistent state. Between steps it pauses briefly so that the web server can
+# carry on writing to the database; if it does, SQLite starts the copy again so that the backup is never a mixture of
+# before and after. Each finished copy is checked with SQLite's integrity check, and only the most recent few are kept.
+
+# Number of database pages to copy in each step of a backup
+BACKUP_PAGES_PER_STEP = 100
+# How long to pause between steps, in seconds, giving other connections a chance to use the database
+BACKUP_STEP_PAUSE_SECONDS = 0.005
+# Backup file names are the time of the backup, e.g. database-20250101-120000.db. If more than one backup is made in
+# the same second, e.g. by the web server and the command-line tool at once, the later ones get a number on the end,
+# e.g. database-20250101-120000-2.db.
+BACKUP_TIME_FORMAT = "%Y%m%d-%H%M%S"
+BACKUP_FILENAME_PATTERN = re.compile(r"^database-(\d{8}-\d{6})(?:-(\d+))?\.db$")
+
+
+class BackupError(Exception):
+    """Raised when a backup can't be made, or fails its integrity check."""
+
+
+def backup_database(database_path, backup_dir, keep):
+    """Back up the database to a new timestamped file in the backup directory, check that the copy is intact, then delete
+    all but the most recent "keep" backups. Returns the path of the new backup. Raises BackupError if the copy fails its
+    integrity check, in which case it is deleted rather than kept."""
+
+    # Connecting to a database that doesn't exist would create an empty one, and back that up
+    if not os.path.isfile(database_path):
+        raise BackupError("Database " + database_path + " does not exist")
+    os.makedirs(backup_dir, exist_ok=True)
+    backup_name = "database-" + datetime.now().strftime(BACKUP_TIME_FORMAT)
+    start_time = time.perf_counter()
+
+    # Copy to a temporary file first, so that a backup that is interrupted or fails its check is never mistaken for a
+    # good one. Each backup gets its own temporary file, so that backups made at the same time by different processes
+    # can't get in each other's way.
+    temp_fd, temp_path = tempfile.mkstemp(prefix=".database-", suffix=".tmp", dir=backup_dir)
+    os.close(temp_fd)
+    source = sqlite3.connect(database_path)
+    destination = sqlite3.connect(temp_path)
+    try:
+        try:
+            source.backup(destination, pages=BACKUP_PAGES_PER_STEP,
+                          progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_PAUSE_SECONDS))
+            result = destination.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            destination.close()
+            source.close()
+        if result != "ok":
+            raise BackupError("Backup failed integrity check: " + result)
+        backup_path = link_backup(temp_path, backup_dir, backup_name)
+    finally:
+        os.remove(temp_path)
+    logging.info("Backed up database to " + backup_path + " in " + str(round(time.perf_counter() - start_time, 2))
+                 + " seconds.")
+
+    # Delete old backups. Another process making a backup at the same time may have already deleted some of them.
+    for old_backup in list_backups(backup_dir)[keep:]:
+        try:
+            os.remove(old_backup["path"])
+            logging.info("Deleted old backup " + old_backup["path"] + ".")
+        except FileNotFoundError:
+            pass
+    return backup_path
+
+
+def link_backup(temp_path, backup_dir, backup_name):
+    """Give a finished backup its final name, without overwriting an existing backup that already has that name. Hard
+    linking fails if the new name is already taken, so unlike renaming, two processes can never both claim the same name.
+    Returns the path of the backup."""
+
+    number = 1
+    while True:
+        backup_path = os.path.join(backup_dir, backup_name + ("-" + str(number) if number > 1 else "") + ".db")
+        try:
+            os.link(temp_path, backup_path)
+            return backup_path
+        except FileExistsError:
+            number += 1
+
+
+def list_backups(backup_dir):
+    """Get the backups in the backup directory, newest first. Each is a dict with the path, size in bytes, and the time
+    it was made."""
+
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for filename in os.listdir(backup_dir):
+        match = BACKUP_FILENAME_PATTERN.match(filename)
+        if match:
+            path = os.path.join(backup_dir, filename)
+            backups.append({"path": path, "filename": filename, "size": os.path.getsize(path),
+                            "time": datetime.strptime(match.group(1), BACKUP_TIME_FORMAT),
+                            "number": int(match.group(2) or 1)})
+    return sorted(backups, key=lambda b: (b["time"], b["number"]), reverse=True)
+
+
+class DatabaseBackups:
+    """Runs backups of the database from within the web server, on a separate thread so that requests can carry on
+    being handled in the meantime. Only one backup runs at a time."""
+
+    def __init__(self, database_path, backup_dir, keep):
+        self.database_path = database_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.running = False
+
+    async def run(self):
+        """Make a backup now, unless one is already in progress. Returns the path of the new backup, or None if one was
+        already in progress. Raises BackupError if the backup failed its integrity check."""
+
+        if self.running:
+            return None
+        self.running = True
+        try:
+            return await IOLoop.current().run_in_executor(None, backup_database, self.database_path, self.backup_dir,
+                                                          self.keep)
+        finally:
+            self.running = False
+
+    def get_last_backup_time(self):
+        """Get the time of the most recent backup, or None if there are no backups"""
+
+        backups = list_backups(self.backup_dir)
+        return backups[0]["time"] if backups else None
@@ -3,16 +3,57 @@ import os
 
 import yaml
 
+# The config file is config.yml in the current directory, unless another file is given in the YOUTHMAP_CONFIG environment
+# variable (e.g. by the benchmarks, which run the server against a temporary database).
+CONFIG_FILE = os.environ.get("YOUTHMAP_CONFIG", "config.yml")
+
 # Check you have a config file
-if not os.path.isfile("config.yml"):
+if not os.path.isfile(CONFIG_FILE):
     logging.error(
         "Your config file is missing. Ensure config.yml is present and that you have updated it according to your needs.")
     exit()
 
 # Load config
-config = yaml.safe_load(open("config.yml"))
+config = yaml.safe_load(open(CONFIG_FILE))
 logging.info("Loaded config.")
 
 HTTP_PORT = config["http-port"]
 DATABASE_DIR = config["database-dir"]
 UPLOAD_DIR = config["upload-dir"]
+
+# Optional settings, which fall back to a default if they are not present in an older config file
+ADMIN_LIST_PAGE_SIZE = config.get("admin-list-page-size", 50)
+PASSWORD_HASH_WORKERS = config.get("password-hash-workers", 2)
+PASSWORD_HASH_MAX_QUEUE = config.get("password-hash-max-queue", 32)
+WORKERS = config.get("workers", 1)
+MODE = config.get("mode", "production")
+ASSET_DIR = config.get("asset-dir", "data/assets")
+MAX_UPLOAD_SIZE_MB = config.get("max-upload-size-mb", 10)
+SERVER_TIMING = config.get("server-timing", "admins")
+QUERY_COUNT_BUDGET = config.get("query-count-budget", 20)
+QUERY_TIME_BUDGET_MS = config.get("query-time-budget-ms", 100)
+SLOW_QUERY_MS = config.get("slow-query-ms", 50)
+SLOW_QUERY_LOG = config.get("slow-query-log", os.path.join(DATABASE_DIR, "slow-queries.log"))
+REQUEST_LOG = config.get("request-log", None)
+BACKUP_DIR = config.get("backup-dir", os.path.join(DATABASE_DIR, "backups"))
+BACKUP_KEEP = config.get("backup-keep", 7)
+BACKUP_INTERVAL_HOURS = config.get("backup-interval-hours", 24)
+RATE_LIMITS = config.get("rate-limits") or {}
+TRUSTED_PROXIES = config.get("trusted-proxies", ["127.0.0.1", "::1"])
+METRICS_ALLOWED_IPS = config.get("metrics-allowed-ips", ["127.0.0.1", "::1"])
+METRICS_TOKEN = config.get("metrics-token", None)
+METRICS_DIR = config.get("metrics-dir", os.path.join(DATABASE_DIR, "metrics"))
+
+# Check the runtime mode is one we know about, rather than quietly treating a typo as production mode
+MODES = ["production", "development"]
+if MODE not in MODES:
+    logging.error("Unknown mode '" + str(MODE) + "' in config file " + CONFIG_FILE + ". It must be one of: "
+                  + ", ".join(MODES) + ".")
+    exit(1)
+
+# Check at least one backup is kept. With 0, each backup would be deleted as soon as it was made, and a negative number
+# would delete the newest backups rather than the oldest.
+if not isinstance(BACKUP_KEEP, int) or isinstance(BACKUP_KEEP, bool) or BACKUP_KEEP < 1:
+    logging.error("Invalid backup-keep '" + str(BACKUP_KEEP) + "' in config file " + CONFIG_FILE
+                  + ". It must be a whole number, at least 1.")
+    exit(1)
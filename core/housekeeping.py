@@ -0,0 +1,54 @@
+import logging
+from datetime import datetime, timedelta
+
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+from core.backup import BackupError
+
+# How often to run housekeeping jobs, in seconds
+HOUSEKEEPING_INTERVAL_SECONDS = 3600
+
+
+class Housekeeping:
+    """Runs periodic background jobs that keep the database tidy, and backs it up when a backup is due. When running
+    multiple web server processes, only one of them should start this, so that the jobs aren't run several times over."""
+
+    def __init__(self, db, backups, backup_interval_hours):
+        self.db = db
+        self.backups = backups
+        self.backup_interval_hours = backup_interval_hours
+        self.periodic_callback = PeriodicCallback(self.run, HOUSEKEEPING_INTERVAL_SECONDS * 1000)
+
+    def start(self):
+        """Start running housekeeping jobs periodically"""
+
+        self.periodic_callback.start()
+
+    def stop(self):
+        """Stop running housekeeping jobs"""
+
+        self.periodic_callback.stop()
+
+    def run(self):
+        """Run all housekeeping jobs once"""
+
+        logging.info("Running housekeeping...")
+        self.db.cleanup_expired_sessions()
+        if self.backup_due():
+            IOLoop.current().spawn_callback(self.backup)
+
+    def backup_due(self):
+        """Whether it is time for an automatic backup. As this is worked out from the time of the last backup on disk,
+        restarting the server doesn't delay or repeat backups."""
+
+        if not self.backup_interval_hours:
+            return False
+        last_backup_time = self.backups.get_last_backup_time()
+        return last_backup_time is None or datetime.now() - last_backup_time >= timedelta(
+            hours=self.backup_interval_hours)
+
+    async def backup(self):
+        try:
+            await self.backups.run()
+        except (BackupError, OSError) as e:
+            logging.error("Automatic backup failed: " + str(e))
@@ -0,0 +1,295 @@
+import bisect
+import json
+import os
+import resource
+import time
+
+from tornado.ioloop import PeriodicCallback
+
+from core.assets import write_file
+
+# Metrics about the running server, served at /metrics in the Prometheus text format. Metrics are kept in memory by each
+# process. When running multiple web server processes, a scrape could be answered by any of them, so every figure is
+# labelled with the worker (process number) it came from, and each process saves its figures to a file in a directory
+# they all share every few seconds. Whichever process answers a scrape includes the latest figures saved by the others,
+# so every worker's figures appear in every scrape and each of their counters only ever goes up (unless that worker
+# restarts). To get totals for the whole server, sum over the worker label, e.g. sum without (worker) (rate(...)).
+
+# Upper bounds of the histogram buckets used for durations, in seconds
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+# How often to measure the IOLoop's lag, in seconds
+IOLOOP_LAG_INTERVAL_SECONDS = 1
+# How often each process saves its figures for the others to include, when running multiple processes, in seconds
+SHARE_INTERVAL_SECONDS = 5
+# Saved figures older than this are from a process that is no longer running, so are left out, in seconds
+SHARE_MAX_AGE_SECONDS = 60
+
+
+def format_labels(label_names, label_values, *extra):
+    """Format a set of labels as they appear after a metric name, e.g. {handler="MapHandler",code="200"}. Any extra
+    labels are given already formatted, e.g. le="0.5", and empty ones are skipped."""
+
+    labels = [name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+              for name, value in zip(label_names, label_values)]
+    labels.extend(label for label in extra if label)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def format_value(value):
+    """Format a metric value"""
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A metric that only ever goes up, such as a number of requests. Values are kept separately for each combination of
+    label values."""
+
+    type = "counter"
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, label_values=(), amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self, constant_label=""):
+        for label_values, value in sorted(self.values.items()):
+            yield self.name + format_labels(self.label_names, label_values, constant_label), value
+
+
+class Gauge(Counter):
+    """A metric that can go up and down, such as a number of requests in progress"""
+
+    type = "gauge"
+
+    def set(self, label_values, value):
+        self.values[label_values] = value
+
+
+class Histogram:
+    """A metric that counts observations, such as request durations, in buckets by size, as well as their total count
+    and sum"""
+
+    type = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # For each combination of label values, a list of [bucket counts..., count, sum]
+        self.values = {}
+
+    def observe(self, label_values, value):
+        entry = self.values.get(label_values)
+        if entry is None:
+            entry = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        # Count it in the first bucket it fits in. The buckets are made cumulative when they are output.
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            entry[i] += 1
+        entry[-2] += 1
+        entry[-1] += value
+
+    def samples(self, constant_label=""):
+        for label_values, entry in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield (self.name + "_bucket" + format_labels(self.label_names, label_values, constant_label,
+                                                             'le="' + str(bound) + '"'), cumulative)
+            yield (self.name + "_bucket" + format_labels(self.label_names, label_values, constant_label, 'le="+Inf"'),
+                   entry[-2])
+            yield self.name + "_count" + format_labels(self.label_names, label_values, constant_label), entry[-2]
+            yield self.name + "_sum" + format_labels(self.label_names, label_values, constant_label), entry[-1]
+
+
+def get_resident_memory_bytes():
+    """Get the current resident memory size of this process. This is read from /proc where available, otherwise the
+    peak size is used instead."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Metrics:
+    """All the metrics collected by the application. Request metrics are recorded as each request finishes, and database
+    metrics as each query runs; other figures such as memory use and cache hit ratios are read when the metrics are
+    requested, so they cost nothing in between."""
+
+    def __init__(self, db, caches, rate_limiter, station_writes, worker=None, shared_dir=None):
+        """The caches are a dict of name to cache objects, which must have "hits" and "misses" attributes. The counters
+        of the rate limiter and the station write queue are read in the same way as the caches'. When running multiple
+        processes, the worker is this process's number, and the shared directory is where the processes save their
+        figures for each other."""
+
+        self.db = db
+        self.caches = caches
+        self.rate_limiter = rate_limiter
+        self.station_writes = station_writes
+        self.start_time = time.time()
+
+        self.requests = Counter("youthmap_http_requests_total", "HTTP requests handled",
+                                ("handler", "code"))
+        self.request_duration = Histogram("youthmap_http_request_duration_seconds", "Time taken to handle HTTP requests",
+                                          ("handler", "code"))
+        self.requests_in_flight = Gauge("youthmap_http_requests_in_flight", "HTTP requests currently being handled")
+        self.ioloop_lag = Histogram("youthmap_ioloop_lag_seconds",
+                                    "How late the IOLoop was in running a timer, i.e. how long it was blocked")
+        self.db_queries = Counter("youthmap_db_queries_total", "Database queries run")
+        self.db_query_duration = Histogram("youthmap_db_query_duration_seconds", "Time taken to run database queries")
+        self.cache_hits = Counter("youthmap_cache_hits_total", "Lookups that were found in an in-memory cache",
+                                  ("cache",))
+        self.cache_misses = Counter("youthmap_cache_misses_total", "Lookups that were not found in an in-memory cache",
+                                    ("cache",))
+        self.cache_hit_ratio = Gauge("youthmap_cache_hit_ratio", "Proportion of lookups found in an in-memory cache",
+                                     ("cache",))
+        self.rate_limit_allowed = Counter("youthmap_rate_limit_allowed_total",
+                                          "Rate-limited requests that were allowed", ("rule",))
+        self.rate_limit_limited = Counter("youthmap_rate_limit_limited_total",
+                                          "Rate-limited requests that were turned away for being over the limit",
+                                          ("rule",))
+        self.rate_limit_buckets = Gauge("youthmap_rate_limit_buckets",
+                                        "Clients currently being tracked by the rate limiter")
+        self.station_write_batches = Counter("youthmap_station_write_batches_total",
+                                             "Transactions used to create stations submitted by visitors")
+        self.stations_written = Counter("youthmap_station_writes_total",
+                                        "Stations submitted by visitors that have been written to the database")
+        self.resident_memory = Gauge("process_resident_memory_bytes", "Resident memory size in bytes")
+        self.cpu_seconds = Counter("process_cpu_seconds_total", "Total user and system CPU time spent in seconds")
+        self.start_time_seconds = Gauge("process_start_time_seconds", "Start time of the process since the Unix epoch")
+        self.all_metrics = [self.requests, self.request_duration, self.requests_in_flight, self.ioloop_lag,
+                            self.db_queries, self.db_query_duration, self.cache_hits, self.cache_misses,
+                            self.cache_hit_ratio, self.rate_limit_allowed, self.rate_limit_limited,
+                            self.rate_limit_buckets, self.station_write_batches, self.stations_written,
+                            self.resident_memory, self.cpu_seconds, self.start_time_seconds]
+        self.requests_in_flight.set((), 0)
+
+        db.instrumentation.add_listener(self.on_query)
+        self.ioloop_lag_callback = PeriodicCallback(self.measure_ioloop_lag, IOLOOP_LAG_INTERVAL_SECONDS * 1000)
+        self.ioloop_lag_expected = None
+
+        self.worker_label = 'worker="' + str(worker) + '"' if worker is not None else ""
+        self.shared_dir = shared_dir
+        self.shared_path = os.path.join(shared_dir, "worker-" + str(worker) + ".json") if shared_dir else None
+        self.share_callback = PeriodicCallback(self.share, SHARE_INTERVAL_SECONDS * 1000) if shared_dir else None
+
+    def start(self):
+        """Start measuring the IOLoop's lag, and saving this process's figures for the others if there are any"""
+
+        self.ioloop_lag_expected = time.monotonic() + IOLOOP_LAG_INTERVAL_SECONDS
+        self.ioloop_lag_callback.start()
+        if self.share_callback:
+            self.share()
+            self.share_callback.start()
+
+    def stop(self):
+        """Stop measuring the IOLoop's lag, and remove this process's saved figures so that they stop appearing"""
+
+        self.ioloop_lag_callback.stop()
+        if self.share_callback:
+            self.share_callback.stop()
+            try:
+                os.remove(self.shared_path)
+            except FileNotFoundError:
+                pass
+
+    def measure_ioloop_lag(self):
+        now = time.monotonic()
+        self.ioloop_lag.observe((), max(0.0, now - self.ioloop_lag_expected))
+        self.ioloop_lag_expected = now + IOLOOP_LAG_INTERVAL_SECONDS
+
+    def on_request_start(self):
+        self.requests_in_flight.values[()] += 1
+
+    def on_request_end(self):
+        self.requests_in_flight.values[()] -= 1
+
+    def on_request_finished(self, handler):
+        """Record a finished request. Called from the application's log_request()."""
+
+        label_values = (type(handler).__name__, str(handler.get_status()))
+        self.requests.inc(label_values)
+        self.request_duration.observe(label_values, handler.request.request_time())
+
+    def on_query(self, statement, parameters, duration):
+        """Record a database query. Called by the database's QueryInstrumentation."""
+
+        self.db_queries.inc()
+        self.db_query_duration.observe((), duration)
+
+    def update(self):
+        """Update the metrics that are read on demand"""
+
+        for name, cache in self.caches.items():
+            self.cache_hits.values[(name,)] = cache.hits
+            self.cache_misses.values[(name,)] = cache.misses
+            lookups = cache.hits + cache.misses
+            self.cache_hit_ratio.set((name,), cache.hits / lookups if lookups else 0.0)
+        for rule in self.rate_limiter.rules.values():
+            self.rate_limit_allowed.values[(rule.name,)] = rule.allowed
+            self.rate_limit_limited.values[(rule.name,)] = rule.limited
+        self.rate_limit_buckets.set((), len(self.rate_limiter.buckets))
+        self.station_write_batches.values[()] = self.station_writes.batches
+        self.stations_written.values[()] = self.station_writes.stations
+        self.resident_memory.set((), get_resident_memory_bytes())
+        times = os.times()
+        self.cpu_seconds.values[()] = times.user + times.system
+        self.start_time_seconds.set((), self.start_time)
+
+    def collect(self):
+        """Get the current samples of this process's metrics, as a dict of metric name to a list of (sample name, value)
+        pairs"""
+
+        self.update()
+        return {metric.name: list(metric.samples(self.worker_label)) for metric in self.all_metrics}
+
+    def share(self, samples=None):
+        """Save this process's current figures, or the samples already collected, for the other processes to include in
+        their scrapes"""
+
+        write_file(self.shared_path, json.dumps(samples or self.collect()).encode("utf-8"), overwrite=True)
+
+    def load_shared(self):
+        """Get the figures most recently saved by the other processes, as a list of what collect() returned in each"""
+
+        others = []
+        now = time.time()
+        for filename in sorted(os.listdir(self.shared_dir)):
+            path = os.path.join(self.shared_dir, filename)
+            if path == self.shared_path or not filename.endswith(".json"):
+                continue
+            try:
+                if now - os.path.getmtime(path) > SHARE_MAX_AGE_SECONDS:
+                    continue
+                with open(path) as f:
+                    others.append(json.load(f))
+            except (OSError, ValueError):
+                # The process may have just stopped and removed its file
+                continue
+        return others
+
+    def render(self):
+        """Get all the metrics in the Prometheus text format, including those of the other processes if there are any"""
+
+        all_samples = [self.collect()]
+        if self.shared_dir:
+            self.share(all_samples[0])
+            all_samples.extend(self.load_shared())
+
+        lines = []
+        for metric in self.all_metrics:
+            lines.append("# HELP " + metric.name + " " + metric.description)
+            lines.append("# TYPE " + metric.name + " " + metric.type)
+            for samples in all_samples:
+                for sample_name, value in samples.get(metric.name, []):
+                    lines.append(sample_name + " " + format_value(value))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+# Maximum number of rendered pages to hold in memory. Beyond this, the least recently used ones are dropped and will be
+# rendered again the next time they are requested.
+PAGE_CACHE_MAX_SIZE = 1000
+
+
+class CachedPage:
+    """A rendered page, and the version of the data it was rendered from, as held in the PageCache."""
+
+    __slots__ = ["version", "body"]
+
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+
+
+class PageCache:
+    """Bounded least-recently-used cache of rendered pages. Each page is stored along with the version of the data it was
+    rendered from, and is only returned when asked for that same version, so a page is never served once the data
+    behind it has changed, even if the change was made by another process."""
+
+    def __init__(self, max_size=PAGE_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Get the body of the cached page for a key, or None if it is not cached or was rendered from a different
+        version of the data."""
+
+        entry = self.entries.get(key)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry.body
+
+    def put(self, key, version, body):
+        """Add a rendered page to the cache, replacing any older version of it, and dropping the least recently used page
+        if the cache is full."""
+
+        self.entries[key] = CachedPage(version, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove everything from the cache."""
+
+        self.entries.clear()
@@ -0,0 +1,123 @@
+import logging
+import time
+
+# Rate limiting. Some requests are expensive for the server to handle, such as logging in (which hashes a password) or
+# submitting a station (which writes to the database), and some are attempts to guess a password. A single client
+# sending lots of these could use up all the server's CPU or keep the database locked, so each client is only allowed
+# to make a certain number of them. Each rule, e.g. "login", gives each client a bucket of tokens: every rate-limited
+# request takes a token, and the bucket refills at a steady rate up to a maximum (the "burst"), so a client can make a
+# few requests in quick succession but no more than the steady rate over time. Requests made with an empty bucket are
+# turned away with "429 Too Many Requests" before any work is done for them.
+#
+# Clients are identified by IP address. Behind a reverse proxy such as nginx, every request comes from the proxy, so the
+# client's real address is taken from the X-Forwarded-For header that the proxy adds, but only for requests that came
+# from a trusted proxy address, as anyone else could send a fake header. If a trusted proxy doesn't add the header,
+# there is no way to tell visitors apart, and giving them all the proxy's bucket would let one visitor lock everyone
+# else out, so those requests aren't rate limited at all (and a warning is logged). Buckets are kept in memory by each process, so
+# when running multiple web server processes, a client could make up to that many times as many requests.
+
+# The rules, and how many requests each allows per minute and in a burst, unless the config says otherwise
+DEFAULT_RATE_LIMITS = {
+    # Logging in, which hashes the password given
+    "login": {"per-minute": 10, "burst": 5},
+    # Visitors submitting new stations
+    "create-station": {"per-minute": 10, "burst": 10},
+    # Any request that checks a station's edit password
+    "edit-password": {"per-minute": 20, "burst": 10}
+}
+# How often to forget about clients whose buckets have refilled completely, in seconds
+SWEEP_INTERVAL_SECONDS = 60
+
+
+class RateLimitRule:
+    """A rate limit rule, allowing each client a number of requests per minute, and a burst of requests at once"""
+
+    def __init__(self, name, per_minute, burst):
+        self.name = name
+        self.per_minute = per_minute
+        self.burst = burst
+        self.tokens_per_second = per_minute / 60
+        # Number of requests that have been allowed and turned away under this rule
+        self.allowed = 0
+        self.limited = 0
+
+
+class RateLimiter:
+    """Tracks the token buckets of each client for each rate limit rule"""
+
+    def __init__(self, rate_limits, trusted_proxies):
+        """The rate limits are the rate-limits section of the config, a dict of rule name to a dict of "per-minute" and
+        "burst", which override the defaults. A rule with a per-minute of 0 is turned off. The trusted proxies are the
+        IP addresses from which the X-Forwarded-For header is believed."""
+
+        self.rules = {}
+        for name in set(DEFAULT_RATE_LIMITS) | set(rate_limits):
+            if name not in DEFAULT_RATE_LIMITS:
+                logging.warning("Ignoring unknown rate limit rule '" + name + "' in config.")
+                continue
+            settings = {**DEFAULT_RATE_LIMITS[name], **(rate_limits.get(name) or {})}
+            if settings["per-minute"] > 0:
+                self.rules[name] = RateLimitRule(name, settings["per-minute"], max(1, settings["burst"]))
+        self.trusted_proxies = set(trusted_proxies)
+        # Map of (rule name, client IP) to a tuple of the number of tokens in the bucket, and when that was worked out
+        self.buckets = {}
+        self.last_sweep = time.monotonic()
+        # Whether the warning about a proxy not sending X-Forwarded-For has been logged yet
+        self.warned_no_forwarded_for = False
+
+    def get_client_ip(self, request):
+        """Get the IP address of the client that made a request. If it came through a trusted proxy, this is the last
+        address in the X-Forwarded-For header that isn't one of our own proxies. (Earlier ones were supplied by the
+        client, so can't be believed.) Returns None if the request came from a trusted proxy that didn't say who the
+        client was, as the proxy's own address says nothing about them."""
+
+        if request.remote_ip not in self.trusted_proxies:
+            return request.remote_ip
+        addresses = [address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",")
+                     if address.strip()]
+        if not addresses:
+            return None
+        for address in reversed(addresses):
+            if address not in self.trusted_proxies:
+                return address
+        # Every address is one of our own, so the client really is on one of those machines
+        return addresses[0]
+
+    def take(self, rule_name, client_ip):
+        """Take a token from the client's bucket for a rule. Returns 0 if the request is allowed, otherwise the number of
+        seconds until the client will next be allowed one. A client IP of None, i.e. a request from a proxy that didn't
+        say who the client was, is always allowed."""
+
+        rule = self.rules.get(rule_name)
+        if rule is None:
+            return 0
+        if client_ip is None:
+            if not self.warned_no_forwarded_for:
+                logging.warning("Not rate limiting requests from a trusted proxy that didn't send an X-Forwarded-For "
+                                "header. Set up the proxy to send it, as described in docs/sysadmin.md.")
+                self.warned_no_forwarded_for = True
+            return 0
+        now = time.monotonic()
+        if now - self.last_sweep > SWEEP_INTERVAL_SECONDS:
+            self.sweep(now)
+
+        key = (rule_name, client_ip)
+        bucket = self.buckets.get(key)
+        tokens = rule.burst if bucket is None else min(rule.burst,
+                                                       bucket[0] + (now - bucket[1]) * rule.tokens_per_second)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            rule.allowed += 1
+            return 0
+        self.buckets[key] = (tokens, now)
+        rule.limited += 1
+        return (1 - tokens) / rule.tokens_per_second
+
+    def sweep(self, now):
+        """Forget about buckets that would have refilled completely by now. A new full bucket is made if the client
+        comes back, so this makes no difference to them, but stops the buckets of clients that have gone away from
+        taking up memory forever."""
+
+        self.buckets = {key: (tokens, updated) for key, (tokens, updated) in self.buckets.items()
+                        if tokens + (now - updated) * self.rules[key[0]].tokens_per_second < self.rules[key[0]].burst}
+        self.last_sweep = now
@@ -0,0 +1,76 @@
+import json
+import os
+import re
+import time
+from urllib.parse import urlencode, parse_qsl, urlsplit
+
+from tornado.web import OutputTransform
+
+# Request recording. When a request log file is set in the config, every request the server handles is written to it,
+# so that real traffic can later be replayed against a test server with tools/replay.py. Each line of the file is a
+# JSON array of:
+#     [start time (Unix time in seconds), method, URI (path and query string), status code, duration in milliseconds,
+#      response size in bytes, form body (only present for requests that had one)]
+# Any argument whose name contains "password" has its value removed, in both the query string and the form body, so
+# the file never contains login passwords or station edit passwords. Bodies that aren't URL-encoded forms, such as
+# icon uploads, are not recorded.
+
+# Arguments whose values are blanked out when recording
+REDACTED_ARGUMENT = re.compile("password", re.IGNORECASE)
+
+
+def redact_query(query):
+    """Blank out the value of any password argument in a URL-encoded query string or form body"""
+
+    pairs = parse_qsl(query, keep_blank_values=True)
+    if not any(REDACTED_ARGUMENT.search(name) for name, value in pairs):
+        return query
+    return urlencode([(name, "" if REDACTED_ARGUMENT.search(name) else value) for name, value in pairs])
+
+
+class ResponseSizeTransform(OutputTransform):
+    """Counts the bytes of body sent in response to a request, and stores the total on the request as response_size.
+    Doing this as an output transform means every response is counted, including static files and responses that are
+    sent in chunks rather than with a Content-Length header."""
+
+    def __init__(self, request):
+        self.request = request
+        self.request.response_size = 0
+
+    def transform_first_chunk(self, status_code, headers, chunk, finishing):
+        self.request.response_size += len(chunk)
+        return status_code, headers, chunk
+
+    def transform_chunk(self, chunk, finishing):
+        self.request.response_size += len(chunk)
+        return chunk
+
+
+class RequestRecorder:
+    """Appends a line to the request log for each finished request. The file is opened in append mode and each line is
+    written in a single call, so when running multiple web server processes, they can all record to the same file
+    without their lines getting mixed up."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    def record(self, handler):
+        """Record a finished request. Called from the application's log_request(). The application must be set up with
+        the ResponseSizeTransform, which works out the size of the response."""
+
+        request = handler.request
+        uri = urlsplit(request.uri)
+        path = uri.path + ("?" + redact_query(uri.query) if uri.query else "")
+        size = request.response_size
+        duration = request.request_time()
+        entry = [round(time.time() - duration, 3), request.method, path, handler.get_status(), round(duration * 1000, 1),
+                 size]
+        if request.body and request.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            entry.append(redact_query(request.body.decode("utf-8", errors="replace")))
+        os.write(self.fd, (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8"))
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import time
+
+from PIL import Image
+from tornado.ioloop import IOLoop
+
+from core.assets import write_file
+
+# Icon sprite. Rather than the browser fetching every marker icon in the upload directory separately, all the icons are
+# packed into a single "atlas" image, in a grid of equal-sized square cells. Along with a map of where each icon is in
+# the atlas, this lets the main map load all its marker art in one request. The atlas is built into the asset directory
+# with a hash of its contents in its name, so it can be cached forever, and is rebuilt when the upload directory changes.
+
+# Size of each cell in the atlas, in pixels. Icons are scaled down to fit in this, keeping their aspect ratio, and
+# uploaded icons are shrunk to this size too. This is plenty for a marker on the map, even on a high-resolution screen.
+SPRITE_CELL_SIZE = 120
+# Directory within the asset directory to build the sprite in
+SPRITE_DIR = "sprites"
+# Minimum time between checks of whether the upload directory has changed, in seconds
+SPRITE_CHECK_INTERVAL_SECONDS = 10
+# How long an old atlas is kept after it has been replaced, in seconds. Other server processes carry on using the old
+# one until they next check the upload directory, and pages they have already served refer to it, so it mustn't
+# disappear as soon as a new one is built.
+SPRITE_KEEP_OLD_SECONDS = 3600
+
+
+def get_upload_dir_signature(upload_dir):
+    """Get something that will change if any file in the upload directory is added, removed or changed."""
+
+    signature = []
+    for entry in sorted(os.scandir(upload_dir), key=lambda e: e.name):
+        if entry.is_file():
+            stat = entry.stat()
+            signature.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def build_sprite(upload_dir, build_dir):
+    """Pack every image in the upload directory into an atlas image in the build directory, and return the information
+    the browser needs to use it: the URL of the atlas, and the position of each icon in it. Files that aren't images that
+    Pillow can read are left out."""
+
+    icons = []
+    for filename in sorted(os.listdir(upload_dir)):
+        path = os.path.join(upload_dir, filename)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with Image.open(path) as image:
+                image = image.convert("RGBA")
+                image.thumbnail((SPRITE_CELL_SIZE, SPRITE_CELL_SIZE), Image.Resampling.LANCZOS)
+                icons.append((filename, image))
+        except (OSError, Image.DecompressionBombError):
+            logging.warning("Could not add " + filename + " to the icon sprite, as it is not a valid image.")
+
+    # Lay the icons out in a roughly square grid, each one centred in its cell
+    columns = max(1, math.ceil(math.sqrt(len(icons))))
+    rows = max(1, math.ceil(len(icons) / columns))
+    atlas = Image.new("RGBA", (columns * SPRITE_CELL_SIZE, rows * SPRITE_CELL_SIZE), (0, 0, 0, 0))
+    positions = {}
+    for i, (filename, image) in enumerate(icons):
+        x = (i % columns) * SPRITE_CELL_SIZE + (SPRITE_CELL_SIZE - image.width) // 2
+        y = (i // columns) * SPRITE_CELL_SIZE + (SPRITE_CELL_SIZE - image.height) // 2
+        atlas.paste(image, (x, y))
+        positions[filename] = {"x": x, "y": y, "width": image.width, "height": image.height}
+
+    buffer = io.BytesIO()
+    atlas.save(buffer, format="PNG", optimize=True)
+    content = buffer.getvalue()
+    atlas_path = SPRITE_DIR + "/icons." + hashlib.sha256(content).hexdigest()[:12] + ".png"
+    write_file(os.path.join(build_dir, atlas_path), content)
+
+    # Write the coordinate map alongside, as a record of what was built
+    sprite = {"url": "/assets/" + atlas_path, "icons": positions}
+    map_content = json.dumps(sprite, indent=2, sort_keys=True).encode("utf-8")
+    write_file(os.path.join(build_dir, atlas_path[:-len(".png")] + ".json"), map_content)
+
+    # Mark this atlas as the latest one, even if it was built before, then clean up old ones
+    for path in [atlas_path, atlas_path[:-len(".png")] + ".json"]:
+        os.utime(os.path.join(build_dir, path))
+    remove_old_atlases(os.path.join(build_dir, SPRITE_DIR))
+
+    logging.info("Built icon sprite with " + str(len(positions)) + " icons.")
+    return sprite
+
+
+def remove_old_atlases(sprite_dir):
+    """Remove the atlases in the sprite directory, along with their coordinate maps, that were replaced by a newer one
+    more than SPRITE_KEEP_OLD_SECONDS ago. Each atlas's modification time is when it last became the latest one, so an
+    atlas was replaced at the modification time of the next newest."""
+
+    atlases = []
+    for entry in os.scandir(sprite_dir):
+        if entry.is_file() and entry.name.endswith(".png"):
+            atlases.append((entry.stat().st_mtime, entry.name))
+    atlases.sort(reverse=True)
+
+    cutoff = time.time() - SPRITE_KEEP_OLD_SECONDS
+    for (replaced_at, _), (_, filename) in zip(atlases, atlases[1:]):
+        if replaced_at < cutoff:
+            for delete_filename in [filename, filename[:-len(".png")] + ".json"]:
+                try:
+                    os.remove(os.path.join(sprite_dir, delete_filename))
+                except FileNotFoundError:
+                    pass
+
+
+class IconSprite:
+    """Keeps the icon sprite up to date with the contents of the upload directory."""
+
+    def __init__(self, upload_dir, build_dir):
+        self.upload_dir = upload_dir
+        self.build_dir = build_dir
+        os.makedirs(upload_dir, exist_ok=True)
+        self.signature = get_upload_dir_signature(upload_dir)
+        self.sprite = build_sprite(upload_dir, build_dir)
+        self.last_checked = time.monotonic()
+
+    async def get(self):
+        """Get the information the browser needs to use the sprite (see build_sprite()). If the upload directory has
+        changed since it was built, it is rebuilt first, in a separate thread so the server isn't held up."""
+
+        if time.monotonic() - self.last_checked > SPRITE_CHECK_INTERVAL_SECONDS:
+            self.last_checked = time.monotonic()
+            signature = get_upload_dir_signature(self.upload_dir)
+            if signature != self.signature:
+                await self.rebuild(signature)
+        return self.sprite
+
+    async def rebuild(self, signature=None):
+        """Rebuild the sprite now, e.g. because an icon has just been added."""
+
+        self.signature = signature or get_upload_dir_signature(self.upload_dir)
+        self.sprite = await IOLoop.current().run_in_executor(None, build_sprite, self.upload_dir, self.build_dir)
+        self.last_checked = time.monotonic()
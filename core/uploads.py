@@ -0,0 +1,48 @@
+import io
+import os
+import re
+
+from PIL import Image, ImageOps
+
+from core.assets import write_file
+from core.sprites import SPRITE_CELL_SIZE
+
+# Most pixels an uploaded image may have. The upload size limit doesn't bound how much memory decoding an image takes, as
+# a small compressed file can have a huge number of pixels, so anything bigger than this is refused before it is
+# decoded. This still allows photos from any current camera.
+MAX_UPLOAD_PIXELS = 50_000_000
+
+
+def get_icon_filename(requested_filename):
+    """Turn the name of a file that an admin has uploaded into a safe name to store the icon under, or None if there's
+    nothing usable in it. Icons are always stored as PNGs, whatever format they were uploaded in."""
+
+    name = os.path.splitext(os.path.basename(requested_filename.replace("\\", "/")))[0]
+    name = re.sub(r"[^A-Za-z0-9_-]+", "-", name).strip("-")
+    return name + ".png" if name else None
+
+
+def process_icon(source_path, upload_dir, filename):
+    """Convert an uploaded image into a marker icon: apply any rotation recorded in its EXIF data, shrink it to fit
+    within a cell of the icon sprite, and save it as an optimised PNG in the upload directory, replacing any icon with
+    the same name. This is slow for a large image, so should be run in a separate thread. Raises an OSError if the file
+    isn't an image that Pillow can read, or a DecompressionBombError if it has more than MAX_UPLOAD_PIXELS pixels.
+
+    The image is shrunk before anything else is done to it, so that only the original is ever held in memory at full
+    size. JPEGs are decoded straight to roughly the size needed, so aren't held at full size at all."""
+
+    with Image.open(source_path) as image:
+        # Opening an image only reads its header, so this is checked before any pixels are decoded
+        if image.width * image.height > MAX_UPLOAD_PIXELS:
+            raise Image.DecompressionBombError("Image has " + str(image.width * image.height) + " pixels, more than the "
+                                               + str(MAX_UPLOAD_PIXELS) + " allowed")
+        image.draft("RGB", (SPRITE_CELL_SIZE, SPRITE_CELL_SIZE))
+        # Palette and black and white images can't be resized smoothly, so are converted first
+        if image.mode in ("1", "P"):
+            image = image.convert("RGBA")
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((SPRITE_CELL_SIZE, SPRITE_CELL_SIZE), Image.Resampling.LANCZOS)
+        image = image.convert("RGBA")
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+    write_file(os.path.join(upload_dir, filename), buffer.getvalue(), overwrite=True)
@@ -9,16 +9,24 @@ from core.config import UPLOAD_DIR
 
 TEMP_STATION_NO_EVENT_COLOR = "red"
 TEMP_STATION_NO_EVENT_ICON = "radio.png"
+PERM_STATION_NO_TYPE_COLOR = "blue"
+PERM_STATION_NO_TYPE_ICON = "radio.png"
 
 
 def get_color_for_perm_station(s):
-    """For a given permanent station, look up what colour it should have. This is based on its type."""
-    return s.type.color
+    """For a given permanent station, look up what colour it should have. This is based on its type, if it has one."""
+    if s.type:
+        return s.type.color
+    else:
+        return PERM_STATION_NO_TYPE_COLOR
 
 
 def get_icon_for_perm_station(s):
-    """For a given permanent station, look up what icon it should have. This is based on its type."""
-    return s.type.icon
+    """For a given permanent station, look up what icon it should have. This is based on its type, if it has one."""
+    if s.type:
+        return s.type.icon
+    else:
+        return PERM_STATION_NO_TYPE_ICON
 
 
 def get_color_for_temp_station(s):
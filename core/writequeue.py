@@ -0,0 +1,109 @@
+import asyncio
+import logging
+
+from tornado.ioloop import IOLoop
+from tornado.queues import Queue
+
+from database.instrumentation import current_request_queries
+
+# Group commit for stations submitted by visitors. Each database transaction ends by waiting for the data to be safely
+# written to disk, and SQLite only lets one connection write at a time, so if every submission were its own transaction,
+# only as many submissions could be made per second as the disk can sync, with the rest queueing up for the write lock
+# (and sometimes giving up with "database is locked"). Instead, submissions are put on a queue, and a single writer
+# takes everything waiting on the queue and creates it all in one transaction, so a burst of submissions costs one
+# disk sync rather than one each. Each submission waits for the batch it was in to be committed, then gets its new
+# station's ID and edit password back.
+
+# How long the writer waits after the first submission of a batch for others to join it, in seconds. This is added to
+# the time taken to submit a station, so it is kept short.
+BATCH_WINDOW_SECONDS = 0.005
+# Most stations to create in a single transaction
+MAX_BATCH_SIZE = 100
+
+
+class StationWriteQueue:
+    """Queues up new stations to be created, and creates them in batches"""
+
+    def __init__(self, db):
+        self.db = db
+        self.queue = Queue()
+        self.started = False
+        self.stopping = False
+        # Number of batches and stations written, to show how well submissions are being batched together
+        self.batches = 0
+        self.stations = 0
+
+    def stop(self):
+        """Stop the writer once it has written everything already queued"""
+
+        self.stopping = True
+        self.queue.put_nowait(None)
+
+    async def add_temporary_station(self, **fields):
+        """Queue a new temporary station to be created, with the same arguments as the database's
+        add_temporary_station(), and wait for it to be. Returns a tuple of the new station's ID and edit password, or
+        None if it could not be created."""
+
+        return await self.add("temp", fields)
+
+    async def add_permanent_station(self, **fields):
+        """Queue a new permanent station to be created, with the same arguments as the database's
+        add_permanent_station(), and wait for it to be. Returns a tuple of the new station's ID and edit password, or
+        None if it could not be created."""
+
+        return await self.add("perm", fields)
+
+    async def add(self, station_type, fields):
+        # Once the writer has been told to stop, anything else has to be written straight away
+        if self.stopping:
+            return self.db.add_stations([(station_type, fields)])[0]
+        # The writer is started when it is first needed
+        if not self.started:
+            self.started = True
+            IOLoop.current().spawn_callback(self.run)
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((station_type, fields, future))
+        return await future
+
+    async def run(self):
+        """Write batches of stations until stopped"""
+
+        # The writer is started from within whichever request first submitted a station, so it starts off with that
+        # request's context. Its queries are for many requests' stations at once, so don't charge them all to that one.
+        current_request_queries.set(None)
+        while True:
+            first = await self.queue.get()
+            if first is None:
+                break
+            # Give other submissions that are arriving at the same time a chance to join this batch
+            await asyncio.sleep(BATCH_WINDOW_SECONDS)
+            batch = [first]
+            stop = False
+            while len(batch) < MAX_BATCH_SIZE and self.queue.qsize():
+                item = self.queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self.write(batch)
+            if stop:
+                break
+
+    def write(self, batch):
+        """Create a batch of stations in one transaction, and pass each one's result back to whoever queued it"""
+
+        try:
+            results = self.db.add_stations([(station_type, fields) for station_type, fields, future in batch])
+        except Exception as e:
+            logging.exception("Error when writing a batch of stations")
+            for station_type, fields, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.stations += len(batch)
+        for (station_type, fields, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
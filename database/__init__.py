@@ -1,12 +1,45 @@
+import hashlib
+import logging
+import os
+import secrets
+import time
 from pathlib import Path
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 
 from core.config import DATABASE_DIR
 from .base import Base
-from .models import User, UserSession, Event, TemporaryStation, PermanentStation, Band, Mode, PermanentStationType
+from .coherence import CacheCoherence
+from .instrumentation import QueryInstrumentation
+from .migrations import run_migrations, mark_fully_migrated, MIGRATIONS
+from .models import User, UserSession, Event, TemporaryStation, PermanentStation, Band, Mode, PermanentStationType, \
+    Meta
 from .operations import DatabaseOperations
+from .utils import hash_password
+
+# The SQLite database file
+DATABASE_FILE = os.path.join(DATABASE_DIR, "database.db")
+# Name of the value in the meta table that holds the fingerprint of the schema and default content
+FINGERPRINT_META_NAME = "startup_fingerprint"
+
+
+def get_startup_fingerprint():
+    """Get a hash of everything that setting up the database at startup depends on: the tables, columns and indexes
+    in the models, the migrations, and the default content. If this matches the fingerprint stored in the database by
+    the last startup, the database is already fully set up, and none of the setting up needs to be done again."""
+
+    parts = [str(len(MIGRATIONS))]
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(column.name + " " + str(column.type) + (" NULL" if column.nullable else " NOT NULL")
+                     for column in table.columns)
+        parts.extend(sorted(index.name for index in table.indexes))
+    for model in [PermanentStationType, Band, Mode]:
+        parts.append(repr(model.default_data))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
 
 
 class Database(DatabaseOperations):
@@ -17,23 +50,49 @@ class Database(DatabaseOperations):
         Path(DATABASE_DIR).mkdir(parents=True, exist_ok=True)
 
         # Create DB and session factory
-        self.engine = create_engine('sqlite:///' + DATABASE_DIR + "/database.db")
+        self.engine = create_engine('sqlite:///' + DATABASE_FILE)
         self.SessionLocal = sessionmaker(bind=self.engine)
+        self.instrumentation = QueryInstrumentation(self.engine)
 
         # Initialize parent class with session factory
         super().__init__(self.SessionLocal)
 
-        # Initialize the database
-        self.init_db()
-
-        # Populate with default content
-        self.ensure_default_content()
+        # Set up the tables and default content, unless they are known to be up to date already. This happens every
+        # time a web server process starts, so it is worth keeping quick.
+        start_time = time.perf_counter()
+        fingerprint = get_startup_fingerprint()
+        if self.get_stored_fingerprint() == fingerprint:
+            setup_description = "already up to date"
+        else:
+            # Initialize the database
+            self.init_db()
+            # Populate with default content
+            self.ensure_default_content()
+            self.store_fingerprint(fingerprint)
+            setup_description = "set up schema and default content"
+        setup_time = time.perf_counter() - start_time
+        # There must always be a user to log in with, even if every user has since been deleted, so this is checked
+        # every time
         self.ensure_default_user()
+        logging.info("Database " + setup_description + " in " + str(round(setup_time * 1000, 1)) + " ms, user check "
+                     + str(round((time.perf_counter() - start_time - setup_time) * 1000, 1)) + " ms.")
+
+        # Keep our in-memory caches coherent with changes made by other processes
+        self.coherence = CacheCoherence(self.engine, self.SessionLocal)
+        self.coherence.register([User.__tablename__], self.session_cache.clear)
+        self.coherence.register([UserSession.__tablename__], self.forget_deleted_sessions)
+        self.coherence.register([User.__tablename__], self.forget_insecure_user_present)
 
     def init_db(self):
-        """Initialize database with required tables."""
+        """Initialize database with required tables, and migrate the schema of an existing database if it is older than
+        the current version of the software."""
 
+        new_database = len(inspect(self.engine).get_table_names()) == 0
         Base.metadata.create_all(self.engine)
+        if new_database:
+            mark_fully_migrated(self.engine)
+        else:
+            run_migrations(self.engine)
 
     def ensure_default_content(self):
         """Ensure all default content exists in the database.
@@ -44,6 +103,31 @@ class Database(DatabaseOperations):
             PermanentStationType.initialize(session)
             Band.initialize(session)
             Mode.initialize(session)
+            session.commit()
+        finally:
+            session.close()
+
+    def get_stored_fingerprint(self):
+        """Get the fingerprint stored by the last startup (see get_startup_fingerprint()), or None if there isn't one,
+        e.g. because the database is new."""
+
+        session = self.SessionLocal()
+        try:
+            return session.scalar(select(Meta.value).where(Meta.name == FINGERPRINT_META_NAME))
+        except OperationalError:
+            # The meta table doesn't exist yet
+            return None
+        finally:
+            session.close()
+
+    def store_fingerprint(self, fingerprint):
+        """Store the fingerprint of the schema and default content that the database has just been set up with."""
+
+        session = self.SessionLocal()
+        try:
+            session.execute(insert(Meta).values(name=FINGERPRINT_META_NAME, value=fingerprint).on_conflict_do_update(
+                index_elements=[Meta.name], set_={"value": fingerprint}))
+            session.commit()
         finally:
             session.close()
 
@@ -54,7 +138,9 @@ class Database(DatabaseOperations):
         session = self.SessionLocal()
         try:
             if session.query(User).count() == 0:
-                self.add_user("admin", "password", None, True)
+                # This happens at startup, before the web server is running, so just hash the password here
+                salt = secrets.token_hex(32)
+                self.add_user_with_password_hash("admin", hash_password("password", salt), salt, None, True)
         finally:
             session.close()
 
@@ -0,0 +1,119 @@
+from sqlalchemy import event, text
+
+from .models import CacheGeneration
+
+
+class CacheCoherence:
+    """Keeps in-memory caches coherent when more than one process is using the database. Every transaction that writes
+    to a table also increments that table's generation number in the cache_generations table. Each process holds a
+    dedicated connection on which it checks SQLite's "data_version" pragma, which is very cheap and only changes when
+    another connection has committed something. When it does change, the process reads the generation numbers, works out
+    which tables have been written to, and invalidates only the caches that depend on those tables.
+
+    Writes made by this process change the data version too, as they are made on other connections from the pool. The
+    process keeps its own caches up to date as it makes those writes, so when one of its own transactions commits, the
+    new generation numbers it produced are recorded as already seen, and only writes by other processes cause
+    invalidation."""
+
+    def __init__(self, engine, session_factory):
+        self.engine = engine
+        self.connection = None
+        self.data_version = None
+        self.generations = {}
+        self.listeners = []
+
+        # Increment table generations in the same transaction as the writes themselves
+        event.listen(session_factory, "after_flush", self.after_flush)
+        event.listen(session_factory, "do_orm_execute", self.do_orm_execute)
+        event.listen(session_factory, "after_commit", self.after_commit)
+        event.listen(session_factory, "after_transaction_end", self.after_transaction_end)
+
+    def register(self, table_names, invalidate):
+        """Register a cache that depends on the contents of the named tables. The provided invalidate function is called
+        with no arguments whenever any of them have been changed by another process."""
+
+        self.listeners.append((set(table_names), invalidate))
+
+    def check(self):
+        """Check whether any other connection has committed changes since the last check, and if so, invalidate the
+        caches that depend on the tables that were changed. This is cheap enough to call at the start of every request."""
+
+        if self.connection is None:
+            self.connection = self.engine.raw_connection()
+        cursor = self.connection.cursor()
+        try:
+            data_version = cursor.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                return
+            self.data_version = data_version
+            generations = dict(cursor.execute("SELECT name, generation FROM cache_generations").fetchall())
+        finally:
+            cursor.close()
+
+        changed = {name for name, generation in generations.items() if self.generations.get(name) != generation}
+        self.generations = generations
+        for table_names, invalidate in self.listeners:
+            if table_names & changed:
+                invalidate()
+
+    @staticmethod
+    def bump(session, table_names):
+        """Increment the generation numbers of the named tables, as part of the session's current transaction. The new
+        generation numbers, and how many times each table has been bumped in this transaction, are noted in the session
+        so that the process can recognise its own writes once they are committed."""
+
+        table_names = sorted(table_names)
+        if not table_names:
+            return
+        # Done in a single statement, however many tables there are
+        names = {"name" + str(i): name for i, name in enumerate(table_names)}
+        values = ", ".join("(:" + key + ", 1)" for key in names)
+        connection = session.connection()
+        connection.execute(
+            text("INSERT INTO " + CacheGeneration.__tablename__ + " (name, generation) VALUES " + values + " "
+                 "ON CONFLICT(name) DO UPDATE SET generation = generation + 1"), names)
+        # This transaction holds the database's write lock, so no other process can bump these in the meantime
+        generations = connection.execute(
+            text("SELECT name, generation FROM " + CacheGeneration.__tablename__ + " WHERE name IN ("
+                 + ", ".join(":" + key for key in names) + ")"), names).fetchall()
+        bumps = session.info.setdefault("cache_generation_bumps", {})
+        for name, generation in generations:
+            bumps[name] = (bumps.get(name, (0, None))[0] + 1, generation)
+
+    def after_flush(self, session, flush_context):
+        """Session event handler, which bumps the generations of every table with objects added, changed or deleted in
+        this flush"""
+
+        table_names = {obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)}
+        self.bump(session, table_names)
+
+    def do_orm_execute(self, orm_execute_state):
+        """Session event handler, which bumps the generation of the table targeted by a bulk UPDATE or DELETE, as these
+        don't go through a flush"""
+
+        if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper:
+            self.bump(orm_execute_state.session, [orm_execute_state.bind_mapper.local_table.name])
+
+    def after_commit(self, session):
+        """Session event handler, which records the generation numbers produced by this process's own committed writes
+        as seen, so that they don't invalidate its caches. If another process had also written to a table since it was
+        last checked, the generation number won't follow on from the one last seen, so that table is still treated as
+        changed."""
+
+        for name, (count, generation) in session.info.pop("cache_generation_bumps", {}).items():
+            if self.generations.get(name, 0) == generation - count:
+                self.generations[name] = generation
+
+    @staticmethod
+    def after_transaction_end(session, transaction):
+        """Session event handler, which forgets the generation numbers of a transaction that was rolled back"""
+
+        if transaction.parent is None:
+            session.info.pop("cache_generation_bumps", None)
+
+    def close(self):
+        """Close the dedicated connection"""
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
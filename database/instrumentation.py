@@ -0,0 +1,114 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from core.config import QUERY_COUNT_BUDGET, QUERY_TIME_BUDGET_MS, SLOW_QUERY_MS, SLOW_QUERY_LOG
+
+# If the same statement is run at least this many times in one request, with different parameters, it's probably being
+# run once per item of some list (an "N+1" problem), and could be replaced by a single query.
+N_PLUS_ONE_THRESHOLD = 5
+
+# The RequestQueryLog of the request currently being handled, if any. Web server requests are each handled in their own
+# asyncio task, which has its own copy of this, so every statement is attributed to the request that caused it.
+current_request_queries = ContextVar("current_request_queries", default=None)
+
+# Slow statements are logged separately from the main log, along with their query plans
+slow_query_logger = logging.getLogger("youthmap.slowqueries")
+
+
+class RequestQueryLog:
+    """Counts and times the SQL statements run while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # For each distinct statement, the number of times it was run and (up to a point) the different parameters
+        self.statements = {}
+
+    def record(self, statement, parameters, duration):
+        self.count += 1
+        self.duration += duration
+        entry = self.statements.get(statement)
+        if entry is None:
+            entry = self.statements[statement] = [0, set()]
+        entry[0] += 1
+        if len(entry[1]) < N_PLUS_ONE_THRESHOLD:
+            entry[1].add(repr(parameters))
+
+    def report(self, description):
+        """Log a warning if the request ran more queries, or spent longer on them, than it should have, and for each
+        statement that looks like it was run once per item of a list. The description of the request is included in
+        the log messages, e.g. "GET /admin/stations (AdminStationsHandler)"."""
+
+        duration_ms = self.duration * 1000
+        if self.count > QUERY_COUNT_BUDGET or duration_ms > QUERY_TIME_BUDGET_MS:
+            logging.warning(description + " ran " + str(self.count) + " database queries, taking "
+                            + "{:.1f}".format(duration_ms) + " ms.")
+        for statement, (count, parameters) in self.statements.items():
+            if count >= N_PLUS_ONE_THRESHOLD and len(parameters) > 1:
+                logging.warning(description + " ran the same query " + str(count)
+                                + " times with different parameters, which may be an N+1 problem: "
+                                + " ".join(statement.split()))
+
+
+def setup_slow_query_log():
+    """Send the slow query log to its own file, if that hasn't already been done"""
+
+    if not slow_query_logger.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG, delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.INFO)
+        slow_query_logger.propagate = False
+
+
+class QueryInstrumentation:
+    """Times every SQL statement run on the engine. Each statement is attributed to the current request, if there is
+    one; statements that take longer than the slow query threshold are written to the slow query log along with SQLite's
+    plan for them; and the statement, its parameters and the time it took are passed to each registered listener.
+    Listeners are called on the thread that ran the statement, so must be quick."""
+
+    def __init__(self, engine):
+        self.listeners = []
+        setup_slow_query_log()
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def add_listener(self, listener):
+        """Add a function to be called as listener(statement, parameters, duration) after every statement."""
+
+        self.listeners.append(listener)
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_start_time = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.query_start_time
+        request_queries = current_request_queries.get()
+        if request_queries is not None:
+            request_queries.record(statement, parameters, duration)
+        if duration * 1000 > SLOW_QUERY_MS:
+            self.log_slow_query(conn, statement, parameters, duration, executemany)
+        for listener in self.listeners:
+            listener(statement, parameters, duration)
+
+    @staticmethod
+    def log_slow_query(conn, statement, parameters, duration, executemany):
+        """Write a slow statement to the slow query log, along with SQLite's plan for it."""
+
+        message = "{:.1f}".format(duration * 1000) + " ms: " + " ".join(statement.split()) + " " + repr(parameters)
+        # The plan is fetched on a separate cursor of the same connection, directly rather than through SQLAlchemy so
+        # that it isn't itself instrumented. It can't be fetched for a statement run with many sets of parameters.
+        if not executemany:
+            cursor = conn.connection.cursor()
+            try:
+                plan = cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                message += "".join("\n    " + str(row[-1]) for row in plan)
+            except Exception as e:
+                message += "\n    (Could not get query plan: " + str(e) + ")"
+            finally:
+                cursor.close()
+        slow_query_logger.info(message)
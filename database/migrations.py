@@ -0,0 +1,114 @@
+import logging
+
+from sqlalchemy import text
+
+
+# Schema migrations. Creating tables that don't exist yet is handled by SQLAlchemy's create_all(), but it will not
+# modify tables that already exist, so any change to an existing table needs a migration function here that brings an
+# older database up to date. The database's schema version is stored in SQLite's "user_version" pragma, and is the
+# number of migrations in the list below that have been applied to it. A brand-new database is created with the latest
+# schema, so it is marked as having had all migrations applied without running any of them.
+
+
+def migrate_coordinates_to_microdegrees(connection):
+    """Station coordinates used to be stored as Numeric columns of degrees, which SQLAlchemy converts to and from
+    Decimal objects. Replace them with integer columns of millionths of a degree, backfilled from the old columns."""
+
+    for table in ["temporary_stations", "permanent_stations"]:
+        for axis in ["latitude", "longitude"]:
+            columns = get_column_names(connection, table)
+            if axis + "_microdegrees" not in columns:
+                connection.execute(text("ALTER TABLE " + table + " ADD COLUMN " + axis
+                                        + "_microdegrees INTEGER NOT NULL DEFAULT 0"))
+            if axis + "_degrees" in columns:
+                connection.execute(text("UPDATE " + table + " SET " + axis + "_microdegrees = CAST(ROUND(" + axis
+                                        + "_degrees * 1000000) AS INTEGER)"))
+                connection.execute(text("ALTER TABLE " + table + " DROP COLUMN " + axis + "_degrees"))
+
+
+def add_session_expiry_index(connection):
+    """Index the expiry time of user sessions, so that expired sessions can be found without a full table scan."""
+
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)"))
+
+
+def add_updated_at_columns(connection):
+    """Add an updated_at column to the tables whose public pages are cached. Existing rows are marked as updated now, so
+    that nothing cached from before the migration is considered up to date."""
+
+    for table in ["events", "temporary_stations", "permanent_stations", "permanent_station_types"]:
+        if "updated_at" not in get_column_names(connection, table):
+            connection.execute(text("ALTER TABLE " + table
+                                    + " ADD COLUMN updated_at DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00.000000'"))
+            # This is the same format, and local time, that SQLAlchemy uses for datetime.now()
+            connection.execute(text("UPDATE " + table
+                                    + " SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now', 'localtime')"))
+
+
+def add_station_approved_indexes(connection):
+    """Index the approved flag of stations, so that the moderation queue can find stations awaiting approval without a
+    full table scan."""
+
+    for table in ["temporary_stations", "permanent_stations"]:
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_" + table + "_approved ON " + table + " (approved)"))
+
+
+def add_station_list_indexes(connection):
+    """Index stations in the order that the admin station lists are paged through, so that each page can be read from
+    the index rather than sorting the whole table. (The user list is already covered by the unique index on username,
+    as SQLite includes each row's ID at the end of every index.)"""
+
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_temporary_stations_start_time_id "
+                            "ON temporary_stations (start_time, id)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_permanent_stations_type_id_callsign_id "
+                            "ON permanent_stations (type_id, callsign, id)"))
+
+
+def get_column_names(connection, table):
+    """Get the names of the columns that currently exist in a table. SQLite does not run schema changes such as ALTER
+    TABLE inside the surrounding transaction, so migrations use this to check what has already been done, which means
+    an interrupted migration can be safely re-run."""
+
+    return [row[1] for row in connection.execute(text("PRAGMA table_info(" + table + ")"))]
+
+
+# All migrations, in the order they must be applied. Only ever add to the end of this list.
+MIGRATIONS = [
+    migrate_coordinates_to_microdegrees,
+    add_session_expiry_index,
+    add_updated_at_columns,
+    add_station_approved_indexes,
+    add_station_list_indexes
+]
+
+
+def get_schema_version(connection):
+    """Get the number of migrations that have been applied to the database."""
+
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def set_schema_version(connection, version):
+    """Set the number of migrations that have been applied to the database."""
+
+    connection.execute(text("PRAGMA user_version = " + str(int(version))))
+
+
+def mark_fully_migrated(engine):
+    """Mark a newly created database, which already has the latest schema, as having had all migrations applied."""
+
+    with engine.begin() as connection:
+        set_schema_version(connection, len(MIGRATIONS))
+
+
+def run_migrations(engine):
+    """Apply any migrations that the database hasn't had yet, updating the schema version after each one."""
+
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+
+    for i in range(version, len(MIGRATIONS)):
+        logging.info("Migrating database schema: " + MIGRATIONS[i].__name__ + "...")
+        with engine.begin() as connection:
+            MIGRATIONS[i](connection)
+            set_schema_version(connection, i + 1)
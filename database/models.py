@@ -1,10 +1,59 @@
 from datetime import datetime, timedelta
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 
 from .base import Base, temporary_station_bands, temporary_station_modes, event_bands, event_modes
 
+# How long a user session lasts after it was created, or after it was last renewed
+SESSION_LIFETIME = timedelta(hours=24)
+
+# Station coordinates are stored as integer numbers of millionths of a degree (roughly 10 cm), rather than as decimals
+MICRODEGREES_PER_DEGREE = 1000000
+
+
+def insert_default_rows(session, model, rows):
+    """Add any of the given rows that aren't already in a model's table, matching them up by name, in a single
+    statement. Used to set up the enum-like tables such as bands and modes. Existing rows are left as they are."""
+
+    session.execute(insert(model).on_conflict_do_nothing(index_elements=["name"]), rows)
+
+
+class CoordinatesMixin:
+    """Mixin for models that have a latitude and longitude. These are stored as integer microdegrees, so they are native
+    numbers to SQLite and can be read without any Decimal conversion, but latitude_degrees and longitude_degrees
+    properties are provided to get and set them as float degrees like any other column."""
+
+    latitude_microdegrees = Column(Integer, nullable=False)
+    longitude_microdegrees = Column(Integer, nullable=False)
+
+    @hybrid_property
+    def latitude_degrees(self):
+        return self.latitude_microdegrees / MICRODEGREES_PER_DEGREE
+
+    @latitude_degrees.inplace.setter
+    def _latitude_degrees_setter(self, value):
+        self.latitude_microdegrees = round(float(value) * MICRODEGREES_PER_DEGREE)
+
+    @hybrid_property
+    def longitude_degrees(self):
+        return self.longitude_microdegrees / MICRODEGREES_PER_DEGREE
+
+    @longitude_degrees.inplace.setter
+    def _longitude_degrees_setter(self, value):
+        self.longitude_microdegrees = round(float(value) * MICRODEGREES_PER_DEGREE)
+
+
+class UpdatedAtMixin:
+    """Mixin for models whose public pages are cached. The updated_at column records when the row was last changed, which
+    is used as its version number when deciding whether a cached page is still valid. It is set automatically whenever a
+    column of the row is updated, and the update methods in operations.py also set it when only the row's relationships
+    (such as its bands and modes) have changed."""
+
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
 
 class User(Base):
     """User model. Stores their username, encrypted password, email address, super-admin status etc."""
@@ -32,14 +81,14 @@ class UserSession(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_token = Column(String, unique=True, nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
-    expires_at = Column(DateTime, default=datetime.now() + timedelta(hours=24))
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, default=lambda: datetime.now() + SESSION_LIFETIME, index=True)
 
     # Link the sessions with the users, so we can find the user that owns this session.
     user = relationship('User', back_populates='sessions')
 
 
-class PermanentStationType(Base):
+class PermanentStationType(UpdatedAtMixin, Base):
     """Permanent station type model. Stores information on the School, University and Cadet types of permanent station."""
 
     __tablename__ = 'permanent_station_types'
@@ -62,11 +111,7 @@ class PermanentStationType(Base):
     def initialize(cls, session):
         """Initialize the database with the station types if they don't exist"""
 
-        for station_type in cls.default_data:
-            existing = session.query(cls).filter_by(name=station_type["name"]).first()
-            if not existing:
-                session.add(cls(name=station_type["name"], icon=station_type["icon"], color=station_type["color"]))
-        session.commit()
+        insert_default_rows(session, cls, cls.default_data)
 
 
 class Band(Base):
@@ -89,11 +134,7 @@ class Band(Base):
     def initialize(cls, session):
         """Initialize the database with the band names if they don't exist"""
 
-        for band in cls.default_data:
-            existing = session.query(cls).filter_by(name=band).first()
-            if not existing:
-                session.add(cls(name=band))
-        session.commit()
+        insert_default_rows(session, cls, [{"name": band} for band in cls.default_data])
 
 
 class Mode(Base):
@@ -115,14 +156,10 @@ class Mode(Base):
     def initialize(cls, session):
         """Initialize the database with the mode names if they don't exist"""
 
-        for mode in cls.default_data:
-            existing = session.query(cls).filter_by(name=mode).first()
-            if not existing:
-                session.add(cls(name=mode))
-        session.commit()
+        insert_default_rows(session, cls, [{"name": mode} for mode in cls.default_data])
 
 
-class Event(Base):
+class Event(UpdatedAtMixin, Base):
     """Event model. An event represents something like 'JOTA' or 'Field Day' to which temporary stations can be assigned."""
 
     __tablename__ = 'events'
@@ -147,11 +184,13 @@ class Event(Base):
     modes = relationship('Mode', secondary=event_modes, back_populates='events')
 
 
-class TemporaryStation(Base):
+class TemporaryStation(CoordinatesMixin, UpdatedAtMixin, Base):
     """Temporary Station model. A temporary station represents an amateur radio station that is taking part in event,
     or, if no event is assigned, then it is a generic Special Event Station for an event that is not known to the system."""
 
     __tablename__ = 'temporary_stations'
+    # Matches the order of the admin station list, so that each page of it can be read straight from the index
+    __table_args__ = (Index("ix_temporary_stations_start_time_id", "start_time", "id"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     callsign = Column(String, nullable=False)
@@ -159,8 +198,6 @@ class TemporaryStation(Base):
     event_id = Column(Integer, ForeignKey('events.id'), nullable=True)
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=False)
-    latitude_degrees = Column(Numeric, nullable=False)
-    longitude_degrees = Column(Numeric, nullable=False)
     notes = Column(String, nullable=True)
     website_url = Column(String, nullable=True)
     email = Column(String, nullable=True)
@@ -168,7 +205,7 @@ class TemporaryStation(Base):
     qrz_url = Column(String, nullable=True)
     social_media_url = Column(String, nullable=True)
     rsgb_attending = Column(Boolean, nullable=False)
-    approved = Column(Boolean, nullable=False)
+    approved = Column(Boolean, nullable=False, index=True)
     edit_password = Column(String, nullable=False)
 
     # Link the temporary station to the event it is for.
@@ -178,18 +215,18 @@ class TemporaryStation(Base):
     modes = relationship('Mode', secondary=temporary_station_modes, back_populates='temporary_stations')
 
 
-class PermanentStation(Base):
+class PermanentStation(CoordinatesMixin, UpdatedAtMixin, Base):
     """Permanent Station model. This represents an amateur radio station permanently based at a school, university or
     cadet base."""
 
     __tablename__ = 'permanent_stations'
+    # Matches the order of the admin station list, so that each page of it can be read straight from the index
+    __table_args__ = (Index("ix_permanent_stations_type_id_callsign_id", "type_id", "callsign", "id"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     callsign = Column(String, nullable=False)
     club_name = Column(String, nullable=False)
     type_id = Column(Integer, ForeignKey('permanent_station_types.id'), nullable=True)
-    latitude_degrees = Column(Numeric, nullable=False)
-    longitude_degrees = Column(Numeric, nullable=False)
     meeting_when = Column(String, nullable=False)
     meeting_where = Column(String, nullable=False)
     notes = Column(String, nullable=True)
@@ -198,8 +235,28 @@ class PermanentStation(Base):
     phone_number = Column(String, nullable=True)
     qrz_url = Column(String, nullable=True)
     social_media_url = Column(String, nullable=True)
-    approved = Column(Boolean, nullable=False)
+    approved = Column(Boolean, nullable=False, index=True)
     edit_password = Column(String, nullable=False)
 
     # Link the permanent station to its type.
     type = relationship('PermanentStationType', back_populates='stations')
+
+
+class CacheGeneration(Base):
+    """Cache generation model. Stores a number for each table that is incremented whenever the table is written to, so
+    that each web server process can tell which of its in-memory caches another process has made stale."""
+
+    __tablename__ = 'cache_generations'
+
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False)
+
+
+class Meta(Base):
+    """Meta model. Stores named values about the database itself, such as the fingerprint of the schema and default
+    content it was last set up with."""
+
+    __tablename__ = 'meta'
+
+    name = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
@@ -2,16 +2,25 @@ import logging
 import secrets
 from datetime import datetime
 
+from sqlalchemy import func, case, delete, tuple_
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
+from .base import temporary_station_bands, temporary_station_modes
 from .models import (
     User, UserSession,
     Event,
     TemporaryStation, PermanentStation,
-    Band, Mode, PermanentStationType
+    Band, Mode, PermanentStationType,
+    MICRODEGREES_PER_DEGREE, SESSION_LIFETIME
 )
-from .utils import hash_password, generate_password
+from .projections import (
+    EventListItem, EventChoice, UserListItem, TemporaryStationListItem, PermanentStationListItem,
+    EventSummary, StationTypeSummary, BandSummary, ModeSummary,
+    MapPermanentStation, MapTemporaryStation, PendingTemporaryStation, PendingPermanentStation
+)
+from .sessioncache import SessionTokenCache
+from .utils import hash_password_async, generate_password, PasswordHashQueueFull
 
 
 class DatabaseOperations:
@@ -20,14 +29,26 @@ class DatabaseOperations:
     def __init__(self, session_factory):
         """Initialize with a SQLAlchemy session factory"""
         self.SessionLocal = session_factory
+        self.session_cache = SessionTokenCache()
+        # Whether the insecure default admin user is present. This is worked out when first needed, and then only again
+        # if a user is added, deleted, renamed or has their password changed. The generation counts how many times it
+        # has been forgotten, so that a check that was in progress at the time doesn't store an out of date answer.
+        self.insecure_user_present = None
+        self.insecure_user_generation = 0
 
-    def add_user(self, username, password, email, super_admin):
-        """Create a new user"""
+    async def add_user(self, username, password, email, super_admin):
+        """Create a new user. Returns the user ID if one was created."""
 
         # Create a new salt and hash the password with it so we have something safe to store
         salt = secrets.token_hex(32)
-        password_hash = hash_password(password, salt)
+        password_hash = await hash_password_async(password, salt)
+        return self.add_user_with_password_hash(username, password_hash, salt, email, super_admin)
+
+    def add_user_with_password_hash(self, username, password_hash, salt, email, super_admin):
+        """Create a new user, given a password that has already been hashed with the given salt. Returns the user ID if
+        one was created."""
 
+        self.forget_insecure_user_present()
         session = self.SessionLocal()
         try:
             # Store the new user info in the database.
@@ -53,7 +74,7 @@ class DatabaseOperations:
 
         session = self.SessionLocal()
         try:
-            return session.query(User).options(joinedload(User.sessions)).filter_by(id=user_id).first()
+            return session.query(User).filter_by(id=user_id).first()
         finally:
             session.close()
 
@@ -62,13 +83,39 @@ class DatabaseOperations:
 
         session = self.SessionLocal()
         try:
-            return session.query(User).options(joinedload(User.sessions)).all()
+            return session.query(User).options(selectinload(User.sessions)).all()
+        finally:
+            session.close()
+
+    def get_user_list(self, limit=None, after_username=None, after_id=None):
+        """Get the basic details of users, sorted by username, for the admin user list. This supports keyset
+        pagination: provide a limit to get at most that many users, and the username and ID of the last user on the
+        previous page to continue from there. Returns a list of UserListItem rows."""
+
+        session = self.SessionLocal()
+        try:
+            query = session.query(User.id, User.username, User.super_admin)
+            if after_username is not None and after_id is not None:
+                query = query.filter(tuple_(User.username, User.id) > tuple_(after_username, after_id))
+            query = query.order_by(User.username, User.id)
+            if limit is not None:
+                query = query.limit(limit)
+            return [UserListItem(*row) for row in query.all()]
         finally:
             session.close()
 
-    def update_user(self, user_id, username=None, password=None, email=None, super_admin=None):
+    async def update_user(self, user_id, username=None, password=None, email=None, super_admin=None):
         """Update an existing user. Only provided fields will be updated. Returns True if successful."""
 
+        # If we have a new password, create a new salt and hash the password with it
+        salt = None
+        password_hash = None
+        if password is not None:
+            salt = secrets.token_hex(32)
+            password_hash = await hash_password_async(password, salt)
+        if username is not None or password is not None:
+            self.forget_insecure_user_present()
+
         session = self.SessionLocal()
         try:
             user = session.query(User).filter_by(id=user_id).first()
@@ -77,11 +124,9 @@ class DatabaseOperations:
 
             if username is not None:
                 user.username = username
-            if password is not None:
-                # Create a new salt and hash the password
-                salt = secrets.token_hex(32)
+            if password_hash is not None:
                 user.salt = salt
-                user.password_hash = hash_password(password, salt)
+                user.password_hash = password_hash
             if email is not None:
                 user.email = email
             if super_admin is not None:
@@ -110,6 +155,10 @@ class DatabaseOperations:
             # ensures that any sessions belonging to the user will automatically be deleted.
             session.delete(user)
             session.commit()
+
+            # Make sure the user's sessions can't still be used via the cache
+            self.session_cache.invalidate_user(user_id)
+            self.forget_insecure_user_present()
             return True
         except IntegrityError as e:
             logging.error("Error when deleting user", e)
@@ -118,7 +167,7 @@ class DatabaseOperations:
         finally:
             session.close()
 
-    def verify_user(self, username, password):
+    async def verify_user(self, username, password):
         """Verify user credentials. If successful, the user ID is returned. Otherwise, None is returned."""
 
         session = self.SessionLocal()
@@ -127,21 +176,41 @@ class DatabaseOperations:
             user = session.query(User).filter_by(username=username).first()
             if not user:
                 return None
-
-            # Get the stored salt for the user, and hash the provided password with it
-            password_hash = hash_password(password, user.salt)
-
-            # If the hashes match, the password was correct and we can log in
-            if password_hash == user.password_hash:
-                return user.id
-            return None
+            user_id, salt, stored_password_hash = user.id, user.salt, user.password_hash
         finally:
             session.close()
 
-    def is_insecure_user_present(self):
+        # Hash the provided password with the stored salt for the user
+        password_hash = await hash_password_async(password, salt)
+
+        # If the hashes match, the password was correct and we can log in
+        if password_hash == stored_password_hash:
+            return user_id
+        return None
+
+    def forget_insecure_user_present(self):
+        """Forget whether the insecure default admin user is present, so it is worked out again next time it's needed."""
+
+        self.insecure_user_present = None
+        self.insecure_user_generation += 1
+
+    async def is_insecure_user_present(self):
         """Returns true if the users table contains an entry with username 'admin' and password 'password'. Used to
-        show a warning in the UI."""
-        return self.verify_user('admin', 'password') is not None
+        show a warning in the UI. The result is remembered until the users are next changed. If too many password hashes
+        are already waiting to be processed, e.g. during a flood of login attempts, this isn't checked, and False is
+        returned so the page can still be shown without the warning."""
+
+        if self.insecure_user_present is not None:
+            return self.insecure_user_present
+        generation = self.insecure_user_generation
+        try:
+            insecure_user_present = await self.verify_user('admin', 'password') is not None
+        except PasswordHashQueueFull:
+            return False
+        # Only remember the answer if the users weren't changed while it was being worked out
+        if generation == self.insecure_user_generation:
+            self.insecure_user_present = insecure_user_present
+        return insecure_user_present
 
     def create_user_session(self, user_id):
         """Create a session token for a user. This can then be provided back and verified to ensure they are logged in."""
@@ -170,19 +239,83 @@ class DatabaseOperations:
             session.close()
 
     def verify_user_session_token(self, session_token):
-        """Verify session token is valid and not expired. Return the user ID if valid, otherwise None."""
+        """Verify session token is valid and not expired. Return the user ID if valid, otherwise None. Tokens that have
+        been validated are cached in memory, so the database is only queried the first time a token is seen. Sessions
+        have a sliding expiry: once a session in use has less than half its lifetime left, it is renewed for a full
+        lifetime. This is only written back to the database at that point, not on every request."""
+
+        now = datetime.now()
+        cached = self.session_cache.get(session_token, now)
+        if not cached:
+            session = self.SessionLocal()
+            try:
+                user_session = session.query(UserSession).filter(
+                    UserSession.session_token == session_token,
+                    UserSession.expires_at > now
+                ).first()
+                if not user_session:
+                    return None
+                cached = self.session_cache.put(session_token, user_session.user_id, user_session.expires_at)
+            finally:
+                session.close()
+
+        if cached.expires_at - now < SESSION_LIFETIME / 2:
+            self.renew_user_session(session_token, now + SESSION_LIFETIME)
+            cached.expires_at = now + SESSION_LIFETIME
+
+        return cached.user_id
+
+    def renew_user_session(self, session_token, expires_at):
+        """Set a new expiry time for a session token. Returns True if successful."""
 
         session = self.SessionLocal()
         try:
-            user_session = session.query(UserSession).filter(
-                UserSession.session_token == session_token,
-                UserSession.expires_at > datetime.now()
-            ).first()
+            session.query(UserSession).filter(UserSession.session_token == session_token).update(
+                {UserSession.expires_at: expires_at})
+            session.commit()
+            return True
+        except IntegrityError as e:
+            logging.error("Error when renewing session", e)
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    def delete_user_session(self, session_token):
+        """Delete a session token, e.g. when the user logs out, so that it can no longer be used. Returns True if
+        successful."""
 
-            return user_session.user_id if user_session else None
+        self.session_cache.invalidate(session_token)
+        session = self.SessionLocal()
+        try:
+            session.query(UserSession).filter(UserSession.session_token == session_token).delete()
+            session.commit()
+            return True
+        except IntegrityError as e:
+            logging.error("Error when deleting session", e)
+            session.rollback()
+            return False
         finally:
             session.close()
 
+    def forget_deleted_sessions(self):
+        """Remove session tokens from the cache whose sessions have been deleted from the database, e.g. because the
+        user logged out in another process. Tokens whose sessions still exist stay cached. (Sessions that have expired
+        don't need to be looked for, as the cache already knows when each one expires.)"""
+
+        cached_tokens = list(self.session_cache.entries)
+        if not cached_tokens:
+            return
+        session = self.SessionLocal()
+        try:
+            existing_tokens = {row.session_token for row in session.query(UserSession.session_token).filter(
+                UserSession.session_token.in_(cached_tokens))}
+        finally:
+            session.close()
+        for session_token in cached_tokens:
+            if session_token not in existing_tokens:
+                self.session_cache.invalidate(session_token)
+
     def cleanup_expired_sessions(self):
         """Housekeeping method to delete all expired sessions from the database. Returns True if successful, False otherwise."""
 
@@ -204,7 +337,7 @@ class DatabaseOperations:
 
         session = self.SessionLocal()
         try:
-            return session.query(PermanentStationType).options(joinedload(PermanentStationType.stations)).filter_by(
+            return session.query(PermanentStationType).options(selectinload(PermanentStationType.stations)).filter_by(
                 id=type_id).first()
         finally:
             session.close()
@@ -249,8 +382,8 @@ class DatabaseOperations:
 
         session = self.SessionLocal()
         try:
-            return session.query(Event).options(joinedload(Event.stations), joinedload(Event.bands),
-                                                joinedload(Event.modes)).filter_by(id=event_id).first()
+            return session.query(Event).options(selectinload(Event.stations), selectinload(Event.bands),
+                                                selectinload(Event.modes)).filter_by(id=event_id).first()
         finally:
             session.close()
 
@@ -259,8 +392,33 @@ class DatabaseOperations:
 
         session = self.SessionLocal()
         try:
-            return session.query(Event).options(joinedload(Event.stations), joinedload(Event.bands),
-                                                joinedload(Event.modes)).all()
+            return session.query(Event).options(selectinload(Event.stations), selectinload(Event.bands),
+                                                selectinload(Event.modes)).all()
+        finally:
+            session.close()
+
+    def get_event_list(self):
+        """Get the basic details of all events, sorted by start time, for the admin event list. The number of temporary
+        stations at each event is counted by the database rather than by loading the stations. Returns a list of
+        EventListItem rows."""
+
+        session = self.SessionLocal()
+        try:
+            rows = session.query(Event.id, Event.name, Event.start_time, Event.end_time,
+                                 func.count(TemporaryStation.id)).outerjoin(Event.stations).group_by(Event.id).order_by(
+                Event.start_time).all()
+            return [EventListItem(*row) for row in rows]
+        finally:
+            session.close()
+
+    def get_event_choices(self):
+        """Get the ID and name of all events, sorted by start time, for use in drop-down lists. Returns a list of
+        EventChoice rows."""
+
+        session = self.SessionLocal()
+        try:
+            return [EventChoice(*row) for row in
+                    session.query(Event.id, Event.name).order_by(Event.start_time).all()]
         finally:
             session.close()
 
@@ -301,6 +459,8 @@ class DatabaseOperations:
                 modes = [session.query(Mode).filter_by(id=id).first() for id in mode_ids]
                 event.modes.clear()
                 event.modes.extend(modes)
+            # Set explicitly, as changing only the bands or modes doesn't update the row itself
+            event.updated_at = datetime.now()
 
             session.commit()
             return True
@@ -406,20 +566,33 @@ class DatabaseOperations:
         session = self.SessionLocal()
         try:
             return session.query(TemporaryStation).options(joinedload(TemporaryStation.event),
-                                                           joinedload(TemporaryStation.bands),
-                                                           joinedload(TemporaryStation.modes)).filter_by(
+                                                           selectinload(TemporaryStation.bands),
+                                                           selectinload(TemporaryStation.modes)).filter_by(
                 id=station_id).first()
         finally:
             session.close()
 
+    def get_temporary_station_version(self, station_id):
+        """Get the version of a temporary station's public page, which changes whenever the station or its event is
+        updated. Returns a tuple of the station's and event's updated_at times (the latter being None if the station has
+        no event), or None if the station doesn't exist."""
+
+        session = self.SessionLocal()
+        try:
+            row = session.query(TemporaryStation.updated_at, Event.updated_at).outerjoin(
+                Event, TemporaryStation.event_id == Event.id).filter(TemporaryStation.id == station_id).first()
+            return tuple(row) if row else None
+        finally:
+            session.close()
+
     def get_all_temporary_stations(self):
         """Get all temporary stations. Returns a list of TemporaryStation objects."""
 
         session = self.SessionLocal()
         try:
             return session.query(TemporaryStation).options(
-                joinedload(TemporaryStation.event), joinedload(TemporaryStation.bands),
-                joinedload(TemporaryStation.modes)).all()
+                joinedload(TemporaryStation.event), selectinload(TemporaryStation.bands),
+                selectinload(TemporaryStation.modes)).all()
         finally:
             session.close()
 
@@ -429,12 +602,93 @@ class DatabaseOperations:
         session = self.SessionLocal()
         try:
             return session.query(TemporaryStation).options(joinedload(TemporaryStation.event),
-                                                           joinedload(TemporaryStation.bands),
-                                                           joinedload(TemporaryStation.modes)).filter_by(
+                                                           selectinload(TemporaryStation.bands),
+                                                           selectinload(TemporaryStation.modes)).filter_by(
                 event_id=event_id).all()
         finally:
             session.close()
 
+    @staticmethod
+    def temporary_station_bucket(now):
+        """SQL expression that sorts temporary stations into "Past", "Current" and "Future" buckets relative to the
+        provided time, so that the bucketing can be done by the database rather than in Python."""
+
+        return case((TemporaryStation.end_time < now, "Past"), (TemporaryStation.start_time > now, "Future"),
+                    else_="Current")
+
+    def count_temporary_stations_by_bucket(self, now):
+        """Count the temporary stations that are in the past, current or in the future relative to the provided time.
+        Returns a dict of bucket name to count. Buckets with no stations in them are not included."""
+
+        session = self.SessionLocal()
+        try:
+            bucket = self.temporary_station_bucket(now)
+            return dict(session.query(bucket, func.count(TemporaryStation.id)).group_by(bucket).all())
+        finally:
+            session.close()
+
+    def get_temporary_station_list(self, bucket_name, now, limit=None, after_start_time=None, after_id=None):
+        """Get the basic details of temporary stations in a "Past", "Current" or "Future" bucket relative to the
+        provided time, sorted by start time, for the admin station list. This supports keyset pagination: provide a
+        limit to get at most that many stations, and the start time and ID of the last station on the previous page to
+        continue from there. Returns a list of TemporaryStationListItem rows."""
+
+        session = self.SessionLocal()
+        try:
+            query = session.query(TemporaryStation.id, TemporaryStation.callsign, TemporaryStation.club_name,
+                                  TemporaryStation.start_time, TemporaryStation.end_time, Event.name).outerjoin(
+                TemporaryStation.event).filter(self.temporary_station_bucket(now) == bucket_name)
+            if after_start_time is not None and after_id is not None:
+                query = query.filter(tuple_(TemporaryStation.start_time, TemporaryStation.id)
+                                     > tuple_(after_start_time, after_id))
+            query = query.order_by(TemporaryStation.start_time, TemporaryStation.id)
+            if limit is not None:
+                query = query.limit(limit)
+            return [TemporaryStationListItem(*row) for row in query.all()]
+        finally:
+            session.close()
+
+    def get_temporary_stations_for_map(self):
+        """Get all approved temporary stations, with only the fields that the main map needs. Bands and modes are
+        fetched with one query each for the whole set, rather than joined onto every station row. Returns a list of
+        MapTemporaryStation rows."""
+
+        session = self.SessionLocal()
+        try:
+            # Fetch the band and mode names for all approved stations, grouped by station ID
+            bands_by_station = {}
+            for station_id, band_id, band_name in session.query(
+                    temporary_station_bands.c.temporary_station_id, Band.id, Band.name).join(
+                    Band, Band.id == temporary_station_bands.c.band_id).join(
+                    TemporaryStation, TemporaryStation.id == temporary_station_bands.c.temporary_station_id).filter(
+                    TemporaryStation.approved).order_by(Band.id):
+                bands_by_station.setdefault(station_id, []).append(BandSummary(band_id, band_name))
+            modes_by_station = {}
+            for station_id, mode_id, mode_name in session.query(
+                    temporary_station_modes.c.temporary_station_id, Mode.id, Mode.name).join(
+                    Mode, Mode.id == temporary_station_modes.c.mode_id).join(
+                    TemporaryStation, TemporaryStation.id == temporary_station_modes.c.temporary_station_id).filter(
+                    TemporaryStation.approved).order_by(Mode.id):
+                modes_by_station.setdefault(station_id, []).append(ModeSummary(mode_id, mode_name))
+
+            # Fetch the stations themselves, along with the details of their event if they have one
+            rows = session.query(TemporaryStation.id, TemporaryStation.callsign, TemporaryStation.club_name,
+                                 TemporaryStation.start_time, TemporaryStation.end_time,
+                                 TemporaryStation.latitude_microdegrees, TemporaryStation.longitude_microdegrees,
+                                 TemporaryStation.rsgb_attending,
+                                 Event.id, Event.name, Event.icon, Event.color).outerjoin(
+                TemporaryStation.event).filter(TemporaryStation.approved).all()
+            return [MapTemporaryStation(id=row[0], callsign=row[1], club_name=row[2], start_time=row[3],
+                                        end_time=row[4], latitude_degrees=row[5] / MICRODEGREES_PER_DEGREE,
+                                        longitude_degrees=row[6] / MICRODEGREES_PER_DEGREE,
+                                        rsgb_attending=row[7],
+                                        event=EventSummary(*row[8:12]) if row[8] is not None else None,
+                                        bands=bands_by_station.get(row[0], []),
+                                        modes=modes_by_station.get(row[0], []))
+                    for row in rows]
+        finally:
+            session.close()
+
     def update_temporary_station(self, station_id, callsign=None, club_name=None, event_id=None,
                                  start_time=None, end_time=None, latitude_degrees=None,
                                  longitude_degrees=None, notes=None, band_ids=None, mode_ids=None,
@@ -488,6 +742,8 @@ class DatabaseOperations:
                 station.approved = approved
             if edit_password is not None:
                 station.edit_password = edit_password
+            # Set explicitly, as changing only the bands or modes doesn't update the row itself
+            station.updated_at = datetime.now()
 
             session.commit()
             return True
@@ -586,6 +842,20 @@ class DatabaseOperations:
         finally:
             session.close()
 
+    def get_permanent_station_version(self, station_id):
+        """Get the version of a permanent station's public page, which changes whenever the station or its type is
+        updated. Returns a tuple of the station's and type's updated_at times (the latter being None if the station has
+        no type), or None if the station doesn't exist."""
+
+        session = self.SessionLocal()
+        try:
+            row = session.query(PermanentStation.updated_at, PermanentStationType.updated_at).outerjoin(
+                PermanentStationType, PermanentStation.type_id == PermanentStationType.id).filter(
+                PermanentStation.id == station_id).first()
+            return tuple(row) if row else None
+        finally:
+            session.close()
+
     def get_all_permanent_stations(self):
         """Get all permanent stations. Returns a list of PermanentStation objects."""
 
@@ -605,6 +875,56 @@ class DatabaseOperations:
         finally:
             session.close()
 
+    def count_permanent_stations_by_type(self):
+        """Count the permanent stations of each type. Returns a dict of type ID to count. Types with no stations are not
+        included."""
+
+        session = self.SessionLocal()
+        try:
+            return dict(session.query(PermanentStation.type_id, func.count(PermanentStation.id)).group_by(
+                PermanentStation.type_id).all())
+        finally:
+            session.close()
+
+    def get_permanent_station_list(self, type_id, limit=None, after_callsign=None, after_id=None):
+        """Get the basic details of permanent stations of a specific type, sorted by callsign, for the admin station
+        list. This supports keyset pagination: provide a limit to get at most that many stations, and the callsign and
+        ID of the last station on the previous page to continue from there. Returns a list of PermanentStationListItem
+        rows."""
+
+        session = self.SessionLocal()
+        try:
+            query = session.query(PermanentStation.id, PermanentStation.callsign, PermanentStation.club_name,
+                                  PermanentStation.type_id).filter(PermanentStation.type_id == type_id)
+            if after_callsign is not None and after_id is not None:
+                query = query.filter(tuple_(PermanentStation.callsign, PermanentStation.id)
+                                     > tuple_(after_callsign, after_id))
+            query = query.order_by(PermanentStation.callsign, PermanentStation.id)
+            if limit is not None:
+                query = query.limit(limit)
+            return [PermanentStationListItem(*row) for row in query.all()]
+        finally:
+            session.close()
+
+    def get_permanent_stations_for_map(self):
+        """Get all approved permanent stations, with only the fields that the main map needs. Returns a list of
+        MapPermanentStation rows."""
+
+        session = self.SessionLocal()
+        try:
+            rows = session.query(PermanentStation.id, PermanentStation.callsign, PermanentStation.club_name,
+                                 PermanentStation.latitude_microdegrees, PermanentStation.longitude_microdegrees,
+                                 PermanentStationType.id, PermanentStationType.name, PermanentStationType.icon,
+                                 PermanentStationType.color).outerjoin(PermanentStation.type).filter(
+                PermanentStation.approved).all()
+            return [MapPermanentStation(id=row[0], callsign=row[1], club_name=row[2],
+                                        latitude_degrees=row[3] / MICRODEGREES_PER_DEGREE,
+                                        longitude_degrees=row[4] / MICRODEGREES_PER_DEGREE,
+                                        type=StationTypeSummary(*row[5:9]) if row[5] is not None else None)
+                    for row in rows]
+        finally:
+            session.close()
+
     def update_permanent_station(self, station_id, callsign=None, club_name=None, type_id=None,
                                  latitude_degrees=None, longitude_degrees=None, meeting_when=None,
                                  meeting_where=None, notes=None, website_url=None, email=None,
@@ -677,6 +997,152 @@ class DatabaseOperations:
         finally:
             session.close()
 
+    def add_stations(self, stations):
+        """Create a batch of new stations, in a single transaction. Each station is a tuple of "temp" or "perm", and a
+        dict of the arguments that add_temporary_station() or add_permanent_station() would take. Returns a list with,
+        for each station in turn, a tuple of its new ID and its automatically generated edit_password, or None if it
+        could not be created. If any station in the batch can't be created, the others are retried one at a time, so
+        that one bad station doesn't stop the rest being created."""
+
+        session = self.SessionLocal()
+        try:
+            bands = {band.id: band for band in session.query(Band).all()}
+            modes = {mode.id: mode for mode in session.query(Mode).all()}
+            new_stations = []
+            for station_type, fields in stations:
+                fields = dict(fields)
+                if station_type == "temp":
+                    band_ids = fields.pop("band_ids", [])
+                    mode_ids = fields.pop("mode_ids", [])
+                    station = TemporaryStation(rsgb_attending=fields.pop("rsgb_attending", False),
+                                               approved=fields.pop("approved", False), **fields)
+                    station.bands.extend(bands[id] for id in band_ids if id in bands)
+                    station.modes.extend(modes[id] for id in mode_ids if id in modes)
+                else:
+                    station = PermanentStation(approved=fields.pop("approved", False), **fields)
+                station.edit_password = generate_password()
+                session.add(station)
+                new_stations.append(station)
+
+            # Flush first so that the new IDs are known, as committing expires the objects
+            session.flush()
+            results = [(station.id, station.edit_password) for station in new_stations]
+            session.commit()
+            return results
+        except IntegrityError as e:
+            session.rollback()
+            if len(stations) > 1:
+                return [self.add_stations([station])[0] for station in stations]
+            logging.error("Error when adding station: " + str(e))
+            return [None]
+        finally:
+            session.close()
+
+    def count_unapproved_stations(self):
+        """Count the stations awaiting approval. Returns a tuple of the number of temporary and permanent stations."""
+
+        session = self.SessionLocal()
+        try:
+            temp_count = session.query(func.count(TemporaryStation.id)).filter(
+                TemporaryStation.approved.is_(False)).scalar()
+            perm_count = session.query(func.count(PermanentStation.id)).filter(
+                PermanentStation.approved.is_(False)).scalar()
+            return temp_count, perm_count
+        finally:
+            session.close()
+
+    def get_unapproved_temporary_station_list(self, limit=None):
+        """Get the temporary stations awaiting approval, oldest submission first, for the moderation queue. Provide a
+        limit to get at most that many stations. Returns a list of PendingTemporaryStation rows."""
+
+        session = self.SessionLocal()
+        try:
+            query = session.query(TemporaryStation.id, TemporaryStation.callsign, TemporaryStation.club_name,
+                                  TemporaryStation.start_time, TemporaryStation.end_time, Event.name,
+                                  TemporaryStation.notes).outerjoin(TemporaryStation.event).filter(
+                TemporaryStation.approved.is_(False)).order_by(TemporaryStation.id)
+            if limit is not None:
+                query = query.limit(limit)
+            return [PendingTemporaryStation(*row) for row in query.all()]
+        finally:
+            session.close()
+
+    def get_unapproved_permanent_station_list(self, limit=None):
+        """Get the permanent stations awaiting approval, oldest submission first, for the moderation queue. Provide a
+        limit to get at most that many stations. Returns a list of PendingPermanentStation rows."""
+
+        session = self.SessionLocal()
+        try:
+            query = session.query(PermanentStation.id, PermanentStation.callsign, PermanentStation.club_name,
+                                  PermanentStationType.name, PermanentStation.meeting_when,
+                                  PermanentStation.meeting_where, PermanentStation.notes).outerjoin(
+                PermanentStation.type).filter(PermanentStation.approved.is_(False)).order_by(PermanentStation.id)
+            if limit is not None:
+                query = query.limit(limit)
+            return [PendingPermanentStation(*row) for row in query.all()]
+        finally:
+            session.close()
+
+    def approve_temporary_stations(self, station_ids):
+        """Approve a batch of temporary stations awaiting approval, in a single UPDATE, without touching any of their
+        other details. Stations that are already approved are left alone. Returns the number of stations approved."""
+
+        session = self.SessionLocal()
+        try:
+            count = session.query(TemporaryStation).filter(TemporaryStation.id.in_(station_ids),
+                                                            TemporaryStation.approved.is_(False)).update(
+                {TemporaryStation.approved: True}, synchronize_session=False)
+            session.commit()
+            return count
+        finally:
+            session.close()
+
+    def reject_temporary_stations(self, station_ids):
+        """Reject a batch of temporary stations awaiting approval, which deletes them, along with their links to bands
+        and modes. Stations that have already been approved are left alone. Returns the number of stations deleted."""
+
+        session = self.SessionLocal()
+        try:
+            pending_ids = session.query(TemporaryStation.id).filter(
+                TemporaryStation.id.in_(station_ids), TemporaryStation.approved.is_(False)).scalar_subquery()
+            for table in [temporary_station_bands, temporary_station_modes]:
+                session.execute(delete(table).where(table.c.temporary_station_id.in_(pending_ids)))
+            count = session.query(TemporaryStation).filter(TemporaryStation.id.in_(station_ids),
+                                                            TemporaryStation.approved.is_(False)).delete(
+                synchronize_session=False)
+            session.commit()
+            return count
+        finally:
+            session.close()
+
+    def approve_permanent_stations(self, station_ids):
+        """Approve a batch of permanent stations awaiting approval, in a single UPDATE, without touching any of their
+        other details. Stations that are already approved are left alone. Returns the number of stations approved."""
+
+        session = self.SessionLocal()
+        try:
+            count = session.query(PermanentStation).filter(PermanentStation.id.in_(station_ids),
+                                                            PermanentStation.approved.is_(False)).update(
+                {PermanentStation.approved: True}, synchronize_session=False)
+            session.commit()
+            return count
+        finally:
+            session.close()
+
+    def reject_permanent_stations(self, station_ids):
+        """Reject a batch of permanent stations awaiting approval, which deletes them. Stations that have already been
+        approved are left alone. Returns the number of stations deleted."""
+
+        session = self.SessionLocal()
+        try:
+            count = session.query(PermanentStation).filter(PermanentStation.id.in_(station_ids),
+                                                            PermanentStation.approved.is_(False)).delete(
+                synchronize_session=False)
+            session.commit()
+            return count
+        finally:
+            session.close()
+
     def get_all_permanent_station_types(self):
         """Get all permanent station types. Returns a list of PermanentStationType objects."""
 
@@ -0,0 +1,42 @@
+from collections import namedtuple
+
+# Lightweight read-only rows returned by the "projection" query methods in operations.py. These contain only the columns
+# that a particular page needs, rather than a full ORM object graph with all its relationships loaded. Being namedtuples
+# they are cheap to create and can't be accidentally modified or lazy-load anything once their session has closed.
+
+# An event as shown in the admin event list, with the number of temporary stations attached to it counted in SQL.
+EventListItem = namedtuple("EventListItem", ["id", "name", "start_time", "end_time", "station_count"])
+
+# The minimal information about an event required to offer it as a choice in a drop-down list.
+EventChoice = namedtuple("EventChoice", ["id", "name"])
+
+# A user as shown in the admin user list.
+UserListItem = namedtuple("UserListItem", ["id", "username", "super_admin"])
+
+# Stations as shown in the admin station list.
+TemporaryStationListItem = namedtuple("TemporaryStationListItem", ["id", "callsign", "club_name", "start_time",
+                                                                   "end_time", "event_name"])
+PermanentStationListItem = namedtuple("PermanentStationListItem", ["id", "callsign", "club_name", "type_id"])
+
+# Stations as shown in the moderation queue, with the details a moderator needs to decide whether to approve them.
+PendingTemporaryStation = namedtuple("PendingTemporaryStation", ["id", "callsign", "club_name", "start_time",
+                                                                 "end_time", "event_name", "notes"])
+PendingPermanentStation = namedtuple("PendingPermanentStation", ["id", "callsign", "club_name", "type_name",
+                                                                 "meeting_when", "meeting_where", "notes"])
+
+# The parts of an event or permanent station type that a station on the main map needs in order to derive its own icon,
+# colour and label. These are named "event" and "type" in the station rows so that the get_icon/get_color functions in
+# core.utils work on them just as they do on the full ORM objects.
+EventSummary = namedtuple("EventSummary", ["id", "name", "icon", "color"])
+StationTypeSummary = namedtuple("StationTypeSummary", ["id", "name", "icon", "color"])
+
+# A band or mode as listed against a temporary station on the main map.
+BandSummary = namedtuple("BandSummary", ["id", "name"])
+ModeSummary = namedtuple("ModeSummary", ["id", "name"])
+
+# Approved stations, as needed to draw the main map.
+MapPermanentStation = namedtuple("MapPermanentStation", ["id", "callsign", "club_name", "latitude_degrees",
+                                                         "longitude_degrees", "type"])
+MapTemporaryStation = namedtuple("MapTemporaryStation", ["id", "callsign", "club_name", "start_time", "end_time",
+                                                         "latitude_degrees", "longitude_degrees", "rsgb_attending",
+                                                         "event", "bands", "modes"])
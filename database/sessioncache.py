@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+# Maximum number of validated session tokens to hold in memory. Beyond this, the least recently used ones are dropped
+# and will be looked up in the database again the next time they are used.
+SESSION_CACHE_MAX_SIZE = 10000
+
+
+class CachedSession:
+    """A validated session token's user ID and expiry time, as held in the SessionTokenCache."""
+
+    __slots__ = ["user_id", "expires_at"]
+
+    def __init__(self, user_id, expires_at):
+        self.user_id = user_id
+        self.expires_at = expires_at
+
+
+class SessionTokenCache:
+    """Bounded least-recently-used cache of session tokens that have already been validated against the database. This
+    saves a database round-trip on every authenticated request just to check who the user is. Each entry carries the
+    session's own expiry time, so an entry is never used once the session it represents has expired."""
+
+    def __init__(self, max_size=SESSION_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_token, now):
+        """Get the cached session for a token, or None if it is not cached or has expired."""
+
+        entry = self.entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= now:
+            del self.entries[session_token]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(session_token)
+        self.hits += 1
+        return entry
+
+    def put(self, session_token, user_id, expires_at):
+        """Add a validated session to the cache, dropping the least recently used one if the cache is full. Returns the
+        new cache entry."""
+
+        entry = CachedSession(user_id, expires_at)
+        self.entries[session_token] = entry
+        self.entries.move_to_end(session_token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, session_token):
+        """Remove a session token from the cache, e.g. because the user has logged out."""
+
+        self.entries.pop(session_token, None)
+
+    def invalidate_user(self, user_id):
+        """Remove all session tokens belonging to a user from the cache, e.g. because the user has been deleted."""
+
+        for session_token in [t for t, e in self.entries.items() if e.user_id == user_id]:
+            del self.entries[session_token]
+
+    def clear(self):
+        """Remove everything from the cache."""
+
+        self.entries.clear()
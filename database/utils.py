@@ -1,6 +1,21 @@
+import asyncio
 import hashlib
 import secrets
+import signal
 import string
+from concurrent.futures import ProcessPoolExecutor
+
+from core.config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE
+
+# Process pool for hashing passwords, and the semaphore that limits how many are in progress at once. These are created
+# when first needed, so that each web server process creates its own after it has started up.
+password_hash_executor = None
+password_hash_semaphore = None
+password_hashes_waiting = 0
+
+
+class PasswordHashQueueFull(Exception):
+    """Raised when there are too many password hashes waiting to be processed to accept another one."""
 
 
 def generate_password():
@@ -27,3 +42,48 @@ def hash_password(password, salt):
         salt.encode('utf-8'),
         100000
     ).hex()
+
+
+def init_password_hash_worker():
+    """Set up a password hashing worker process. The worker is forked from a web server process, so it inherits that
+    process's signal handling; reset it, so that the worker exits normally when the service is stopped rather than
+    relaying the signal to the web server's event loop."""
+
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def shutdown_password_hashing():
+    """Stop the password hashing worker processes, if they were started."""
+
+    global password_hash_executor
+    if password_hash_executor is not None:
+        password_hash_executor.shutdown(wait=True, cancel_futures=True)
+        password_hash_executor = None
+
+
+async def hash_password_async(password, salt):
+    """Hash the given password with the given salt, as per hash_password(), but in a separate process so that the web
+    server can carry on handling other requests in the meantime. At most PASSWORD_HASH_WORKERS hashes are in progress
+    at once; further calls wait their turn, and if more than PASSWORD_HASH_MAX_QUEUE are already waiting,
+    PasswordHashQueueFull is raised instead."""
+
+    global password_hash_executor, password_hash_semaphore, password_hashes_waiting
+    if password_hash_executor is None:
+        password_hash_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                                     initializer=init_password_hash_worker)
+        password_hash_semaphore = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+
+    if password_hash_semaphore.locked() and password_hashes_waiting >= PASSWORD_HASH_MAX_QUEUE:
+        raise PasswordHashQueueFull()
+
+    password_hashes_waiting += 1
+    try:
+        await password_hash_semaphore.acquire()
+    finally:
+        password_hashes_waiting -= 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_hash_executor, hash_password, password, salt)
+    finally:
+        password_hash_semaphore.release()
@@ -0,0 +1,42 @@
+import logging
+from urllib.parse import urlencode
+
+import tornado
+
+from core.backup import list_backups, BackupError
+from requesthandlers.base import BaseHandler
+
+
+class AdminBackupsHandler(BaseHandler):
+    """Handler for the admin page listing database backups, from which a super-admin can also make a backup now."""
+
+    @tornado.web.authenticated
+    def get(self):
+        # Deny access if we are not a super-admin
+        user = self.application.db.get_user(self.current_user)
+        if not user.super_admin:
+            self.write("You do not have permission to access this page.")
+            return
+
+        # Render the template
+        self.render("adminbackups.html", backups=list_backups(self.application.backups.backup_dir),
+                    backup_running=self.application.backups.running, result=self.get_argument("result", None))
+
+    @tornado.web.authenticated
+    async def post(self):
+        """Handles the "Back up now" button. The backup is made in a separate thread, and the page is shown again once
+        it has finished."""
+
+        # Deny access if we are not a super-admin
+        user = self.application.db.get_user(self.current_user)
+        if not user.super_admin:
+            self.write("You do not have permission to access this page.")
+            return
+
+        try:
+            backup_path = await self.application.backups.run()
+            result = "done" if backup_path else "busy"
+        except (BackupError, OSError) as e:
+            logging.error("Backup failed: " + str(e))
+            result = "failed"
+        self.redirect("/admin/backups?" + urlencode({"result": result}))
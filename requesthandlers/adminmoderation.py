@@ -0,0 +1,62 @@
+from urllib.parse import urlencode
+
+import tornado
+
+from core.config import ADMIN_LIST_PAGE_SIZE
+from requesthandlers.base import BaseHandler
+
+
+class AdminModerationHandler(BaseHandler):
+    """Handler for the moderation queue, which lists the stations submitted by visitors that are awaiting approval, and
+    lets an admin approve or reject a batch of them at once."""
+
+    @tornado.web.authenticated
+    def get(self):
+        """Shows the oldest page of stations awaiting approval of each kind. Once these have been dealt with, the next
+        ones appear in their place, so there is no need to page through the queue."""
+
+        # Get data we need to include in the template
+        temp_count, perm_count = self.application.db.count_unapproved_stations()
+        temp_stations = self.application.db.get_unapproved_temporary_station_list(limit=ADMIN_LIST_PAGE_SIZE)
+        perm_stations = self.application.db.get_unapproved_permanent_station_list(limit=ADMIN_LIST_PAGE_SIZE)
+
+        # The result of the last action, if we were redirected here after one. This is only used for a message, so if
+        # the URL has been mangled, just leave the message out.
+        action = self.get_argument("action", None)
+        try:
+            result_count = int(self.get_argument("count", 0))
+        except ValueError:
+            action = None
+            result_count = 0
+
+        # Render the template
+        self.render("adminmoderation.html", temp_count=temp_count, perm_count=perm_count, temp_stations=temp_stations,
+                    perm_stations=perm_stations, action=action, result_count=result_count)
+
+    @tornado.web.authenticated
+    def post(self):
+        """Handles the Approve and Reject buttons, applying the action to all the stations whose checkboxes were ticked.
+        Each kind of station is approved or rejected in a single query, however many were ticked."""
+
+        action = self.get_argument("action")
+        try:
+            temp_ids = [int(i) for i in self.get_arguments("temp_id")]
+            perm_ids = [int(i) for i in self.get_arguments("perm_id")]
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Invalid station ID")
+
+        count = 0
+        if action == "Approve":
+            if temp_ids:
+                count += self.application.db.approve_temporary_stations(temp_ids)
+            if perm_ids:
+                count += self.application.db.approve_permanent_stations(perm_ids)
+        elif action == "Reject":
+            if temp_ids:
+                count += self.application.db.reject_temporary_stations(temp_ids)
+            if perm_ids:
+                count += self.application.db.reject_permanent_stations(perm_ids)
+        else:
+            raise tornado.web.HTTPError(400, reason="Unknown action")
+
+        self.redirect("/admin/moderation?" + urlencode({"action": action, "count": count}))
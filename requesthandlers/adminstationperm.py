@@ -19,7 +19,8 @@ class AdminStationPermHandler(BaseHandler):
         # Get data we need to include in the template
         station = self.application.db.get_permanent_station(station_id) if not creating_new else None
         if station:
-            populate_derived_fields_perm_station(station)
+            with self.timed("derive"):
+                populate_derived_fields_perm_station(station)
         all_perm_station_types = self.application.db.get_all_permanent_station_types()
 
         # Render the template
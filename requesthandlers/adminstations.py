@@ -1,24 +1,75 @@
 from datetime import datetime
+from urllib.parse import urlencode
 
 import tornado
 
+from core.config import ADMIN_LIST_PAGE_SIZE
 from requesthandlers.base import BaseHandler
 
+# The buckets that temporary stations are sorted into, in the order they are displayed
+TEMP_STATION_BUCKETS = ["Past", "Current", "Future"]
+
 
 class AdminStationsHandler(BaseHandler):
     """Handler for admin station list page"""
 
     @tornado.web.authenticated
     def get(self):
-        # Get data we need to include in the template
-        temp_stations = sorted(self.application.db.get_all_temporary_stations(), key=lambda x: x.start_time)
-        temp_stations_by_type = {"Past": [x for x in temp_stations if datetime.now() > x.end_time],
-                                 "Current": [x for x in temp_stations if x.start_time <= datetime.now() <= x.end_time],
-                                 "Future": [x for x in temp_stations if datetime.now() < x.start_time]}
-        perm_stations = sorted(self.application.db.get_all_permanent_stations(), key=lambda x: x.callsign)
-        perm_stations_by_type = {}
-        for station_type in self.application.db.get_all_permanent_station_types():
-            perm_stations_by_type[station_type.name] = [x for x in perm_stations if x.type.name == station_type.name]
+        """By default this shows the first page of every section of the list (the Past, Current and Future temporary
+        stations, and the permanent stations of each type). Following the "more" link on a section shows the next page
+        of just that section, so e.g. the URL can be /admin/stations?temp=Past&after_start=...&after_id=... to continue
+        the list of past temporary stations, or /admin/stations?perm=1&after_callsign=...&after_id=... to continue the
+        list of permanent stations of type 1."""
+
+        temp_bucket = self.get_argument("temp", None)
+        perm_type_id = int(self.get_argument("perm")) if self.get_argument("perm", None) else None
+        after_id = int(self.get_argument("after_id")) if self.get_argument("after_id", None) else None
+
+        # Get data we need to include in the template. If one section was requested, we only show that, otherwise we
+        # show all of them.
+        temp_sections = []
+        if perm_type_id is None:
+            now = datetime.now()
+            counts = self.application.db.count_temporary_stations_by_bucket(now)
+            after_start = self.get_argument("after_start", None)
+            after_start = datetime.fromisoformat(after_start) if after_start else None
+            for bucket in TEMP_STATION_BUCKETS:
+                if temp_bucket and bucket != temp_bucket:
+                    continue
+                # Ask for one more than a page, so we know if there is another page after this one
+                stations = self.application.db.get_temporary_station_list(bucket, now, limit=ADMIN_LIST_PAGE_SIZE + 1,
+                                                                          after_start_time=after_start,
+                                                                          after_id=after_id)
+                more_url = None
+                if len(stations) > ADMIN_LIST_PAGE_SIZE:
+                    stations = stations[:ADMIN_LIST_PAGE_SIZE]
+                    more_url = "/admin/stations?" + urlencode({"temp": bucket,
+                                                               "after_start": stations[-1].start_time.isoformat(),
+                                                               "after_id": stations[-1].id})
+                temp_sections.append({"title": bucket + " Event Stations", "count": counts.get(bucket, 0),
+                                      "stations": stations, "more_url": more_url})
+
+        perm_sections = []
+        if temp_bucket is None:
+            counts = self.application.db.count_permanent_stations_by_type()
+            after_callsign = self.get_argument("after_callsign", None)
+            for station_type in self.application.db.get_all_permanent_station_types():
+                if perm_type_id is not None and station_type.id != perm_type_id:
+                    continue
+                stations = self.application.db.get_permanent_station_list(station_type.id,
+                                                                           limit=ADMIN_LIST_PAGE_SIZE + 1,
+                                                                           after_callsign=after_callsign,
+                                                                           after_id=after_id)
+                more_url = None
+                if len(stations) > ADMIN_LIST_PAGE_SIZE:
+                    stations = stations[:ADMIN_LIST_PAGE_SIZE]
+                    more_url = "/admin/stations?" + urlencode({"perm": station_type.id,
+                                                               "after_callsign": stations[-1].callsign,
+                                                               "after_id": stations[-1].id})
+                perm_sections.append({"title": station_type.name + " Stations",
+                                      "count": counts.get(station_type.id, 0),
+                                      "stations": stations, "more_url": more_url})
 
         # Render the template
-        self.render("adminstations.html", temp_stations_by_type=temp_stations_by_type, perm_stations_by_type=perm_stations_by_type)
+        self.render("adminstations.html", temp_sections=temp_sections, perm_sections=perm_sections,
+                    showing_one_section=temp_bucket is not None or perm_type_id is not None)
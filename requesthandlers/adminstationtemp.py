@@ -21,10 +21,11 @@ class AdminStationTempHandler(BaseHandler):
         # Get data we need to include in the template
         station = self.application.db.get_temporary_station(station_id) if not creating_new else None
         if station:
-            populate_derived_fields_temp_station(station)
+            with self.timed("derive"):
+                populate_derived_fields_temp_station(station)
         all_bands = self.application.db.get_all_bands()
         all_modes = self.application.db.get_all_modes()
-        all_events = self.application.db.get_all_events()
+        all_events = self.application.db.get_event_choices()
         default_start = get_default_event_start_time()
         default_end = get_default_event_end_time()
 
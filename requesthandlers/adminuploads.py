@@ -0,0 +1,97 @@
+import logging
+import os
+import tempfile
+
+import tornado
+from PIL import Image
+from tornado.ioloop import IOLoop
+
+from core.config import UPLOAD_DIR, MAX_UPLOAD_SIZE_MB
+from core.uploads import get_icon_filename, process_icon
+from core.utils import get_all_icons
+from requesthandlers.base import BaseHandler
+
+# Maximum size of an uploaded file, in bytes
+MAX_UPLOAD_SIZE_BYTES = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+
+@tornado.web.stream_request_body
+class AdminUploadsHandler(BaseHandler):
+    """Handler for the admin page for managing uploaded icons. New icons are uploaded by POSTing the raw image data to
+    /admin/uploads?filename=..., rather than as a form, and the upload is streamed to a temporary file as it arrives so
+    that large images are never held in memory."""
+
+    def initialize(self):
+        self.upload_file = None
+
+    def prepare(self):
+        super().prepare()
+        if self.request.method != "POST":
+            return
+
+        # Deny access if we are not a super-admin. (The usual authenticated decorator can't be used here, as the upload
+        # must be refused before its body is read.)
+        user = self.application.db.get_user(self.current_user) if self.current_user else None
+        if not user or not user.super_admin:
+            raise tornado.web.HTTPError(403)
+
+        self.icon_filename = get_icon_filename(self.get_query_argument("filename", ""))
+        if not self.icon_filename:
+            raise tornado.web.HTTPError(400, reason="Missing or invalid filename")
+
+        # Refuse anything that says up front that it's too big. Tornado will also enforce the limit while the body is
+        # being streamed, closing the connection as soon as more than this has been sent, which catches uploads that
+        # don't give a size in advance.
+        content_length = self.request.headers.get("Content-Length")
+        if content_length and int(content_length) > MAX_UPLOAD_SIZE_BYTES:
+            raise tornado.web.HTTPError(413)
+        self.request.connection.set_max_body_size(MAX_UPLOAD_SIZE_BYTES)
+
+        self.upload_file = tempfile.NamedTemporaryFile(prefix="youthmap-upload-", delete=False)
+
+    def data_received(self, chunk):
+        # If prepare() turned the upload away, there's nowhere to put anything that still arrives
+        if self.upload_file is None:
+            return
+        self.upload_file.write(chunk)
+
+    @tornado.web.authenticated
+    def get(self):
+        # Deny access if we are not a super-admin
+        user = self.application.db.get_user(self.current_user)
+        if not user.super_admin:
+            self.write("You do not have permission to access this page.")
+            return
+
+        # Render the template
+        self.render("adminuploads.html", all_icons=get_all_icons(), max_upload_size_mb=MAX_UPLOAD_SIZE_MB)
+
+    async def post(self):
+        """Handles the upload of an icon, once the whole file has been received. The image is converted to a marker-sized
+        PNG in a separate thread, then the icon sprite used by the main map is rebuilt to include it."""
+
+        self.upload_file.close()
+        try:
+            await IOLoop.current().run_in_executor(None, process_icon, self.upload_file.name, UPLOAD_DIR,
+                                                   self.icon_filename)
+        except (OSError, Image.DecompressionBombError) as e:
+            logging.warning("Rejected uploaded icon " + self.icon_filename + ": " + str(e))
+            raise tornado.web.HTTPError(400, reason="Not a valid image")
+        await self.application.icon_sprite.rebuild()
+        self.write({"filename": self.icon_filename})
+
+    def on_finish(self):
+        super().on_finish()
+        self.remove_upload_file()
+
+    def on_connection_close(self):
+        super().on_connection_close()
+        self.remove_upload_file()
+
+    def remove_upload_file(self):
+        """Remove the temporary file, whether or not the upload worked"""
+
+        if self.upload_file:
+            self.upload_file.close()
+            os.remove(self.upload_file.name)
+            self.upload_file = None
@@ -1,5 +1,6 @@
 import tornado
 
+from database.utils import PasswordHashQueueFull
 from requesthandlers.base import BaseHandler
 
 
@@ -34,7 +35,7 @@ class AdminUserHandler(BaseHandler):
         self.render("adminuser.html", user=user, current_user=current_user, creating_new=creating_new)
 
     @tornado.web.authenticated
-    def post(self, slug):
+    async def post(self, slug):
         """Handles POST requests for user editing page. This supports three 'actions' depending on whether the Update
         or Delete button was clicked for an existing user, or the Create button was clicked for a new user, and provides
         the updated data to insert back into the database. This requires the current user to have super-admin permission.
@@ -91,8 +92,13 @@ class AdminUserHandler(BaseHandler):
             password = password if password != "" else None
 
             # Process the update
-            ok = self.application.db.update_user(user_id, username=username, password=password, email=email,
-                                                 super_admin=super_admin)
+            try:
+                ok = await self.application.db.update_user(user_id, username=username, password=password, email=email,
+                                                           super_admin=super_admin)
+            except PasswordHashQueueFull:
+                self.set_status(503)
+                self.write("The server is busy, please try again shortly.")
+                return
             if ok:
                 # Update OK, just reload the page which will have the new data in it
                 self.redirect("/admin/user/" + slug)
@@ -110,8 +116,13 @@ class AdminUserHandler(BaseHandler):
             super_admin = True if self.get_argument("super_admin", None) else False
 
             # Process the create action
-            new_user_id = self.application.db.add_user(username=username, password=password, email=email,
-                                              super_admin=super_admin)
+            try:
+                new_user_id = await self.application.db.add_user(username=username, password=password, email=email,
+                                                                 super_admin=super_admin)
+            except PasswordHashQueueFull:
+                self.set_status(503)
+                self.write("The server is busy, please try again shortly.")
+                return
             if new_user_id:
                 # Create OK, go back to the user management page which will have the new data in it
                 self.redirect("/admin/user/" + str(new_user_id))
@@ -1,5 +1,8 @@
+from urllib.parse import urlencode
+
 import tornado
 
+from core.config import ADMIN_LIST_PAGE_SIZE
 from requesthandlers.base import BaseHandler
 
 
@@ -14,8 +17,17 @@ class AdminUsersHandler(BaseHandler):
             self.write("You do not have permission to access this page.")
             return
 
-        # Get data we need to include in the template
-        users = self.application.db.get_all_users()
+        # Get data we need to include in the template. The list is paginated, so if we were given the username and ID of
+        # the last user on the previous page, continue from there. We ask for one more user than will fit on a page, so
+        # we know if there is another page after this one.
+        after_username = self.get_argument("after_username", None)
+        after_id = int(self.get_argument("after_id")) if self.get_argument("after_id", None) else None
+        users = self.application.db.get_user_list(limit=ADMIN_LIST_PAGE_SIZE + 1, after_username=after_username,
+                                                  after_id=after_id)
+        more_url = None
+        if len(users) > ADMIN_LIST_PAGE_SIZE:
+            users = users[:ADMIN_LIST_PAGE_SIZE]
+            more_url = "/admin/users?" + urlencode({"after_username": users[-1].username, "after_id": users[-1].id})
 
         # Render the template
-        self.render("adminusers.html", users=users, current_user=user)
+        self.render("adminusers.html", users=users, current_user=user, more_url=more_url)
@@ -0,0 +1,35 @@
+import mimetypes
+import os
+
+from tornado.web import StaticFileHandler
+
+# How long browsers may cache a built asset for, in seconds. Built assets have a hash of their contents in their name,
+# so any change to one gets a new URL, and the old one can be cached for as long as we like.
+ASSET_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+# Pre-compressed copies of each asset that may be written by the build, in order of preference
+COMPRESSED_VARIANTS = [("br", ".br"), ("gzip", ".gz")]
+
+
+class AssetHandler(StaticFileHandler):
+    """Handler for the fingerprinted static assets built at startup by core.assets. If the browser accepts it, this
+    serves a pre-compressed copy of the file rather than compressing it on every request."""
+
+    async def get(self, path, include_body=True):
+        self.original_path = path
+        self.set_header("Vary", "Accept-Encoding")
+        accept_encoding = self.request.headers.get("Accept-Encoding", "")
+        for encoding, suffix in COMPRESSED_VARIANTS:
+            if encoding in accept_encoding and os.path.isfile(os.path.join(self.root, path + suffix)):
+                self.set_header("Content-Encoding", encoding)
+                path = path + suffix
+                break
+        await super().get(path, include_body)
+
+    def get_content_type(self):
+        # Report the type of the original file, not of the compressed copy
+        mime_type, encoding = mimetypes.guess_type(self.original_path)
+        return mime_type or "application/octet-stream"
+
+    def set_extra_headers(self, path):
+        self.set_header("Cache-Control", "public, max-age=" + str(ASSET_CACHE_SECONDS) + ", immutable")
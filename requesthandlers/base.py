@@ -1,9 +1,104 @@
+import math
+import time
+from contextlib import contextmanager
+
 import tornado
 
+from core.config import SERVER_TIMING
+from database.instrumentation import RequestQueryLog, current_request_queries
+
 
 class BaseHandler(tornado.web.RequestHandler):
     """Request handler superclass providing common functions"""
 
+    # Name of the rate limit rule (see core/ratelimit.py) that applies to this handler's POST requests, if any
+    rate_limit = None
+
+    def prepare(self):
+        # Turn away clients that are making too many expensive requests, before doing any work for them
+        rule_name = self.get_rate_limit_rule()
+        if rule_name:
+            rate_limiter = self.application.rate_limiter
+            retry_after = rate_limiter.take(rule_name, rate_limiter.get_client_ip(self.request))
+            if retry_after:
+                self.set_status(429)
+                self.set_header("Retry-After", str(math.ceil(retry_after)))
+                self.finish("Too many requests, please try again in " + str(math.ceil(retry_after)) + " seconds.")
+                return
+
+        # Count this request as in progress until it finishes, or the client goes away
+        self.in_flight = True
+        self.application.metrics.on_request_start()
+
+        # Attribute all the database queries run from here on to this request, and start timing the other phases of
+        # handling it
+        self.query_log = RequestQueryLog()
+        current_request_queries.set(self.query_log)
+        self.phase_timings = {}
+
+        # Before handling the request, make sure none of our cached data has been made stale by another process
+        self.application.db.coherence.check()
+
+    def get_rate_limit_rule(self):
+        """Get the name of the rate limit rule that applies to this request, or None if it isn't rate limited. By
+        default, only POST requests are limited, as those are the ones that do expensive things like checking passwords
+        or writing to the database. Handlers can override this to limit other requests."""
+
+        return self.rate_limit if self.request.method == "POST" else None
+
+    @contextmanager
+    def timed(self, phase):
+        """Time a phase of handling the request, such as "derive" or "serialize", to be reported in the Server-Timing
+        header. If the same phase is timed more than once, the times are added together. Use like:
+            with self.timed("derive"):
+                ..."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_timings[phase] = self.phase_timings.get(phase, 0.0) + time.perf_counter() - start
+
+    def render_string(self, template_name, **kwargs):
+        with self.timed("render"):
+            return super().render_string(template_name, **kwargs)
+
+    def finish(self, chunk=None):
+        if getattr(self, "phase_timings", None) is not None and self.server_timing_wanted():
+            self.set_header("Server-Timing", self.get_server_timing())
+        return super().finish(chunk)
+
+    def server_timing_wanted(self):
+        """Check whether the response should include the Server-Timing header, according to the config"""
+
+        return SERVER_TIMING == "all" or (SERVER_TIMING == "admins" and self.current_user is not None)
+
+    def get_server_timing(self):
+        """Get the value of the Server-Timing header, which breaks down the time taken to handle the request so far into
+        database queries, the phases timed with timed(), and the total."""
+
+        queries = str(self.query_log.count) + (" query" if self.query_log.count == 1 else " queries")
+        metrics = ['db;desc="' + queries + '";dur=' + "{:.2f}".format(self.query_log.duration * 1000)]
+        for phase, duration in self.phase_timings.items():
+            metrics.append(phase + ";dur=" + "{:.2f}".format(duration * 1000))
+        metrics.append("total;dur=" + "{:.2f}".format(self.request.request_time() * 1000))
+        return ", ".join(metrics)
+
+    def on_finish(self):
+        self.end_in_flight()
+        if getattr(self, "query_log", None):
+            self.query_log.report(self.request.method + " " + self.request.path + " (" + type(self).__name__ + ")")
+
+    def on_connection_close(self):
+        self.end_in_flight()
+
+    def end_in_flight(self):
+        """Stop counting this request as in progress, if it was counted"""
+
+        if getattr(self, "in_flight", False):
+            self.in_flight = False
+            self.application.metrics.on_request_end()
+
     def get_current_user(self):
         session_token = self.get_secure_cookie("session_token")
         if not session_token:
@@ -9,6 +9,8 @@ class CreateStationHandler(BaseHandler):
     """Handler for the create station page (the full version where the user fills in the form, rather than the
     interstitial page where they set the type"""
 
+    rate_limit = "create-station"
+
     def get(self, perm_or_temp_slug):
         """A slug is provided here, "perm" or "temp", depending on the type of station we want to create, which sets
         what's included in the form template. The form of the URL is /create/station/temp or /create/station/perm."""
@@ -54,7 +56,7 @@ class CreateStationHandler(BaseHandler):
                     event=event, event_id=event_id, type=type, type_id=type_id, color=color, icon=icon,
                     all_bands=all_bands, all_modes=all_modes, default_start=default_start, default_end=default_end)
 
-    def post(self, perm_or_temp_slug):
+    async def post(self, perm_or_temp_slug):
         """Handle the user filling in the form and clicking Create. The "perm" or "temp" slug is provided here as well."""
 
         # Get the action we have been asked to do
@@ -105,38 +107,24 @@ class CreateStationHandler(BaseHandler):
             phone_number = self.get_argument("phone_number", None)
             phone_number = phone_number if phone_number else ""
 
-            # Now create the station, taking into account its type
-            new_station_id = None
-            edit_password = None
+            # Now create the station, taking into account its type. New stations are queued up to be created along
+            # with any others being submitted at the same time, and we wait here until that has been done.
+            result = None
             if perm_or_temp_slug == "perm":
-                new_station_id = self.application.db.add_permanent_station(callsign=callsign, club_name=club_name,
-                                                                           type_id=type_id,
-                                                                           latitude_degrees=latitude_degrees,
-                                                                           longitude_degrees=longitude_degrees,
-                                                                           meeting_when=meeting_when,
-                                                                           meeting_where=meeting_where,
-                                                                           notes=notes, website_url=website_url,
-                                                                           qrz_url=qrz_url,
-                                                                           social_media_url=social_media_url,
-                                                                           email=email,
-                                                                           phone_number=phone_number)
-                edit_password = self.application.db.get_permanent_station(new_station_id).edit_password
+                result = await self.application.station_writes.add_permanent_station(
+                    callsign=callsign, club_name=club_name, type_id=type_id, latitude_degrees=latitude_degrees,
+                    longitude_degrees=longitude_degrees, meeting_when=meeting_when, meeting_where=meeting_where,
+                    notes=notes, website_url=website_url, qrz_url=qrz_url, social_media_url=social_media_url,
+                    email=email, phone_number=phone_number)
             elif perm_or_temp_slug == "temp":
-                new_station_id = self.application.db.add_temporary_station(callsign=callsign, club_name=club_name,
-                                                                           event_id=event_id, start_time=start_time,
-                                                                           end_time=end_time,
-                                                                           latitude_degrees=latitude_degrees,
-                                                                           longitude_degrees=longitude_degrees,
-                                                                           band_ids=band_ids,
-                                                                           mode_ids=mode_ids,
-                                                                           notes=notes, website_url=website_url,
-                                                                           qrz_url=qrz_url,
-                                                                           social_media_url=social_media_url,
-                                                                           email=email,
-                                                                           phone_number=phone_number)
-                edit_password = self.application.db.get_temporary_station(new_station_id).edit_password
+                result = await self.application.station_writes.add_temporary_station(
+                    callsign=callsign, club_name=club_name, event_id=event_id, start_time=start_time,
+                    end_time=end_time, latitude_degrees=latitude_degrees, longitude_degrees=longitude_degrees,
+                    band_ids=band_ids, mode_ids=mode_ids, notes=notes, website_url=website_url, qrz_url=qrz_url,
+                    social_media_url=social_media_url, email=email, phone_number=phone_number)
 
-            if new_station_id:
+            if result:
+                new_station_id, edit_password = result
                 # Create OK, go back to the view station page to show the data. Include the edit password in the GET
                 # params here, which will cause the view station page to show it to the user.
                 self.redirect("/view/station/" + perm_or_temp_slug + "/" + str(new_station_id) + "?edit_password="
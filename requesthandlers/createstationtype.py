@@ -8,7 +8,7 @@ class CreateStationTypeHandler(BaseHandler):
 
     def get(self):
         # Get data we need to include in the template
-        all_events = self.application.db.get_all_events()
+        all_events = self.application.db.get_event_choices()
         all_perm_station_types = self.application.db.get_all_permanent_station_types()
         lat = self.get_argument("lat")
         lon = self.get_argument("lon")
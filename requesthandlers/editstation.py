@@ -7,6 +7,12 @@ from requesthandlers.base import BaseHandler
 class EditStationHandler(BaseHandler):
     """Handler for station edit page"""
 
+    rate_limit = "edit-password"
+
+    def get_rate_limit_rule(self):
+        # Every request to this page checks the edit password, whether it's showing the form or saving it
+        return self.rate_limit
+
     def get(self, perm_or_temp_slug, station_id_slug):
         """Two slugs are provided here. The first is "perm" or "temp", and the second is the station ID within that
         category, so e.g. the URL can be /edit/station/temp/1 to edit permanent station 1."""
@@ -17,13 +23,15 @@ class EditStationHandler(BaseHandler):
         station = None
         if perm_or_temp_slug == "perm":
             station = self.application.db.get_permanent_station(station_id)
-            populate_derived_fields_perm_station(station)
+            with self.timed("derive"):
+                populate_derived_fields_perm_station(station)
         elif perm_or_temp_slug == "temp":
             station = self.application.db.get_temporary_station(station_id)
-            populate_derived_fields_temp_station(station)
+            with self.timed("derive"):
+                populate_derived_fields_temp_station(station)
         all_bands = self.application.db.get_all_bands()
         all_modes = self.application.db.get_all_modes()
-        all_events = self.application.db.get_all_events()
+        all_events = self.application.db.get_event_choices()
         all_perm_station_types = self.application.db.get_all_permanent_station_types()
 
         # Check edit password is supplied and correct
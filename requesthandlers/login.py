@@ -1,10 +1,13 @@
+from database.utils import PasswordHashQueueFull
 from requesthandlers.base import BaseHandler
 
 
 class LoginHandler(BaseHandler):
     """Handler for login page, includes POSTing username and password as well as rendering the HTML"""
 
-    def get(self):
+    rate_limit = "login"
+
+    async def get(self):
         # Get the 'next' parameter from the query string if there was one. This is where we are going to forward to on
         # successful login. Default to the admin dashboard.
         next_url = self.get_argument("next", "/admin")
@@ -15,13 +18,13 @@ class LoginHandler(BaseHandler):
             return
 
         # Get data we need to include in the template
-        insecure_user_present = self.application.db.is_insecure_user_present()
+        insecure_user_present = await self.application.db.is_insecure_user_present()
 
         # Render the template. This includes a hidden field with the 'next' URL in it so we can get it back again in the
         # POST method.
         self.render("login.html", next=next_url, insecure_user_present=insecure_user_present)
 
-    def post(self):
+    async def post(self):
         """Handles POST requests for login page. If successful a session token will be created, stored in a cookie, and
         the user will be redirected to the admin page."""
 
@@ -30,8 +33,14 @@ class LoginHandler(BaseHandler):
         password = self.get_argument("password")
         next_url = self.get_argument("next", "/admin")
 
-        # Check that the username and password match a known user
-        user_id = self.application.db.verify_user(username, password)
+        # Check that the username and password match a known user. If too many login attempts are already being
+        # processed, turn this one away rather than letting it queue indefinitely.
+        try:
+            user_id = await self.application.db.verify_user(username, password)
+        except PasswordHashQueueFull:
+            self.set_status(503)
+            self.write("The server is busy, please try again shortly.")
+            return
 
         if user_id:
             session_token = self.application.db.create_user_session(user_id)
@@ -5,5 +5,8 @@ class LogoutHandler(BaseHandler):
     """Handler for logout page, just deletes token and redirects to the map"""
 
     def get(self):
+        session_token = self.get_secure_cookie("session_token")
+        if session_token:
+            self.application.db.delete_user_session(session_token.decode('utf-8'))
         self.clear_cookie("session_token")
         self.redirect("/")
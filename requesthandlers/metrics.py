@@ -0,0 +1,29 @@
+import hmac
+
+import tornado
+
+from core.config import METRICS_ALLOWED_IPS, METRICS_TOKEN
+from requesthandlers.base import BaseHandler
+
+
+class MetricsHandler(BaseHandler):
+    """Handler for the metrics endpoint, which provides metrics about the running server in the Prometheus text format.
+    Only the addresses allowed in the config, and anyone with the metrics token, can see them."""
+
+    def get(self):
+        if not self.is_allowed():
+            raise tornado.web.HTTPError(403)
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(self.application.metrics.render())
+
+    def is_allowed(self):
+        """Whether this request may see the metrics. Behind a reverse proxy, every request comes from the proxy's own
+        address, so the visitor's address is worked out the same way as for rate limiting. If the proxy didn't say who
+        the visitor was, they could be anyone, so only the token will do."""
+
+        client_ip = self.application.rate_limiter.get_client_ip(self.request)
+        if client_ip is not None and client_ip in METRICS_ALLOWED_IPS:
+            return True
+        authorization = self.request.headers.get("Authorization", "")
+        return bool(METRICS_TOKEN) and hmac.compare_digest(authorization.encode("utf-8"),
+                                                           ("Bearer " + METRICS_TOKEN).encode("utf-8"))
@@ -1,3 +1,9 @@
+import hashlib
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+import tornado
+
 from core.utils import populate_derived_fields_temp_station, populate_derived_fields_perm_station
 from requesthandlers.base import BaseHandler
 
@@ -5,6 +11,15 @@ from requesthandlers.base import BaseHandler
 class ViewStationHandler(BaseHandler):
     """Handler for station view page"""
 
+    rate_limit = "edit-password"
+
+    def get_rate_limit_rule(self):
+        # As well as the POST requests where the visitor enters an edit password, the page can be given the password in
+        # the URL, which would be just as easy a way to guess it
+        if self.request.method == "POST" or self.get_argument("edit_password", None) is not None:
+            return self.rate_limit
+        return None
+
     def get(self, perm_or_temp_slug, station_id_slug):
         """Two slugs are provided here. The first is "perm" or "temp", and the second is the station ID within that
         category, so e.g. the URL can be /view/station/temp/1 to view permanent station 1."""
@@ -16,22 +31,85 @@ class ViewStationHandler(BaseHandler):
         # the station, to display that password and remind them to note it down.
         user_edit_password = self.get_argument("edit_password", None)
 
+        # Without an edit password, the page is the same for everyone, so serve it from the cache if we can. (Not in
+        # development mode, where templates may change at any time.)
+        if user_edit_password is None and not self.settings.get("debug"):
+            self.get_public_page(perm_or_temp_slug, station_id)
+            return
+
         # Get data we need to include in the template
         station = None
         edit_password_good = False
         if perm_or_temp_slug == "perm":
             station = self.application.db.get_permanent_station(station_id)
-            populate_derived_fields_perm_station(station)
+            with self.timed("derive"):
+                populate_derived_fields_perm_station(station)
             edit_password_good = station.edit_password == user_edit_password
         elif perm_or_temp_slug == "temp":
             station = self.application.db.get_temporary_station(station_id)
-            populate_derived_fields_temp_station(station)
+            with self.timed("derive"):
+                populate_derived_fields_temp_station(station)
             edit_password_good = station.edit_password == user_edit_password
 
         # Render the template.
         self.render("viewstation.html", type=perm_or_temp_slug, station=station,
                     user_edit_password=user_edit_password if edit_password_good else None)
 
+    def get_public_page(self, perm_or_temp_slug, station_id):
+        """Serve the public view of a station. The rendered page is cached, and is only rendered again once the station,
+        or its event or type, has been updated. The page's ETag and Last-Modified headers are based on the same version
+        information, along with the version of the site itself so that a browser doesn't keep using a page from before
+        the templates or static files were changed. A browser that already has the current version of the page gets a
+        "304 Not Modified" response."""
+
+        if perm_or_temp_slug == "perm":
+            version = self.application.db.get_permanent_station_version(station_id)
+        else:
+            version = self.application.db.get_temporary_station_version(station_id)
+        if version is None:
+            raise tornado.web.HTTPError(404)
+
+        # Browsers must check back each time in case the station has changed, but can use their copy if it hasn't
+        last_modified = max(t for t in version if t is not None).astimezone(timezone.utc).replace(microsecond=0)
+        etag = hashlib.sha1(repr((self.application.site_version, perm_or_temp_slug, station_id,
+                                  version)).encode("utf-8")).hexdigest()
+        self.set_header("ETag", '"' + etag + '"')
+        self.set_header("Last-Modified", last_modified)
+        self.set_header("Cache-Control", "no-cache")
+        if self.is_not_modified(last_modified):
+            self.set_status(304)
+            return
+
+        key = (perm_or_temp_slug, station_id)
+        body = self.application.station_page_cache.get(key, version)
+        if body is None:
+            if perm_or_temp_slug == "perm":
+                station = self.application.db.get_permanent_station(station_id)
+                with self.timed("derive"):
+                    populate_derived_fields_perm_station(station)
+            else:
+                station = self.application.db.get_temporary_station(station_id)
+                with self.timed("derive"):
+                    populate_derived_fields_temp_station(station)
+            body = self.render_string("viewstation.html", type=perm_or_temp_slug, station=station,
+                                      user_edit_password=None)
+            self.application.station_page_cache.put(key, version, body)
+        self.finish(body)
+
+    def is_not_modified(self, last_modified):
+        """Check whether the browser's copy of the page, according to its If-None-Match or If-Modified-Since headers, is
+        the same as the current version."""
+
+        if self.request.headers.get("If-None-Match"):
+            return self.check_etag_header()
+        if_modified_since = self.request.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since) >= last_modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
     def post(self, perm_or_temp_slug, station_id_slug):
         """Handle the user entering an edit password and clicking Edit or Delete. This supports two 'actions' depending
          on whether the Edit or Delete button was clicked,and provides the user's edit password to compare against the
@@ -4,6 +4,8 @@ import { DateTime } from "luxon";
 
 var placingMarker;
 var addStationMarker;
+// Image URLs for each marker icon, cut out of the icon sprite
+var iconImageSrcs = {};
 
 
 // Set up the map
@@ -64,7 +66,7 @@ function createMarkers(markersLayer) {
         const marker = new Marker([s.latitude_degrees, s.longitude_degrees], {
             icon: new Icon({
               accentColor: s.color,
-              svgFillImageSrc: "/upload/" + s.icon,
+              svgFillImageSrc: getIconImageSrc(s.icon),
               scale: 1.5,
               svg: PinSquarePanel,
             }),
@@ -80,7 +82,7 @@ function createMarkers(markersLayer) {
             const marker = new Marker([s.latitude_degrees, s.longitude_degrees], {
                 icon: new Icon({
                   accentColor: s.color,
-                  svgFillImageSrc: "/upload/" + s.icon,
+                  svgFillImageSrc: getIconImageSrc(s.icon),
                   scale: 1.5,
                   svg: PinSquarePanel,
                 }),
@@ -90,6 +92,31 @@ function createMarkers(markersLayer) {
     });
 }
 
+// Load the icon sprite, which contains all the marker icons in one image, and cut out each icon from it so that markers
+// can use them without fetching each one separately. If the sprite can't be loaded, markers fall back to fetching their
+// icons individually.
+async function loadIconSprite() {
+    const atlas = new Image();
+    atlas.src = icon_sprite.url;
+    try {
+        await atlas.decode();
+    } catch (e) {
+        return;
+    }
+    for (const [name, pos] of Object.entries(icon_sprite.icons)) {
+        const canvas = document.createElement("canvas");
+        canvas.width = pos.width;
+        canvas.height = pos.height;
+        canvas.getContext("2d").drawImage(atlas, pos.x, pos.y, pos.width, pos.height, 0, 0, pos.width, pos.height);
+        iconImageSrcs[name] = canvas.toDataURL();
+    }
+}
+
+// Get the image URL to use for a marker icon
+function getIconImageSrc(icon) {
+    return iconImageSrcs[icon] || "/upload/" + icon;
+}
+
 // Get popup text for a permanent station
 function getPopupTextForPerm(s) {
     var text = "<p><b>" + s.callsign + "</b><br/>" + s.club_name + "</p>";
@@ -108,10 +135,13 @@ function getPopupTextForTemp(s) {
 }
 
 // Startup
-$(document).ready(function() {
+$(document).ready(async function() {
     // Set up map
     const map = setUpMap();
 
+    // Load marker icons
+    await loadIconSprite();
+
     // Add marker layer
     const markersLayer = new FeatureGroup();
     markersLayer.addTo(map);
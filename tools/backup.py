@@ -0,0 +1,37 @@
+import argparse
+import logging
+import sys
+
+from core.backup import backup_database, list_backups, BackupError
+from core.config import BACKUP_DIR, BACKUP_KEEP
+from database import DATABASE_FILE
+
+# Makes a backup of the database from the command line, in the same way as the automatic backups. This is safe to run
+# while the server is running, e.g. from cron before copying the backups elsewhere. Run from the repository root:
+#     python -m tools.backup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up the Youth Map database")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR, help="directory to put the backup in")
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="number of backups to keep, including this one")
+    parser.add_argument("--list", action="store_true", help="list the existing backups rather than making one")
+    args = parser.parse_args()
+    if args.keep < 1:
+        parser.error("--keep must be at least 1")
+
+    if args.list:
+        for backup in list_backups(args.backup_dir):
+            print(backup["path"] + "  " + str(backup["size"]) + " bytes")
+        return
+
+    logging.getLogger().setLevel(logging.INFO)
+    try:
+        print(backup_database(DATABASE_FILE, args.backup_dir, args.keep))
+    except (BackupError, OSError) as e:
+        print("Backup failed: " + str(e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from urllib.parse import urljoin, urlsplit
+
+from tornado.httpclient import AsyncHTTPClient
+
+from core.assets import write_file
+
+# Static snapshot export. Crawls the public side of a running Youth Map server (the main map, the public page of every
+# station on it, and the static files, marker icons and built assets those pages use) and writes it to a directory as
+# plain files, so that at busy times nginx, or any other static host, can serve the public site without Python being
+# involved at all. Everything else, such as submitting or editing a station and the admin pages, is still handled by the
+# server itself (see the example nginx configuration in docs/sysadmin.md).
+#
+# Running it again updates the snapshot in place. Each file is fetched with the ETag from the last run, so the server
+# only sends files that have changed, and fingerprinted built assets (which never change) aren't fetched again at all.
+# Only files whose content has changed are rewritten, each atomically so that a half-written file is never served, and
+# files that are no longer part of the site (such as the page of a station that has been deleted, which the server
+# reports as "404 Not Found") are removed. If anything else goes wrong when fetching a file, such as a server error or
+# a timeout while the server is restarting, the copy from last time is kept, and the tool exits with an error once it
+# has done everything else. Text files get a gzipped copy alongside them, for nginx's gzip_static. Run from the
+# repository root, e.g. every minute from cron:
+#     python -m tools.export_snapshot /var/www/youthmap-snapshot --url http://localhost:8080
+
+DEFAULT_URL = "http://localhost:8080"
+# Most requests to make to the server at once
+DEFAULT_CONCURRENCY = 8
+# Name of the file in the output directory that records what was exported last time
+MANIFEST_FILE = ".snapshot.json"
+# Pages that are part of the public site. Other links without a file extension, such as /login, are left to the
+# server.
+PAGE_PATTERNS = [re.compile(r"^/$"), re.compile(r"^/view/station/(perm|temp)/\d+$")]
+# Built assets have a hash of their content in their name, so one that has already been exported is up to date
+IMMUTABLE_PREFIX = "/assets/"
+# Responses that mean a page or file is no longer part of the site. Any other error, such as the server being restarted
+# part way through, leaves the previous copy in place.
+GONE_STATUS_CODES = {404, 410}
+# File extensions that get a gzipped copy
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".json", ".svg", ".txt"}
+# Local URLs referred to by a page, e.g. in src="/img/logo.png", or in a quoted string such as the icon sprite URL
+PAGE_LINK_PATTERN = re.compile(r'(?:src|href)="(/[^"]*)"|"(/(?:assets|upload)/[^"]+)"')
+# URLs referred to by a stylesheet
+CSS_LINK_PATTERN = re.compile(r"url\(\s*['\"]?([^'\")]+)['\"]?\s*\)")
+# The station data and icon sprite information embedded in the main map page
+MAP_DATA_PATTERN = re.compile(r'let (perm_stations|temp_stations) = JSON\.parse\(("(?:[^"\\]|\\.)*")\);')
+MAP_SPRITE_PATTERN = re.compile(r"let icon_sprite = (\{.*\});")
+
+
+def is_page(path):
+    """Whether a path is one of the public site's pages"""
+
+    return any(pattern.match(path) for pattern in PAGE_PATTERNS)
+
+
+def is_static_file(path):
+    """Whether a path looks like a static file, i.e. its last part has a file extension"""
+
+    return "." in path.rsplit("/", 1)[-1]
+
+
+def get_file_path(output_dir, path):
+    """Get the file that a URL path is exported to. Pages are exported as index.html in a directory of the same name, so
+    e.g. /view/station/temp/1 becomes view/station/temp/1/index.html. Returns None for paths that would end up outside
+    the output directory."""
+
+    parts = [part for part in path.split("/") if part]
+    if any(part in (".", "..") for part in parts):
+        return None
+    if is_page(path):
+        parts.append("index.html")
+    return os.path.join(output_dir, *parts)
+
+
+def find_map_links(body):
+    """Find the pages and files that the main map needs, from the station data embedded in it: the public page of each
+    station, the marker icon of each station (which the map falls back to if it can't use the icon sprite) and the icon
+    sprite itself"""
+
+    links = set()
+    for station_type, data in MAP_DATA_PATTERN.findall(body):
+        slug = "perm" if station_type == "perm_stations" else "temp"
+        for station in json.loads(json.loads(data)):
+            links.add("/view/station/" + slug + "/" + str(station["id"]))
+            if station.get("icon"):
+                links.add("/upload/" + station["icon"])
+    sprite = MAP_SPRITE_PATTERN.search(body)
+    if sprite:
+        links.add(json.loads(sprite.group(1))["url"])
+    return links
+
+
+def find_links(path, content):
+    """Find the local pages and files that an exported page or stylesheet refers to"""
+
+    links = set()
+    if is_page(path):
+        body = content.decode("utf-8", errors="replace")
+        for match in PAGE_LINK_PATTERN.finditer(body):
+            links.add(match.group(1) or match.group(2))
+        if path == "/":
+            links.update(find_map_links(body))
+    elif path.endswith(".css"):
+        for url in CSS_LINK_PATTERN.findall(content.decode("utf-8", errors="replace")):
+            if not url.startswith("data:"):
+                links.add(urljoin(path, url))
+
+    # Only keep links to the public pages and static files on this site
+    local_links = set()
+    for link in links:
+        link_path = urlsplit(link).path
+        if link.startswith("//") or not link_path.startswith("/"):
+            continue
+        if is_page(link_path) or is_static_file(link_path):
+            local_links.add(link_path)
+    return local_links
+
+
+class SnapshotExporter:
+    """Crawls the public site and updates the snapshot in the output directory"""
+
+    def __init__(self, base_url, output_dir, concurrency):
+        self.base_url = base_url
+        self.output_dir = output_dir
+        self.client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        # Map of each URL path exported last time to its ETag and content hash
+        self.previous = {}
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as f:
+                self.previous = json.load(f)
+        self.exported = {}
+        # Whether the main map page couldn't be fetched because of an error
+        self.failed_map = False
+        self.counts = {"fetched": 0, "not_modified": 0, "written": 0, "unchanged": 0, "deleted": 0, "missing": 0,
+                       "failed": 0}
+
+    async def export(self):
+        """Crawl the site from the main map page, then delete anything left from last time that is no longer part of
+        it, and save the manifest. Returns the counts of what was done, or None if the main map page couldn't be
+        fetched. Anything that couldn't be fetched because of an error, rather than because it has gone, is counted as
+        failed and kept as it was."""
+
+        seen = {"/"}
+        to_export = ["/"]
+        while to_export:
+            found = await asyncio.gather(*[self.export_path(path) for path in to_export])
+            to_export = sorted(set().union(*found) - seen)
+            seen.update(to_export)
+        self.client.close()
+
+        # If the main map page couldn't be fetched, the rest of the site wasn't found, so don't delete it
+        if "/" not in self.exported or self.failed_map:
+            return None
+        for path in sorted(set(self.previous) - set(self.exported)):
+            self.delete(path)
+        write_file(os.path.join(self.output_dir, MANIFEST_FILE),
+                   json.dumps(self.exported, indent=2, sort_keys=True).encode("utf-8"), overwrite=True)
+        return self.counts
+
+    async def export_path(self, path):
+        """Export one page or file, if it has changed. Returns the set of paths that it refers to."""
+
+        file_path = get_file_path(self.output_dir, path)
+        if file_path is None:
+            return set()
+        previous = self.previous.get(path)
+        have_file = previous is not None and os.path.isfile(file_path)
+
+        if have_file and path.startswith(IMMUTABLE_PREFIX):
+            self.counts["unchanged"] += 1
+            self.exported[path] = previous
+            with open(file_path, "rb") as f:
+                return find_links(path, f.read())
+
+        headers = {"If-None-Match": previous["etag"]} if have_file and previous.get("etag") else {}
+        try:
+            response = await self.client.fetch(self.base_url + path, headers=headers, raise_error=False,
+                                               follow_redirects=False, decompress_response=True, request_timeout=60)
+            code = response.code
+        except Exception as e:
+            # E.g. a timeout, or the server not accepting connections
+            code = None
+            error = str(e)
+        if code == 304:
+            self.counts["not_modified"] += 1
+            self.exported[path] = previous
+            with open(file_path, "rb") as f:
+                return find_links(path, f.read())
+        if code in GONE_STATUS_CODES:
+            # Leave out anything that is no longer on the site, such as a marker icon that has since been deleted
+            self.counts["missing"] += 1
+            print("Skipping " + path + ": " + str(code), file=sys.stderr)
+            return set()
+        if code != 200:
+            # The server couldn't provide it right now, so keep what was exported last time, if anything
+            self.counts["failed"] += 1
+            print("Failed to fetch " + path + ": " + (str(code) if code is not None else error), file=sys.stderr)
+            if path == "/":
+                # Nothing will be updated without the main map page, so don't go on to fetch the rest of the site
+                self.failed_map = True
+                return set()
+            if not have_file:
+                return set()
+            self.exported[path] = previous
+            with open(file_path, "rb") as f:
+                return find_links(path, f.read())
+
+        self.counts["fetched"] += 1
+        content = response.body
+        content_hash = hashlib.sha256(content).hexdigest()
+        if have_file and previous.get("sha256") == content_hash:
+            self.counts["unchanged"] += 1
+        else:
+            write_file(file_path, content, overwrite=True)
+            if os.path.splitext(file_path)[1] in COMPRESSIBLE_EXTENSIONS:
+                write_file(file_path + ".gz", gzip.compress(content, mtime=0), overwrite=True)
+            self.counts["written"] += 1
+        self.exported[path] = {"etag": response.headers.get("ETag"), "sha256": content_hash}
+        return find_links(path, content)
+
+    def delete(self, path):
+        """Delete a file exported last time that is no longer part of the site, along with its gzipped copy, and the
+        directories it was in if they are now empty"""
+
+        file_path = get_file_path(self.output_dir, path)
+        if file_path is None:
+            return
+        for delete_path in [file_path, file_path + ".gz"]:
+            if os.path.isfile(delete_path):
+                os.remove(delete_path)
+        directory = os.path.dirname(file_path)
+        while directory != self.output_dir and os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+        self.counts["deleted"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the public side of a running Youth Map server as static files")
+    parser.add_argument("output_dir", help="directory to write the snapshot to, which is updated if it already exists")
+    parser.add_argument("--url", default=DEFAULT_URL, help="base URL of the server to export")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="most requests to make to the server at once")
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    exporter = SnapshotExporter(args.url.rstrip("/"), output_dir, args.concurrency)
+    counts = asyncio.run(exporter.export())
+    if counts is None:
+        print("Could not fetch the main map page from " + args.url + ", so the snapshot has not been updated.",
+              file=sys.stderr)
+        sys.exit(1)
+    print("Exported " + str(len(exporter.exported)) + " files to " + output_dir + ": " + str(counts["written"])
+          + " written, " + str(counts["unchanged"] + counts["not_modified"]) + " unchanged, " + str(counts["deleted"])
+          + " deleted, " + str(counts["missing"]) + " missing, " + str(counts["failed"]) + " failed.")
+    # Files that failed have been left as they were, but they may be out of date, so make sure cron reports it
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import argparse
+import json
+import logging
+import random
+import secrets
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, func
+
+from database import Database
+from database.base import temporary_station_bands, temporary_station_modes, event_bands, event_modes
+from database.coherence import CacheCoherence
+from database.models import User, UserSession, Event, TemporaryStation, PermanentStation, Band, Mode, \
+    PermanentStationType
+from database.utils import hash_password
+
+# Synthetic dataset generator. Fills the database named in the config file (which can be a temporary one, given by the
+# YOUTHMAP_CONFIG environment variable) with made-up events, stations, users and sessions, for testing how the site
+# performs with a realistic amount of data. Rows are added with bulk inserts rather than one at a time through the
+# normal DatabaseOperations methods, so that hundreds of thousands of them can be created in seconds. Run from the
+# repository root, e.g.:
+#     YOUTHMAP_CONFIG=/tmp/test/config.yml python -m tools.generate_dataset --stations 100000 --seed 1
+
+# Towns and cities that stations cluster around, with latitude, longitude and a relative weight for roughly how many
+# stations should be near each one
+POPULATION_CENTRES = [
+    ("London", 51.507, -0.128, 90), ("Birmingham", 52.486, -1.890, 25), ("Manchester", 53.481, -2.243, 25),
+    ("Leeds", 53.801, -1.549, 18), ("Glasgow", 55.864, -4.252, 16), ("Liverpool", 53.408, -2.992, 14),
+    ("Newcastle", 54.978, -1.617, 12), ("Sheffield", 53.381, -1.470, 12), ("Bristol", 51.455, -2.588, 12),
+    ("Edinburgh", 55.953, -3.188, 11), ("Cardiff", 51.481, -3.179, 9), ("Belfast", 54.597, -5.930, 9),
+    ("Nottingham", 52.954, -1.158, 8), ("Leicester", 52.637, -1.140, 8), ("Southampton", 50.910, -1.404, 7),
+    ("Plymouth", 50.376, -4.143, 5), ("Norwich", 52.630, 1.297, 5), ("Aberdeen", 57.150, -2.094, 5),
+    ("Exeter", 50.726, -3.527, 4), ("Inverness", 57.478, -4.224, 2), ("Aberystwyth", 52.415, -4.083, 1),
+]
+CENTRE_WEIGHTS = [centre[3] for centre in POPULATION_CENTRES]
+# How far stations are spread around each centre, as the standard deviation in degrees of latitude and longitude
+CLUSTER_SPREAD_DEGREES = 0.15
+# Proportion of stations that are placed anywhere in the country rather than near a population centre
+RURAL_PROPORTION = 0.1
+# Bounds for stations not near a population centre: (min latitude, max latitude, min longitude, max longitude)
+COUNTRY_BOUNDS = (50.0, 58.6, -6.0, 1.7)
+
+# Defaults for the command line options
+DEFAULT_STATIONS = 10000
+DEFAULT_PERMANENT_PROPORTION = 0.2
+DEFAULT_UNAPPROVED_PROPORTION = 0.1
+DEFAULT_EVENTS = 40
+DEFAULT_USERS = 20
+DEFAULT_SESSIONS = 200
+# Proportion of events (and so of the stations in them) that are over and done with
+PAST_EVENT_PROPORTION = 0.5
+# Proportion of temporary stations that aren't part of any event
+NO_EVENT_PROPORTION = 0.1
+# Proportion of sessions that have already expired
+EXPIRED_SESSION_PROPORTION = 0.7
+# Password for every generated user
+USER_PASSWORD = "password"
+
+# Rows per INSERT statement. Larger batches are faster, but use more memory.
+BATCH_SIZE = 5000
+
+EVENT_NAMES = ["JOTA", "Field Day", "Schools Week", "Lighthouse Weekend", "Museums on the Air", "Youngsters on the Air",
+               "Club Open Day", "Summer Camp", "Contest Weekend", "Heritage Day"]
+CLUB_WORDS = ["Scout Group", "ARC", "Radio Society", "School Radio Club", "Cadets", "University ARS", "Guides",
+              "Youth Club"]
+NOTES = [None, "", "Come and visit us!", "Operating from the club hut all weekend.",
+         "Listen out for us on the usual frequencies. Young operators welcome to get on the air."]
+PASSWORD_ALPHABET = string.ascii_letters + string.digits
+
+
+class DatasetGenerator:
+    """Generates synthetic rows and bulk inserts them into the database. All randomness comes from a seeded random number
+    generator, so the same options always produce the same data (apart from times, which are relative to now)."""
+
+    def __init__(self, db, seed):
+        self.db = db
+        self.rng = random.Random(seed)
+        self.now = datetime.now().replace(second=0, microsecond=0)
+
+    def random_coordinates(self):
+        """Pick a random location, usually near a population centre, as integer microdegrees"""
+
+        if self.rng.random() < RURAL_PROPORTION:
+            latitude = self.rng.uniform(COUNTRY_BOUNDS[0], COUNTRY_BOUNDS[1])
+            longitude = self.rng.uniform(COUNTRY_BOUNDS[2], COUNTRY_BOUNDS[3])
+        else:
+            name, latitude, longitude, weight = self.rng.choices(POPULATION_CENTRES, CENTRE_WEIGHTS)[0]
+            latitude = self.rng.gauss(latitude, CLUSTER_SPREAD_DEGREES)
+            longitude = self.rng.gauss(longitude, CLUSTER_SPREAD_DEGREES)
+        return round(latitude * 1000000), round(longitude * 1000000)
+
+    def random_callsign(self):
+        prefix = self.rng.choice(["G", "M", "2E", "GB", "GM", "GW", "GI", "MM", "MW", "2M"])
+        return prefix + str(self.rng.randint(0, 9)) + "".join(self.rng.choices(string.ascii_uppercase,
+                                                                               k=self.rng.randint(2, 3)))
+
+    def random_club_name(self):
+        return self.rng.choice(POPULATION_CENTRES)[0] + " " + str(self.rng.randint(1, 60)) + " " \
+            + self.rng.choice(CLUB_WORDS)
+
+    def random_edit_password(self):
+        # Like database.utils.generate_password(), but repeatable and much faster, as it doesn't need to be secure
+        return "".join(self.rng.choices(PASSWORD_ALPHABET, k=10))
+
+    def random_contact_details(self, callsign):
+        """Optional contact fields, filled in for some stations but not others"""
+
+        return {
+            "notes": self.rng.choice(NOTES),
+            "website_url": "https://example.com/" + callsign.lower() if self.rng.random() < 0.5 else None,
+            "email": callsign.lower() + "@example.com" if self.rng.random() < 0.4 else None,
+            "phone_number": "",
+            "qrz_url": "https://www.qrz.com/db/" + callsign if self.rng.random() < 0.3 else None,
+            "social_media_url": None,
+        }
+
+    def insert_rows(self, session, table, rows):
+        """Insert rows (a list of dicts) into a table in batches"""
+
+        for i in range(0, len(rows), BATCH_SIZE):
+            session.execute(insert(table), rows[i:i + BATCH_SIZE])
+
+    @staticmethod
+    def next_id(session, model):
+        """Get the ID that the next row added to a model's table would have. IDs are assigned here rather than by the
+        database, so that rows in association tables can be generated along with the rows they refer to."""
+
+        return (session.query(func.max(model.id)).scalar() or 0) + 1
+
+    def generate(self, stations, permanent_proportion, unapproved_proportion, events, users, sessions):
+        """Generate the whole dataset in one transaction, and return the number of rows added to each table"""
+
+        counts = {}
+        session = self.db.SessionLocal()
+        try:
+            band_ids = [band.id for band in session.query(Band).all()]
+            mode_ids = [mode.id for mode in session.query(Mode).all()]
+            type_ids = [station_type.id for station_type in session.query(PermanentStationType).all()]
+            icons = ["YOTA.png", "scouts.png", "radio.png", "school.png", "uni.png", "cadets.png"]
+
+            # Events, roughly half of them in the past and the rest happening now or in the coming months
+            event_rows = []
+            event_band_rows = []
+            event_mode_rows = []
+            first_event_id = self.next_id(session, Event)
+            for event_id in range(first_event_id, first_event_id + events):
+                if self.rng.random() < PAST_EVENT_PROPORTION:
+                    start_time = self.now - timedelta(days=self.rng.randint(7, 730))
+                else:
+                    start_time = self.now + timedelta(days=self.rng.randint(-2, 120))
+                end_time = start_time + timedelta(days=self.rng.randint(1, 9))
+                event_rows.append({
+                    "id": event_id, "name": self.rng.choice(EVENT_NAMES) + " " + str(event_id),
+                    "start_time": start_time, "end_time": end_time, "icon": self.rng.choice(icons),
+                    "color": "#%06x" % self.rng.randint(0, 0xffffff), "notes_template": self.rng.choice(NOTES[1:]),
+                    "url_slug": "event-" + str(event_id), "public": self.rng.random() < 0.9,
+                    "rsgb_event": self.rng.random() < 0.2, "updated_at": self.now})
+                for band_id in self.rng.sample(band_ids, self.rng.randint(0, 6)):
+                    event_band_rows.append({"event_id": event_id, "band_id": band_id})
+                for mode_id in self.rng.sample(mode_ids, self.rng.randint(0, len(mode_ids))):
+                    event_mode_rows.append({"event_id": event_id, "mode_id": mode_id})
+            self.insert_rows(session, Event.__table__, event_rows)
+            self.insert_rows(session, event_bands, event_band_rows)
+            self.insert_rows(session, event_modes, event_mode_rows)
+            counts["events"] = len(event_rows)
+
+            # Temporary stations, mostly as part of an event and during its window
+            permanent_count = round(stations * permanent_proportion)
+            temporary_count = stations - permanent_count
+            station_rows = []
+            station_band_rows = []
+            station_mode_rows = []
+            first_station_id = self.next_id(session, TemporaryStation)
+            for station_id in range(first_station_id, first_station_id + temporary_count):
+                event = None
+                if event_rows and self.rng.random() >= NO_EVENT_PROPORTION:
+                    event = self.rng.choice(event_rows)
+                if event:
+                    start_time = event["start_time"] + timedelta(hours=self.rng.randint(0, 12))
+                    end_time = min(event["end_time"], start_time + timedelta(hours=self.rng.randint(2, 72)))
+                else:
+                    start_time = self.now + timedelta(hours=self.rng.randint(-24 * 60, 24 * 60))
+                    end_time = start_time + timedelta(hours=self.rng.randint(2, 72))
+                latitude, longitude = self.random_coordinates()
+                callsign = self.random_callsign()
+                station_rows.append({
+                    "id": station_id, "callsign": callsign, "club_name": self.random_club_name(),
+                    "event_id": event["id"] if event else None, "start_time": start_time, "end_time": end_time,
+                    "latitude_microdegrees": latitude, "longitude_microdegrees": longitude,
+                    "rsgb_attending": self.rng.random() < 0.05,
+                    "approved": self.rng.random() >= unapproved_proportion,
+                    "edit_password": self.random_edit_password(), "updated_at": self.now,
+                    **self.random_contact_details(callsign)})
+                for band_id in self.rng.sample(band_ids, self.rng.randint(1, 5)):
+                    station_band_rows.append({"temporary_station_id": station_id, "band_id": band_id})
+                for mode_id in self.rng.sample(mode_ids, self.rng.randint(1, len(mode_ids))):
+                    station_mode_rows.append({"temporary_station_id": station_id, "mode_id": mode_id})
+            self.insert_rows(session, TemporaryStation.__table__, station_rows)
+            self.insert_rows(session, temporary_station_bands, station_band_rows)
+            self.insert_rows(session, temporary_station_modes, station_mode_rows)
+            counts["temporary_stations"] = len(station_rows)
+            counts["temporary_station_bands"] = len(station_band_rows)
+            counts["temporary_station_modes"] = len(station_mode_rows)
+
+            # Permanent stations
+            station_rows = []
+            first_station_id = self.next_id(session, PermanentStation)
+            for station_id in range(first_station_id, first_station_id + permanent_count):
+                latitude, longitude = self.random_coordinates()
+                callsign = self.random_callsign()
+                station_rows.append({
+                    "id": station_id, "callsign": callsign, "club_name": self.random_club_name(),
+                    "type_id": self.rng.choice(type_ids) if type_ids else None,
+                    "meeting_when": self.rng.choice(["Tuesdays 7pm", "Every other Friday", "Term time, weekly", ""]),
+                    "meeting_where": self.rng.choice(["Club hut", "School hall", "Village hall", ""]),
+                    "latitude_microdegrees": latitude, "longitude_microdegrees": longitude,
+                    "approved": self.rng.random() >= unapproved_proportion,
+                    "edit_password": self.random_edit_password(), "updated_at": self.now,
+                    **self.random_contact_details(callsign)})
+            self.insert_rows(session, PermanentStation.__table__, station_rows)
+            counts["permanent_stations"] = len(station_rows)
+
+            # Users, all with the same password so that it only has to be hashed once, and sessions for them, most of
+            # which have expired and are waiting to be cleaned up by housekeeping
+            salt = secrets.token_hex(32)
+            password_hash = hash_password(USER_PASSWORD, salt)
+            user_rows = []
+            first_user_id = self.next_id(session, User)
+            for user_id in range(first_user_id, first_user_id + users):
+                user_rows.append({"id": user_id, "username": "user" + str(user_id),
+                                  "email": "user" + str(user_id) + "@example.com", "password_hash": password_hash,
+                                  "salt": salt, "super_admin": self.rng.random() < 0.1})
+            self.insert_rows(session, User.__table__, user_rows)
+            counts["users"] = len(user_rows)
+
+            session_rows = []
+            for _ in range(sessions if user_rows else 0):
+                created_at = self.now - timedelta(minutes=self.rng.randint(0, 60 * 24 * 90))
+                if self.rng.random() < EXPIRED_SESSION_PROPORTION:
+                    expires_at = self.now - timedelta(minutes=self.rng.randint(1, 60 * 24 * 60))
+                else:
+                    expires_at = self.now + timedelta(minutes=self.rng.randint(1, 60 * 24 * 30))
+                session_rows.append({"session_token": secrets.token_hex(32),
+                                     "user_id": self.rng.choice(user_rows)["id"],
+                                     "created_at": min(created_at, expires_at), "expires_at": expires_at})
+            self.insert_rows(session, UserSession.__table__, session_rows)
+            counts["sessions"] = len(session_rows)
+
+            # Bulk inserts skip the session events that keep other processes' caches in step, so do that directly
+            CacheCoherence.bump(session, [Event.__tablename__, TemporaryStation.__tablename__,
+                                          PermanentStation.__tablename__, User.__tablename__,
+                                          UserSession.__tablename__])
+            session.commit()
+        finally:
+            session.close()
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the Youth Map database with synthetic data for testing")
+    parser.add_argument("--stations", type=int, default=DEFAULT_STATIONS,
+                        help="number of stations, temporary and permanent, to add")
+    parser.add_argument("--permanent-proportion", type=float, default=DEFAULT_PERMANENT_PROPORTION,
+                        help="proportion of the stations that are permanent")
+    parser.add_argument("--unapproved-proportion", type=float, default=DEFAULT_UNAPPROVED_PROPORTION,
+                        help="proportion of the stations that are awaiting approval")
+    parser.add_argument("--events", type=int, default=DEFAULT_EVENTS, help="number of events to add")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS,
+                        help="number of users to add, all with the password \"" + USER_PASSWORD + "\"")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS,
+                        help="number of login sessions to add, most of them expired")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--json", action="store_true", help="print the numbers of rows added as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    start = time.perf_counter()
+    db = Database()
+    counts = DatasetGenerator(db, args.seed).generate(args.stations, args.permanent_proportion,
+                                                      args.unapproved_proportion, args.events, args.users,
+                                                      args.sessions)
+    db.engine.dispose()
+
+    if args.json:
+        print(json.dumps(counts))
+    else:
+        for table, count in counts.items():
+            print(table + ": " + str(count))
+        print("Done in " + str(round(time.perf_counter() - start, 1)) + " seconds.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
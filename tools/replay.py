@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+
+# Request replay. Reads a request log recorded by the server (see core/requestlog.py and the request-log config option)
+# and sends the same requests to a test server, at the same relative times as they were originally made, optionally sped
+# up. Each request is sent at its scheduled time whether or not earlier ones have finished, so requests that overlapped
+# originally overlap in the replay too, and bursts of traffic stay bursts. The latency and status code of each replayed
+# request are compared with the original, and a summary of the differences is printed. Run from the repository root,
+# e.g.:
+#     python -m tools.replay data/requests.log --url http://localhost:8080 --speed 10
+#
+# The server to replay against needs some config of its own:
+#  * The recorded latency is the time the server took to handle the request, not including the network, so the replayed
+#    latency is the same measure, taken from the "total" in the Server-Timing header. Set "server-timing: all" so that
+#    every page has one. Responses without it, such as static files, are left out of the latency comparison.
+#  * The log doesn't record who made each request, so all the replayed requests come from this machine, and would soon
+#    use up the rate limits of one visitor. Turn the rate limits off by setting per-minute to 0 for each rule in
+#    rate-limits. (Requests that were rate limited originally will then show up as status code differences.)
+#  * Cookies aren't recorded, so requests made by someone logged in, such as anything under /admin, are replayed as a
+#    visitor who isn't. They get a redirect to the login page instead, so they always show up as status code differences,
+#    and their latency isn't comparable with the original.
+
+DEFAULT_URL = "http://localhost:8080"
+# Most requests that can be in progress at once. This only needs to be high enough not to hold back the replay.
+MAX_CLIENTS = 1000
+# A group of requests is reported as slower if its replayed 95th percentile latency is this many times the original
+DEFAULT_SLOWDOWN_THRESHOLD = 1.5
+# Number of individual status code differences to list
+MAX_STATUS_DIFFERENCES_SHOWN = 20
+# The total time the server took to handle a request, in milliseconds, from its Server-Timing header
+SERVER_TIMING_TOTAL_PATTERN = re.compile(r"(?:^|,)\s*total;dur=([0-9.]+)")
+
+
+def load_requests(path):
+    """Load the recorded requests from a request log file, sorted by start time"""
+
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                requests.append({"start": entry[0], "method": entry[1], "uri": entry[2], "status": entry[3],
+                                 "duration_ms": entry[4], "size": entry[5],
+                                 "body": entry[6] if len(entry) > 6 else None})
+    requests.sort(key=lambda r: r["start"])
+    return requests
+
+
+def get_route(uri):
+    """Group similar requests together for reporting, by removing the query string and replacing numbers in the path,
+    e.g. /view/station/temp/123?edit_password= becomes /view/station/temp/N"""
+
+    return re.sub(r"/\d+(?=/|$)", "/N", uri.split("?")[0])
+
+
+def percentile(sorted_values, p):
+    """Get the pth percentile of a sorted list, using the nearest-rank method"""
+
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))]
+
+
+def get_server_duration_ms(response):
+    """Get the time the server took to handle a request, from the response's Server-Timing header. Returns None if it
+    didn't say."""
+
+    match = SERVER_TIMING_TOTAL_PATTERN.search(response.headers.get("Server-Timing", ""))
+    return float(match.group(1)) if match else None
+
+
+def peak_concurrency(intervals):
+    """Get the largest number of (start, end) intervals that overlap at any moment"""
+
+    events = sorted([(start, 1) for start, end in intervals] + [(end, -1) for start, end in intervals])
+    current = peak = 0
+    for _, change in events:
+        current += change
+        peak = max(peak, current)
+    return peak
+
+
+async def replay(requests, base_url, speed):
+    """Send each request at its original time relative to the first, divided by the speed. Returns the requests with
+    their replayed status, start time, and latency added, both as seen by the server (None if the response didn't
+    include it) and as seen by this client."""
+
+    client = AsyncHTTPClient(force_instance=True, max_clients=MAX_CLIENTS)
+    first_start = requests[0]["start"]
+    replay_start = time.monotonic()
+
+    async def send(request):
+        delay = replay_start + (request["start"] - first_start) / speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        request["lag_ms"] = max(0.0, -delay * 1000)
+        request["replay_start"] = time.monotonic() - replay_start
+        # Requests such as uploads were recorded without their bodies, so they are sent with an empty one
+        body = (request["body"] or "") if request["method"] in ("POST", "PUT", "PATCH") else None
+        start = time.perf_counter()
+        response = await client.fetch(base_url + request["uri"], method=request["method"], body=body,
+                                      allow_nonstandard_methods=True, raise_error=False, follow_redirects=False,
+                                      request_timeout=120)
+        request["replay_client_ms"] = (time.perf_counter() - start) * 1000
+        request["replay_duration_ms"] = get_server_duration_ms(response)
+        request["replay_status"] = response.code
+
+    await asyncio.gather(*[send(request) for request in requests])
+    client.close()
+    return requests
+
+
+def summarise(requests, speed, slowdown_threshold):
+    """Compare the replayed requests with the originals, and return a summary"""
+
+    routes = {}
+    for request in requests:
+        routes.setdefault((request["method"], get_route(request["uri"])), []).append(request)
+
+    route_summaries = []
+    for (method, route), route_requests in sorted(routes.items()):
+        # Latency is only compared for the requests where the replay server said how long it took, so that both sides
+        # are the server's own handling time
+        timed_requests = [r for r in route_requests if r["replay_duration_ms"] is not None]
+        summary = {
+            "method": method, "route": route, "requests": len(route_requests), "timed_requests": len(timed_requests),
+            "original_p50_ms": None, "replay_p50_ms": None, "original_p95_ms": None, "replay_p95_ms": None,
+            "status_differences": sum(1 for r in route_requests if r["status"] != r["replay_status"]), "slower": False
+        }
+        if timed_requests:
+            original = sorted(r["duration_ms"] for r in timed_requests)
+            replayed = sorted(r["replay_duration_ms"] for r in timed_requests)
+            summary.update({
+                "original_p50_ms": round(percentile(original, 50), 1),
+                "replay_p50_ms": round(percentile(replayed, 50), 1),
+                "original_p95_ms": round(percentile(original, 95), 1),
+                "replay_p95_ms": round(percentile(replayed, 95), 1)
+            })
+            summary["slower"] = summary["replay_p95_ms"] > summary["original_p95_ms"] * slowdown_threshold
+        route_summaries.append(summary)
+
+    return {
+        "requests": len(requests),
+        "speed": speed,
+        "original_seconds": round(requests[-1]["start"] - requests[0]["start"], 1),
+        # Peak concurrency is worked out for the original and replayed timelines alike, so they show whether the replay
+        # kept the shape of the original traffic (allowing for the speed-up making requests overlap more)
+        "original_peak_concurrency": peak_concurrency(
+            [(r["start"], r["start"] + r["duration_ms"] / 1000) for r in requests]),
+        "replay_peak_concurrency": peak_concurrency(
+            [(r["replay_start"], r["replay_start"] + r["replay_client_ms"] / 1000) for r in requests]),
+        # How late the replay was in sending requests, if it couldn't keep up with the schedule
+        "max_send_lag_ms": round(max(r["lag_ms"] for r in requests), 1),
+        "status_differences": sum(1 for r in requests if r["status"] != r["replay_status"]),
+        # Requests whose latency couldn't be compared (if that's all of them, the replay server isn't set up to send
+        # Server-Timing), and requests the replay server rate limited, which means it isn't set up for replaying either
+        # (see the top of this file)
+        "untimed_requests": sum(1 for r in requests if r["replay_duration_ms"] is None),
+        "rate_limited_requests": sum(1 for r in requests if r["replay_status"] == 429 and r["status"] != 429),
+        "routes": route_summaries,
+        "status_difference_examples": [
+            {"method": r["method"], "uri": r["uri"], "original": r["status"], "replay": r["replay_status"]}
+            for r in requests if r["status"] != r["replay_status"]][:MAX_STATUS_DIFFERENCES_SHOWN]
+    }
+
+
+def print_report(summary):
+    print("Replayed " + str(summary["requests"]) + " requests from " + str(summary["original_seconds"])
+          + " seconds of traffic at " + str(summary["speed"]) + "x speed.")
+    print("Peak concurrency: " + str(summary["original_peak_concurrency"]) + " originally, "
+          + str(summary["replay_peak_concurrency"]) + " in replay. Sending was up to "
+          + str(summary["max_send_lag_ms"]) + " ms behind schedule.")
+    print()
+    print("{:<7} {:<40} {:>8} {:>18} {:>18} {:>8}".format("Method", "Route", "Requests", "p50 ms (orig/new)",
+                                                          "p95 ms (orig/new)", "Status"))
+    for route in summary["routes"]:
+        print("{:<7} {:<40} {:>8} {:>18} {:>18} {:>8}{}".format(
+            route["method"], route["route"][:40], route["requests"],
+            str(route["original_p50_ms"]) + "/" + str(route["replay_p50_ms"]) if route["timed_requests"] else "-",
+            str(route["original_p95_ms"]) + "/" + str(route["replay_p95_ms"]) if route["timed_requests"] else "-",
+            route["status_differences"], "  SLOWER" if route["slower"] else ""))
+    if summary["status_difference_examples"]:
+        print()
+        print(str(summary["status_differences"]) + " requests got a different status code:")
+        for example in summary["status_difference_examples"]:
+            print("  " + example["method"] + " " + example["uri"] + ": " + str(example["original"]) + " -> "
+                  + str(example["replay"]))
+    if summary["untimed_requests"] == summary["requests"]:
+        print()
+        print("None of the replayed responses had a Server-Timing header, so latency wasn't compared. Set "
+              "\"server-timing: all\" in the config of the server being replayed against.")
+    if summary["rate_limited_requests"]:
+        print()
+        print(str(summary["rate_limited_requests"]) + " requests were rate limited by the server being replayed "
+              "against, but not originally. Turn off its rate limits by setting per-minute to 0 for each rule in "
+              "rate-limits.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded Youth Map request log against a test server")
+    parser.add_argument("log", help="request log file, as recorded by the server's request-log option")
+    parser.add_argument("--url", default=DEFAULT_URL, help="base URL of the server to replay against")
+    parser.add_argument("--speed", type=float, default=1, help="how many times faster than the original to replay, "
+                                                                "e.g. 1, 10 or 100")
+    parser.add_argument("--slowdown-threshold", type=float, default=DEFAULT_SLOWDOWN_THRESHOLD,
+                        help="flag routes whose replayed p95 latency is more than this many times the original")
+    parser.add_argument("--output", help="file to write the summary to as JSON")
+    args = parser.parse_args()
+
+    requests = load_requests(args.log)
+    if not requests:
+        print("No requests in " + args.log, file=sys.stderr)
+        sys.exit(1)
+    asyncio.run(replay(requests, args.url.rstrip("/"), args.speed))
+    summary = summarise(requests, args.speed, args.slowdown_threshold)
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
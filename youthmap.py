@@ -1,46 +1,139 @@
+import hashlib
 import logging
 import os
 import secrets
+import signal
 import sys
+import time
+from contextlib import contextmanager
 
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
+import tornado.template
 import tornado.web
 from tornado.web import StaticFileHandler
 
-from core.config import HTTP_PORT
-from database import Database
+from core.assets import build_assets, asset_url
+from core.backup import DatabaseBackups
+from core.config import HTTP_PORT, WORKERS, MODE, ASSET_DIR, UPLOAD_DIR, REQUEST_LOG, BACKUP_DIR, BACKUP_KEEP, \
+    BACKUP_INTERVAL_HOURS, RATE_LIMITS, TRUSTED_PROXIES, METRICS_DIR
+from core.housekeeping import Housekeeping
+from core.metrics import Metrics
+from core.pagecache import PageCache
+from core.ratelimit import RateLimiter
+from core.requestlog import RequestRecorder, ResponseSizeTransform
+from core.sprites import IconSprite
+from core.writequeue import StationWriteQueue
+from database import Database, DATABASE_FILE
+from database.utils import shutdown_password_hashing
 from requesthandlers.admin import AdminHandler
+from requesthandlers.adminbackups import AdminBackupsHandler
 from requesthandlers.adminevent import AdminEventHandler
 from requesthandlers.adminevents import AdminEventsHandler
+from requesthandlers.adminmoderation import AdminModerationHandler
 from requesthandlers.adminstationperm import AdminStationPermHandler
 from requesthandlers.adminstations import AdminStationsHandler
 from requesthandlers.adminstationtemp import AdminStationTempHandler
+from requesthandlers.adminuploads import AdminUploadsHandler
 from requesthandlers.adminuser import AdminUserHandler
 from requesthandlers.adminusers import AdminUsersHandler
+from requesthandlers.asset import AssetHandler
 from requesthandlers.createstation import CreateStationHandler
 from requesthandlers.createstationtype import CreateStationTypeHandler
 from requesthandlers.editstation import EditStationHandler
 from requesthandlers.login import LoginHandler
 from requesthandlers.logout import LogoutHandler
 from requesthandlers.map import MapHandler
+from requesthandlers.metrics import MetricsHandler
 from requesthandlers.viewstation import ViewStationHandler
 
 
+# Directory containing the HTML templates
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "templates")
+# Directory containing the static files
+STATIC_PATH = os.path.join(os.path.dirname(__file__), "static")
+
+
+def get_site_version(template_path, asset_manifest):
+    """Get a hash of all the templates and built static assets, which changes whenever any of them do. This is used as
+    part of the version of cached pages, so that pages cached by browsers aren't used after the site has been updated."""
+
+    site_hash = hashlib.sha1(repr(sorted(asset_manifest.items())).encode("utf-8"))
+    for template_name in sorted(f for f in os.listdir(template_path) if f.endswith(".html")):
+        with open(os.path.join(template_path, template_name), "rb") as f:
+            site_hash.update(f.read())
+    return site_hash.hexdigest()
+
+
+def precompile_templates(template_path):
+    """Load and compile every template in the given directory, and return the template loader that holds them. Raises
+    an exception if any template fails to compile."""
+
+    loader = tornado.template.Loader(template_path)
+    template_names = sorted(f for f in os.listdir(template_path) if f.endswith(".html"))
+    for template_name in template_names:
+        loader.load(template_name)
+    logging.info("Compiled " + str(len(template_names)) + " templates.")
+    return loader
+
+
+@contextmanager
+def startup_phase(timings, name):
+    """Time a phase of starting up, adding how long it took in seconds to the timings dict under the given name"""
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start_time
+
+
 class YouthMap(tornado.web.Application):
     """Main application class"""
 
-    def __init__(self):
-        # Set up logging
-        root = logging.getLogger()
-        root.setLevel(logging.INFO)
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(logging.INFO)
-        formatter = logging.Formatter("%(message)s")
-        handler.setFormatter(formatter)
-        root.addHandler(handler)
+    def __init__(self, worker=None):
+        """The worker is this process's number, when running multiple processes."""
+
+        # How long each phase of starting up took, to be logged at the end
+        self.startup_timings = {}
 
         logging.info("Setting up database...")
-        self.db = Database()
+        with startup_phase(self.startup_timings, "database"):
+            self.db = Database()
+        self.backups = DatabaseBackups(DATABASE_FILE, BACKUP_DIR, BACKUP_KEEP)
+        self.housekeeping = Housekeeping(self.db, self.backups, BACKUP_INTERVAL_HOURS)
+        # Stations submitted by visitors are created in batches
+        self.station_writes = StationWriteQueue(self.db)
+        # Rendered public station pages
+        self.station_page_cache = PageCache()
+
+        # In production mode, build minified, fingerprinted copies of the static JS and CSS files, which templates will
+        # then link to via asset_url(). In development mode, the original files are used so that changes show up
+        # straight away.
+        self.asset_manifest = {}
+        if MODE != "development":
+            logging.info("Building static assets...")
+            with startup_phase(self.startup_timings, "assets"):
+                self.asset_manifest = build_assets(STATIC_PATH, ASSET_DIR)
+        self.site_version = get_site_version(TEMPLATE_PATH, self.asset_manifest)
+
+        # Pack all the marker icons into a single image for the main map
+        logging.info("Building icon sprite...")
+        with startup_phase(self.startup_timings, "sprite"):
+            self.icon_sprite = IconSprite(UPLOAD_DIR, ASSET_DIR)
+
+        # Limit how often each client can make expensive requests
+        self.rate_limiter = RateLimiter(RATE_LIMITS, TRUSTED_PROXIES)
+
+        # Collect metrics about what the server is doing
+        self.metrics = Metrics(self.db, {"sessions": self.db.session_cache, "station_pages": self.station_page_cache},
+                               self.rate_limiter, self.station_writes, worker,
+                               METRICS_DIR if worker is not None else None)
+
+        # Record requests for replaying later, if enabled
+        self.request_recorder = RequestRecorder(REQUEST_LOG) if REQUEST_LOG else None
 
         logging.info("Setting up web server...")
         handlers = [
@@ -59,25 +152,113 @@ class YouthMap(tornado.web.Application):
             (r"/admin/stations", AdminStationsHandler),
             (r"/admin/station/temp/([^/]+)", AdminStationTempHandler),
             (r"/admin/station/perm/([^/]+)", AdminStationPermHandler),
-            (r"/upload/(.*)", StaticFileHandler, {"path": os.path.join(os.path.dirname(__file__), "data/upload"), "cache_time": 120}),
-            (r"/(.*)", StaticFileHandler, {"path": os.path.join(os.path.dirname(__file__), "static")})
+            (r"/admin/moderation", AdminModerationHandler),
+            (r"/admin/uploads", AdminUploadsHandler),
+            (r"/admin/backups", AdminBackupsHandler),
+            (r"/metrics", MetricsHandler),
+            (r"/upload/(.*)", StaticFileHandler, {"path": UPLOAD_DIR}),
+            (r"/assets/(.*)", AssetHandler, {"path": ASSET_DIR}),
+            (r"/(.*)", StaticFileHandler, {"path": STATIC_PATH})
         ]
 
         settings = {
-            "template_path": "templates",
+            "template_path": TEMPLATE_PATH,
             "cookie_secret": os.environ.get("COOKIE_SECRET", secrets.token_hex(32)),
             "login_url": "/login",
-            "debug": True  # todo set false
+            "ui_methods": {"asset_url": asset_url}
         }
+        if MODE == "development":
+            settings["debug"] = True
+        else:
+            # Compile all the templates now, so we fail fast if any are broken, and keep them for the life of the server
+            with startup_phase(self.startup_timings, "templates"):
+                template_loader = precompile_templates(TEMPLATE_PATH)
+            settings.update({
+                "debug": False,
+                "autoreload": False,
+                "serve_traceback": False,
+                "compiled_template_cache": True,
+                "static_hash_cache": True,
+                "template_loader": template_loader
+            })
+
+        super(YouthMap, self).__init__(handlers, transforms=[ResponseSizeTransform], **settings)
+        logging.info("Started up in " + str(round(sum(self.startup_timings.values()) * 1000)) + " ms ("
+                     + ", ".join(name + " " + str(round(seconds * 1000)) + " ms"
+                                 for name, seconds in self.startup_timings.items()) + ").")
+
+    def log_request(self, handler):
+        """Called by Tornado when each request has finished. As well as logging the request, record it in the metrics,
+        and in the request log if enabled."""
+
+        self.metrics.on_request_finished(handler)
+        if self.request_recorder:
+            self.request_recorder.record(handler)
+        super().log_request(handler)
+
+
+# How long to allow requests that are already in progress to finish when shutting down, in seconds
+SHUTDOWN_GRACE_SECONDS = 5
+
+
+def setup_logging():
+    """Set up logging to stdout"""
 
-        super(YouthMap, self).__init__(handlers, **settings)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setLevel(logging.INFO)
+    formatter = logging.Formatter("%(message)s")
+    handler.setFormatter(formatter)
+    root.addHandler(handler)
 
 
 def main():
-    app = YouthMap()
-    app.listen(HTTP_PORT)
-    logging.info("Listening on port " + str(HTTP_PORT) + ".")
-    tornado.ioloop.IOLoop.current().start()
+    setup_logging()
+
+    # If we are running multiple processes, set up the database once here before starting them, so they don't all try
+    # to create or migrate it at the same time. Each process then creates its own connection to it after starting up.
+    if WORKERS != 1:
+        logging.info("Preparing database...")
+        Database().engine.dispose()
+
+    # Bind the port before starting any extra processes, so they can all share it
+    sockets = tornado.netutil.bind_sockets(HTTP_PORT)
+    task_id = None
+    if WORKERS != 1:
+        task_id = tornado.process.fork_processes(WORKERS)
+
+    app = YouthMap(task_id)
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    io_loop = tornado.ioloop.IOLoop.current()
+
+    app.metrics.start()
+
+    # Only one process runs housekeeping jobs
+    if task_id is None or task_id == 0:
+        app.housekeeping.start()
+
+    # Shut down gracefully on SIGTERM: stop accepting new connections, give any requests in progress a moment to finish,
+    # then stop.
+    def shutdown():
+        logging.info("Shutting down...")
+        server.stop()
+        app.housekeeping.stop()
+        app.metrics.stop()
+        app.station_writes.stop()
+        io_loop.call_later(SHUTDOWN_GRACE_SECONDS, io_loop.stop)
+
+    io_loop.asyncio_loop.add_signal_handler(signal.SIGTERM, shutdown)
+
+    logging.info("Listening on port " + str(HTTP_PORT) + (" (process " + str(task_id) + ")" if task_id is not None
+                                                           else "") + ".")
+    io_loop.start()
+    shutdown_password_hashing()
+    app.db.coherence.close()
+    app.db.engine.dispose()
+    if app.request_recorder:
+        app.request_recorder.close()
 
 
 if __name__ == "__main__":